@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Memory and recall@k of the compact storage modes.
+
+Holds out a sample of the indexed vectors as queries and compares int8 and
+binary quantization (with exact re-rank), optionally on vectors truncated
+to fewer dimensions, against exact float32 search over the full vectors.
+Reads the embeddings of the server's collection, or generates clustered
+synthetic vectors with --synthetic.
+
+    python -m benchmarks.compact --dimensions 512 256 --output compact.json
+"""
+
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+
+from compact_index import MODES, recall_at_k
+
+
+def synthetic_vectors(n, dimensions=1536, clusters=64, seed=0):
+    """Gaussian clusters, so neighbours are meaningful (unlike uniform noise)."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimensions))
+    return (centers[rng.integers(0, clusters, n)] + 0.8 * rng.standard_normal((n, dimensions))).astype(np.float32)
+
+
+def collection_vectors():
+    import server
+
+    collection = server.resources.corpus().collection()
+    return np.asarray(collection.get(include=["embeddings"])["embeddings"], dtype=np.float32)
+
+
+def evaluate(vectors, n_queries=100, k=10, candidates=100, dimensions=(), seed=0):
+    """One report row per (mode, dimensions), after the float32 baseline."""
+    order = np.random.default_rng(seed).permutation(len(vectors))
+    queries, vectors = vectors[order[:n_queries]], vectors[order[n_queries:]]
+    full = vectors.shape[1]
+    rows = [{
+        "mode": "float32",
+        "dimensions": full,
+        "recall": 1.0,
+        "resident_bytes": vectors.nbytes,
+        "bytes_per_vector": full * 4,
+    }]
+    for dims in [None, *dimensions]:
+        for mode in MODES:
+            result = recall_at_k(vectors, queries, k=k, mode=mode, candidates=candidates, dimensions=dims)
+            result["memory_ratio"] = result["resident_bytes"] / vectors.nbytes
+            rows.append(result)
+    return rows
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--synthetic", type=int, help="use this many synthetic vectors instead of the collection")
+    parser.add_argument("--queries", type=int, default=100, help="vectors held out as queries")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--candidates", type=int, default=100, help="candidates re-ranked exactly")
+    parser.add_argument("--dimensions", type=int, nargs="*", default=[], help="also evaluate truncated vectors")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="write the JSON report to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    vectors = synthetic_vectors(args.synthetic, seed=args.seed) if args.synthetic else collection_vectors()
+    if len(vectors) <= args.queries:
+        raise SystemExit(f"Need more than {args.queries} vectors, found {len(vectors)}")
+    report = {
+        "config": {"vectors": len(vectors), "queries": args.queries, "k": args.k, "candidates": args.candidates},
+        "results": evaluate(vectors, args.queries, args.k, args.candidates, args.dimensions, args.seed),
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Synthetic Sphinx corpus for the benchmarks.
+
+Pages follow the structure of the real Extensions Guide: a <title> with the
+guide suffix, an itemprop="articleBody" container and nested
+div.section blocks with headings, paragraphs, code samples and permalink
+markers, so parse_sphinx_html / parse_sphinx_sections do the same work as
+on the real documentation.
+"""
+
+import random
+
+WORDS = (
+    "extension plesk hook panel domain subscription customer reseller server "
+    "service plan mail database backup restore install upgrade settings form "
+    "button list toolbar navigation controller action view template route "
+    "permission api request response event handler task schedule log cache "
+    "license package module configure register callback interface class "
+    "method property value string integer array object file directory path"
+).split()
+
+IDENTIFIERS = [
+    "pm_Hook_Interface", "pm_Hook_CustomButtons", "pm_Hook_Navigation", "pm_Context",
+    "pm_Settings", "pm_Form_Simple", "pm_View_List_Simple", "pm_Controller_Action",
+    "pm_ApiCli", "pm_Scheduler", "pm_Domain", "pm_Client", "--enable-feature",
+    "--install-extension", "getModuleId", "registerHook",
+]
+
+PAGE = """<!DOCTYPE html>
+<html><head><title>{title} — Developing Extensions for Plesk</title>
+<script>var DOCUMENTATION_OPTIONS = {{}};</script></head>
+<body><nav class="sidebar">Table of contents</nav>
+<div itemprop="articleBody">
+{sections}
+</div>
+<footer>© Plesk</footer></body></html>
+"""
+
+
+def sentence(rng, words=12):
+    tokens = [rng.choice(IDENTIFIERS) if rng.random() < 0.05 else rng.choice(WORDS) for _ in range(words)]
+    return " ".join(tokens).capitalize() + "."
+
+
+def paragraph(rng):
+    return " ".join(sentence(rng, rng.randint(8, 20)) for _ in range(rng.randint(2, 6)))
+
+
+def section(rng, anchor, level, depth):
+    heading = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 4))).title()
+    body = [
+        f'<div class="section" id="{anchor}">',
+        f'<h{level}>{heading}<a class="headerlink" href="#{anchor}">¶</a></h{level}>',
+    ]
+    body.extend(f"<p>{paragraph(rng)}</p>" for _ in range(rng.randint(1, 4)))
+    if rng.random() < 0.3:
+        body.append(f'<div class="highlight"><pre>{rng.choice(IDENTIFIERS)}::{rng.choice(WORDS)}();</pre></div>')
+    if depth > 0:
+        for i in range(rng.randint(0, 3)):
+            body.append(section(rng, f"{anchor}-{i}", level + 1, depth - 1))
+    body.append("</div>")
+    return "\n".join(body)
+
+
+def render_page(rng, page_id):
+    title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 5))).title()
+    return PAGE.format(title=title, sections=section(rng, f"page-{page_id}", 1, depth=2))
+
+
+def generate_corpus(out_dir, pages, seed=0):
+    """
+    Writes `pages` synthetic .htm pages into `out_dir`, 1000 per subfolder
+    like a large Sphinx build. The same seed always produces the same corpus.
+    Returns the number of bytes written.
+    """
+    rng = random.Random(seed)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    written = 0
+    for page_id in range(pages):
+        folder = out_dir / f"part{page_id // 1000:03d}"
+        folder.mkdir(exist_ok=True)
+        html = render_page(rng, page_id)
+        (folder / f"page{page_id:06d}.htm").write_text(html, encoding="utf-8")
+        written += len(html.encode("utf-8"))
+    return written
+
+
+def sample_queries(count, seed=0):
+    """Search queries drawn from the corpus vocabulary, a few of them identifier lookups."""
+    rng = random.Random(seed + 1)
+    queries = []
+    for _ in range(count):
+        if rng.random() < 0.2:
+            queries.append(rng.choice(IDENTIFIERS))
+        else:
+            queries.append(f"how to {' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 5)))}")
+    return queries
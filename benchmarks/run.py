@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Indexing and search benchmark.
+
+Generates a synthetic Sphinx corpus, starts a local fake embedding server
+with a configurable latency, and drives the index run and
+search_extensions_guide in an isolated working directory. Prints (or
+writes) a JSON report with throughput, latency percentiles, peak RSS and
+the per-stage indexing breakdown. Pass --compare with an earlier report to
+see the relative change of every metric.
+
+    python -m benchmarks.run --pages 1000 --latency-ms 20 --output bench.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.corpus import generate_corpus, sample_queries
+from benchmarks.fake_embedding_server import FakeEmbeddingServer
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SUMMARY_RE = re.compile(
+    r"(?P<chunks>\d+) chunks.*\(parse (?P<parse>[\d.]+)s, embed (?P<embed>[\d.]+)s, write (?P<write>[\d.]+)s\)"
+)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process and of its finished children (parser pool)."""
+    if resource is None:
+        return None
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024  # bytes on macOS, KiB elsewhere
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 / scale / 1024,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024 / scale / 1024,
+    }
+
+
+def latency_summary(samples):
+    """Latency percentiles in milliseconds."""
+    values = np.asarray(samples) * 1000
+    return {
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "p99": float(np.percentile(values, 99)),
+        "mean": float(values.mean()),
+        "max": float(values.max()),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def configure_server(work_dir, base_url):
+    """Imports server.py with every path and the embedding endpoint pointed at the benchmark."""
+    os.environ["EMBEDDING_BACKEND"] = "openrouter"
+    os.environ["EMBEDDING_API_BASE"] = base_url
+    os.environ.setdefault("OPENROUTER_API_KEY", "benchmark")
+    os.environ.pop("DOCS_ZIP", None)
+    import server
+
+    storage = work_dir / "storage"
+    storage.mkdir(exist_ok=True)
+    server.EMBEDDING_API_BASE = base_url
+    server.DOCS_DIR = work_dir / "docs"
+    server.DOCS_ZIP = None
+    server.STORAGE_DIR = storage
+    server.DB_PATH = storage / "vector_db"
+    server.MANIFEST_PATH = storage / "index_manifest.json"
+    server.EMBEDDING_CACHE_PATH = storage / "embedding_cache.sqlite3"
+    server.LEXICAL_INDEX_PATH = storage / "lexical_index.json"
+    server.COMPACT_INDEX_PATH = storage / "compact_index"
+    server.INDEX_ALIAS_PATH = storage / "index_alias.json"
+    server.INDEX_CHECKPOINT_PATH = storage / "index_checkpoint.json"
+    server.INDEX_LOCK_PATH = storage / "index.lock"
+    server.PARSE_CACHE_PATH = storage / "parse_cache.pack"
+    # Measure every search end to end, not the result caches
+    server.query_cache = server.QueryResultCache(max_entries=0)
+    server.semantic_cache = server.SemanticQueryCache(max_entries=0)
+    server.resources.reset()
+    return server
+
+
+async def timed_index(server, **kwargs):
+    started = time.perf_counter()
+    summary = await server.run_index(**kwargs)
+    elapsed = time.perf_counter() - started
+    match = SUMMARY_RE.search(summary)
+    stages = {name: float(match[name]) for name in ("parse", "embed", "write")} if match else {}
+    return elapsed, int(match["chunks"]) if match else None, stages, summary
+
+
+async def run_searches(server, queries, concurrency, n_results):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(query):
+        async with semaphore:
+            started = time.perf_counter()
+            await server.search_extensions_guide(query, n_results=n_results)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(query) for query in queries))
+    return time.perf_counter() - started, latencies
+
+
+async def benchmark(args, work_dir):
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "pages": args.pages,
+            "queries": args.queries,
+            "latency_ms": args.latency_ms,
+            "search_concurrency": args.concurrency,
+            "n_results": args.n_results,
+            "seed": args.seed,
+        },
+    }
+
+    started = time.perf_counter()
+    corpus_bytes = generate_corpus(work_dir / "docs", args.pages, seed=args.seed)
+    report["corpus"] = {"bytes": corpus_bytes, "seconds": time.perf_counter() - started}
+
+    with FakeEmbeddingServer(latency_ms=args.latency_ms) as fake:
+        server = configure_server(work_dir, fake.base_url)
+
+        elapsed, chunks, stages, summary = await timed_index(server)
+        report["index"] = {
+            "seconds": elapsed,
+            "pages_per_second": args.pages / elapsed,
+            "chunks": chunks,
+            "chunks_per_second": chunks / elapsed if chunks else None,
+            "stages": stages,
+            "embedding_requests": fake.requests,
+            "summary": summary,
+        }
+
+        elapsed, _, _, summary = await timed_index(server)
+        report["reindex_unchanged"] = {"seconds": elapsed, "summary": summary}
+
+        # Every page again, parsed pages and embeddings coming from the caches
+        elapsed, _, stages, summary = await timed_index(server, force=True)
+        report["reindex_forced"] = {"seconds": elapsed, "stages": stages, "summary": summary}
+
+        queries = sample_queries(args.queries, seed=args.seed)
+        requests_before = fake.requests
+        elapsed, latencies = await run_searches(server, queries, args.concurrency, args.n_results)
+        report["search"] = {
+            "seconds": elapsed,
+            "queries_per_second": len(queries) / elapsed,
+            "latency_ms": latency_summary(latencies),
+            "embedding_requests": fake.requests - requests_before,
+        }
+
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def flatten(report, prefix=""):
+    """Numeric leaves of a report as {"search.latency_ms.p95": value}."""
+    values = {}
+    for key, value in report.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            values.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and not name.startswith("config."):
+            values[name] = value
+    return values
+
+
+def compare(baseline, report):
+    """Lines describing the relative change of every metric present in both reports."""
+    before = flatten(baseline)
+    after = flatten(report)
+    lines = []
+    for name in sorted(before.keys() & after.keys()):
+        if before[name]:
+            change = (after[name] - before[name]) / before[name] * 100
+            lines.append(f"{name}: {before[name]:.4g} -> {after[name]:.4g} ({change:+.1f}%)")
+    return lines
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pages", type=int, default=1000, help="synthetic pages to index (e.g. 1000, 10000, 100000)")
+    parser.add_argument("--queries", type=int, default=200, help="search queries to run")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="fake embedding request latency")
+    parser.add_argument("--concurrency", type=int, default=8, help="searches in flight at once")
+    parser.add_argument("--n-results", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", type=Path, help="keep the corpus and index here instead of a temp dir")
+    parser.add_argument("--output", type=Path, help="write the JSON report to this file")
+    parser.add_argument("--compare", type=Path, help="earlier JSON report to compare against")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    work_dir = args.work_dir or Path(tempfile.mkdtemp(prefix="plesk-docs-bench-"))
+    work_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        report = asyncio.run(benchmark(args, work_dir))
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+    if args.compare:
+        print("\n".join(compare(json.loads(args.compare.read_text(encoding="utf-8")), report)), file=sys.stderr)
+    return report
+
+
+if __name__ == "__main__":
+    main()
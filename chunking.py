@@ -0,0 +1,60 @@
+"""
+Token estimates and section chunking for the indexer.
+
+Pure text functions with no parser dependency, so the server can import
+them without loading BeautifulSoup.
+"""
+
+import os
+
+# Section chunks: target size and overlap between consecutive chunks of the
+# same section, in estimated tokens
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "400"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "50"))
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token for English prose)."""
+    return len(text) // 4 + 1
+
+def chunk_text(text, chunk_tokens=None, overlap_tokens=None):
+    """
+    Splits text on line boundaries into chunks of about `chunk_tokens`, each
+    starting with the last `overlap_tokens` worth of lines of the previous
+    chunk. Lines longer than a whole chunk are split by characters.
+    """
+    chunk_tokens = CHUNK_TOKENS if chunk_tokens is None else chunk_tokens
+    overlap_tokens = CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    max_chars = chunk_tokens * 4
+
+    lines = []
+    for line in text.split("\n"):
+        lines.extend(line[i:i + max_chars] for i in range(0, len(line), max_chars))
+
+    chunks = []
+    current = []
+    size = 0
+    for line in lines:
+        tokens = estimate_tokens(line)
+        if current and size + tokens > chunk_tokens:
+            chunks.append("\n".join(current))
+            # Carry the tail of this chunk over as context for the next one
+            overlap = []
+            overlap_size = 0
+            for previous in reversed(current):
+                overlap_size += estimate_tokens(previous)
+                if overlap_size > overlap_tokens:
+                    break
+                overlap.insert(0, previous)
+            current = overlap
+            size = sum(estimate_tokens(previous) for previous in current)
+        current.append(line)
+        size += tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+def chunk_sections(sections, chunk_tokens=None, overlap_tokens=None):
+    """Yields one dict per chunk: the section's heading and anchor plus "text"."""
+    for section in sections:
+        for text in chunk_text(section["text"], chunk_tokens, overlap_tokens):
+            yield {"heading": section["heading"], "anchor": section["anchor"], "text": text}
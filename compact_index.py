@@ -0,0 +1,264 @@
+"""
+Quantized vector index for the compact storage mode.
+
+Vectors are stored twice under one directory: int8 codes (one scale per
+vector) or sign bits packed eight to a byte, which are loaded into memory
+and scanned for every query, and the float32 vectors, which stay in a NumPy
+memmap on disk. A query ranks all codes, then re-ranks the best
+`candidates` exactly against their float rows, so only those rows are read
+from disk. Chunks are added and removed incrementally, mirroring the
+ChromaDB collection.
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+MODES = ("int8", "binary")
+
+# Rows converted to float32 at a time when scoring int8 codes
+SCAN_BLOCK = 16384
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def truncate(vectors, dimensions):
+    """
+    First `dimensions` components, renormalized. For text-embedding-3 models
+    this matches asking the API for `dimensions` directly.
+    """
+    return normalize(np.asarray(vectors, dtype=np.float32)[..., :dimensions])
+
+
+def quantize(vectors, mode):
+    """Returns (codes, scales) for unit vectors; scales is None in binary mode."""
+    if mode == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1.0
+        codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    if mode == "binary":
+        return np.packbits(vectors > 0, axis=1), None
+    raise ValueError(f"Unknown compact mode {mode!r}; expected 'int8' or 'binary'")
+
+
+def top_k(scores, k):
+    """Indices of the `k` highest scores, best first."""
+    if k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    best = np.argpartition(-scores, k - 1)[:k]
+    return best[np.argsort(-scores[best], kind="stable")]
+
+
+class CompactIndex:
+    """Quantized codes in memory, float32 vectors memory-mapped, ids and filenames alongside."""
+
+    def __init__(self, path, mode="int8", dimensions=None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown compact mode {mode!r}; expected 'int8' or 'binary'")
+        self.path = path
+        self.mode = mode
+        self.dimensions = dimensions
+        self._lock = threading.Lock()
+        self._ids = []
+        self._filenames = []
+        self._codes = None
+        self._scales = None
+        self._vectors = None  # np.memmap of the saved float32 rows
+        self._pending = {}    # id -> (filename, unit vector) added since the last save
+        self._removed = set()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._live_rows()) + len(self._pending)
+
+    def _live_rows(self):
+        return [row for row, doc_id in enumerate(self._ids) if doc_id not in self._removed]
+
+    def add(self, ids, embeddings, filenames):
+        vectors = normalize(embeddings)
+        if self.dimensions is None:
+            self.dimensions = vectors.shape[1]
+        elif vectors.shape[1] != self.dimensions:
+            raise ValueError(f"Expected {self.dimensions}-dimensional embeddings, got {vectors.shape[1]}")
+        with self._lock:
+            for doc_id, vector, filename in zip(ids, vectors, filenames):
+                # A re-added id replaces its saved row
+                self._removed.add(doc_id)
+                self._pending[doc_id] = (filename, vector)
+
+    def remove_filenames(self, filenames):
+        """Drops every chunk of the given pages, in one pass over the index."""
+        filenames = set(filenames)
+        with self._lock:
+            self._removed.update(doc_id for doc_id, name in zip(self._ids, self._filenames) if name in filenames)
+            for doc_id in [doc_id for doc_id, (name, _) in self._pending.items() if name in filenames]:
+                del self._pending[doc_id]
+
+    def clear(self):
+        with self._lock:
+            self._removed.update(self._ids)
+            self._pending.clear()
+
+    def search(self, query_embeddings, n_results, candidates=100):
+        """
+        Returns, per query, up to `n_results` (id, cosine similarity), best
+        first. Only saved vectors are searched.
+        """
+        with self._lock:
+            if not self._ids:
+                return [[] for _ in query_embeddings]
+            queries = normalize(query_embeddings)
+            if queries.shape[1] != self.dimensions:
+                raise ValueError(f"Expected {self.dimensions}-dimensional queries, got {queries.shape[1]}")
+            pool = min(max(candidates, n_results), len(self._ids))
+            approximate = self._approximate_scores(queries)
+
+            results = []
+            for query, scores in zip(queries, approximate):
+                rows = np.sort(top_k(scores, pool))  # sorted rows read the memmap sequentially
+                exact = np.asarray(self._vectors[rows]) @ query
+                best = top_k(exact, n_results)
+                results.append([(self._ids[rows[i]], float(exact[i])) for i in best])
+            return results
+
+    def _approximate_scores(self, queries):
+        if self.mode == "binary":
+            # Fewer differing sign bits means a smaller angle
+            bits = np.packbits(queries > 0, axis=1)
+            return np.stack([
+                -np.bitwise_count(self._codes ^ query_bits).sum(axis=1, dtype=np.int32).astype(np.float32)
+                for query_bits in bits
+            ])
+        scores = np.empty((len(queries), len(self._codes)), dtype=np.float32)
+        for start in range(0, len(self._codes), SCAN_BLOCK):
+            block = self._codes[start:start + SCAN_BLOCK].astype(np.float32)
+            scores[:, start:start + SCAN_BLOCK] = queries @ block.T * self._scales[start:start + SCAN_BLOCK]
+        return scores
+
+    def stats(self):
+        """Bytes held in memory for search, against a full-precision in-memory index."""
+        with self._lock:
+            count = len(self._ids)
+            code_bytes = self._codes.nbytes if self._codes is not None else 0
+            scale_bytes = self._scales.nbytes if self._scales is not None else 0
+            return {
+                "mode": self.mode,
+                "dimensions": self.dimensions,
+                "vectors": count,
+                "resident_bytes": code_bytes + scale_bytes,
+                "float32_bytes": count * (self.dimensions or 0) * 4,
+                "bytes_per_vector": (code_bytes + scale_bytes) / count if count else 0.0,
+            }
+
+    def save(self):
+        """
+        Writes the live saved rows plus the pending ones to a fresh directory,
+        streaming the float rows, and swaps it into place.
+        """
+        with self._lock:
+            rows = self._live_rows()
+            pending = list(self._pending.items())
+            ids = [self._ids[row] for row in rows] + [doc_id for doc_id, _ in pending]
+            filenames = [self._filenames[row] for row in rows] + [filename for _, (filename, _) in pending]
+            dimensions = self.dimensions or 0
+
+            tmp_path = self.path.with_name(self.path.name + ".tmp")
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            tmp_path.mkdir(parents=True)
+            vectors = np.lib.format.open_memmap(
+                tmp_path / "vectors.npy", mode="w+", dtype=np.float32, shape=(len(ids), dimensions)
+            )
+            for start in range(0, len(rows), SCAN_BLOCK):
+                # The target also holds the pending rows, so bound the slice by the source block
+                block = rows[start:start + SCAN_BLOCK]
+                vectors[start:start + len(block)] = self._vectors[block]
+            if pending:
+                vectors[len(rows):] = np.stack([vector for _, (_, vector) in pending])
+            vectors.flush()
+
+            blocks = [quantize(vectors[start:start + SCAN_BLOCK], self.mode) for start in range(0, len(ids), SCAN_BLOCK)]
+            if blocks:
+                codes = np.concatenate([block for block, _ in blocks])
+            elif self.mode == "int8":
+                codes = np.empty((0, dimensions), np.int8)
+            else:
+                codes = np.empty((0, (dimensions + 7) // 8), np.uint8)
+            np.save(tmp_path / "codes.npy", codes)
+            if self.mode == "int8":
+                np.save(tmp_path / "scales.npy", np.concatenate([scales for _, scales in blocks]) if blocks else np.empty(0, np.float32))
+            (tmp_path / "index.json").write_text(json.dumps({
+                "mode": self.mode, "dimensions": dimensions, "ids": ids, "filenames": filenames,
+            }), encoding="utf-8")
+            del vectors
+
+            old_path = self.path.with_name(self.path.name + ".old")
+            shutil.rmtree(old_path, ignore_errors=True)
+            if self.path.exists():
+                os.replace(self.path, old_path)
+            os.replace(tmp_path, self.path)
+            shutil.rmtree(old_path, ignore_errors=True)
+            self._open()
+
+    def _open(self):
+        meta = json.loads((self.path / "index.json").read_text(encoding="utf-8"))
+        self._ids = meta["ids"]
+        self._filenames = meta["filenames"]
+        self.dimensions = meta["dimensions"] or self.dimensions
+        self._codes = np.load(self.path / "codes.npy")
+        self._scales = np.load(self.path / "scales.npy") if self.mode == "int8" else None
+        self._vectors = np.load(self.path / "vectors.npy", mmap_mode="r") if self._ids else np.empty((0, 0), np.float32)
+        self._pending.clear()
+        self._removed.clear()
+
+    @classmethod
+    def load(cls, path, mode="int8", dimensions=None):
+        """
+        Loads a saved index. A missing or unreadable one, or one saved with
+        another mode or dimension count, gives an empty index.
+        """
+        index = cls(path, mode, dimensions)
+        try:
+            meta = json.loads((path / "index.json").read_text(encoding="utf-8"))
+            if meta["mode"] != mode or (dimensions and meta["dimensions"] != dimensions):
+                return index
+            index._open()
+        except (OSError, ValueError, KeyError):
+            return cls(path, mode, dimensions)
+        return index
+
+
+def recall_at_k(vectors, queries, k=10, mode="int8", candidates=100, dimensions=None):
+    """
+    Recall@k of a compact index against exact float32 search over the full
+    vectors: the share of each query's true top k that the compact search
+    returns. With `dimensions`, the compact index holds truncated vectors.
+    """
+    import tempfile
+    from pathlib import Path
+
+    vectors = normalize(vectors)
+    queries = normalize(queries)
+    truth = [set(top_k(scores, k).tolist()) for scores in queries @ vectors.T]
+    if dimensions:
+        vectors, queries = truncate(vectors, dimensions), truncate(queries, dimensions)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = CompactIndex(Path(tmp) / "index", mode)
+        index.add([str(i) for i in range(len(vectors))], vectors, [""] * len(vectors))
+        index.save()
+        started = time.perf_counter()
+        found = index.search(queries, k, candidates)
+        query_ms = (time.perf_counter() - started) * 1000 / len(queries)
+        stats = index.stats()
+        index._vectors = None  # release the memmap before the directory goes
+    hits = sum(len(expected & {int(doc_id) for doc_id, _ in result}) for expected, result in zip(truth, found))
+    return {"recall": hits / (len(queries) * min(k, len(vectors))), "query_ms": query_ms, **stats}
@@ -0,0 +1,97 @@
+"""
+Registry of the documentation sets (corpora) served by one process.
+
+Besides the Extensions Guide, a server can index and search other Plesk doc
+sets (the API reference, the CLI reference, ...). Each corpus has its own
+documentation source, collection and index files; the ChromaDB client and
+the embedding client are shared. A corpus's handles (collection, keyword
+index, compact index) are opened on first use and dropped again once the
+corpus has not been used for a while, so rarely searched corpora do not keep
+their keyword and compact indexes in memory. ChromaDB keeps the HNSW
+segments it has loaded in its own cache, which these handles do not control.
+"""
+
+import re
+import threading
+import time
+from pathlib import Path
+
+# Corpus names become part of collection and folder names
+NAME_PATTERN = re.compile(r"[a-z0-9][a-z0-9-]{0,62}")
+
+
+def parse_corpora(value, root=None):
+    """
+    {name: Path} from a CORPORA value: comma-separated name=path pairs, each
+    path a folder of .htm files or a documentation ZIP. Relative paths are
+    taken from `root` when given.
+    """
+    corpora = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        name, separator, path = item.partition("=")
+        name = name.strip()
+        if not separator or not path.strip():
+            raise ValueError(f"Invalid CORPORA entry {item.strip()!r}; expected name=path")
+        if not NAME_PATTERN.fullmatch(name):
+            raise ValueError(f"Invalid corpus name {name!r}; use lowercase letters, digits and dashes")
+        if name in corpora:
+            raise ValueError(f"Corpus {name!r} is defined twice in CORPORA")
+        path = Path(path.strip()).expanduser()
+        corpora[name] = root / path if root is not None and not path.is_absolute() else path
+    return corpora
+
+
+class CorpusRegistry:
+    """
+    Per-corpus resources, created by `open_fn(name)` on first use. Whenever
+    a corpus is requested, the others that have been idle for `idle_seconds`
+    are evicted (0 keeps them loaded); the next use opens them again.
+    """
+
+    def __init__(self, names, open_fn, idle_seconds=0, clock=time.monotonic):
+        self.names = list(names)
+        self.open_fn = open_fn
+        self.idle_seconds = idle_seconds
+        self.clock = clock
+        self.evictions = 0
+        self._loaded = {}
+        self._last_used = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        if name not in self.names:
+            raise ValueError(f"Unknown corpus {name!r}; available: {', '.join(self.names)}")
+        with self._lock:
+            now = self.clock()
+            self._last_used[name] = now
+            self._evict_idle(now)
+            if name not in self._loaded:
+                self._loaded[name] = self.open_fn(name)
+            return self._loaded[name]
+
+    def loaded(self, name):
+        """The resources of a corpus if they are open, without opening them."""
+        with self._lock:
+            return self._loaded.get(name)
+
+    def _evict_idle(self, now):
+        if self.idle_seconds <= 0:
+            return
+        idle = [name for name in self._loaded if now - self._last_used[name] >= self.idle_seconds]
+        for name in idle:
+            # Searches still holding the resources finish with them
+            del self._loaded[name]
+        self.evictions += len(idle)
+
+    def stats(self):
+        with self._lock:
+            now = self.clock()
+            return {
+                name: {
+                    "loaded": name in self._loaded,
+                    "idle_seconds": now - self._last_used[name] if name in self._last_used else None,
+                }
+                for name in self.names
+            }
@@ -0,0 +1,81 @@
+"""
+Documentation pages read straight from the downloaded ZIP.
+
+The indexer can take its pages from the extensions-guide ZIP instead of an
+extracted html/ folder. Each page is a ZipMember with the small part of the
+pathlib.Path interface the indexer and the HTML parser use; the archive is
+opened once per process and members are decompressed straight from it.
+"""
+
+import threading
+import time
+import zipfile
+from pathlib import Path, PurePosixPath
+from types import SimpleNamespace
+
+_archives = {}  # (path, mtime_ns, size) -> ZipFile, per process
+_archives_lock = threading.Lock()
+
+
+def open_archive(path):
+    """
+    Returns a ZipFile for `path`, shared by every member read in this
+    process, so the central directory is parsed once. A rewritten archive is
+    reopened.
+    """
+    stat = path.stat()
+    key = (str(path), stat.st_mtime_ns, stat.st_size)
+    with _archives_lock:
+        archive = _archives.get(key)
+        if archive is None:
+            for stale in [k for k in _archives if k[0] == key[0]]:
+                _archives.pop(stale).close()
+            archive = _archives[key] = zipfile.ZipFile(path)
+        return archive
+
+
+class ZipMember:
+    """
+    One page inside a documentation ZIP. Members hold no open file handle,
+    so they can be pickled and handed to parser worker processes.
+    """
+
+    def __init__(self, archive, member, size, mtime):
+        self.archive = Path(archive)
+        self.member = member
+        self.size = size
+        self.mtime = mtime
+
+    @property
+    def name(self):
+        return PurePosixPath(self.member).name
+
+    def read_bytes(self):
+        return open_archive(self.archive).read(self.member)
+
+    def read_text(self, encoding="utf-8", errors="strict"):
+        return self.read_bytes().decode(encoding, errors)
+
+    def stat(self):
+        return SimpleNamespace(st_mtime=self.mtime, st_size=self.size)
+
+    def __eq__(self, other):
+        return isinstance(other, ZipMember) and (self.archive, self.member) == (other.archive, other.member)
+
+    def __hash__(self):
+        return hash((self.archive, self.member))
+
+    def __repr__(self):
+        return f"ZipMember({str(self.archive)!r}, {self.member!r})"
+
+
+def list_zip_members(path):
+    """Returns the .htm pages in the archive, skipping names that start with "_"."""
+    members = []
+    for info in open_archive(path).infolist():
+        name = PurePosixPath(info.filename).name
+        if info.is_dir() or not name.endswith(".htm") or name.startswith("_"):
+            continue
+        mtime = time.mktime(info.date_time + (0, 0, -1))
+        members.append(ZipMember(path, info.filename, info.file_size, mtime))
+    return members
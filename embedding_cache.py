@@ -0,0 +1,143 @@
+"""
+Disk-backed embedding cache.
+
+Embeddings are stored in a SQLite file keyed by model name + text hash, so
+identical text is only sent to the embedding API once across index runs and
+repeated queries. The cache is capped at a number of entries and evicts the
+least recently used ones.
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """SQLite-backed LRU cache of embedding vectors."""
+
+    def __init__(self, path, max_entries=100_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings (last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model, text):
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        """Returns {key: vector} for the keys present, refreshing their LRU stamp."""
+        if not keys:
+            return {}
+        found = {}
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+        return found
+
+    def put_many(self, items):
+        """Stores {key: vector} and evicts the oldest entries beyond max_entries."""
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items.items()],
+            )
+            (size,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            if size > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                    (size - self.max_entries,),
+                )
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            (size,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        return size
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self),
+            "max_entries": self.max_entries,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbeddingFunction:
+    """
+    Wraps a ChromaDB embedding function with an EmbeddingCache.
+    Only texts missing from the cache reach the wrapped function, in a single
+    call. Collections should still be opened with the wrapped function, so
+    ChromaDB records the real embedding model in the collection config.
+    """
+
+    def __init__(self, embedding_function, cache, model_name):
+        self.embedding_function = embedding_function
+        self.cache = cache
+        self.model_name = model_name
+
+    def lookup(self, input):
+        """
+        Splits a batch into cached and missing texts. Returns (keys, found,
+        missing) where missing maps key -> text for the texts to embed.
+        """
+        keys = [EmbeddingCache.make_key(self.model_name, text) for text in input]
+        found = self.cache.get_many(keys)
+
+        missing = {}
+        for key, text in zip(keys, input):
+            if key not in found:
+                missing.setdefault(key, text)
+        return keys, found, missing
+
+    def complete(self, keys, found, missing, vectors):
+        """Stores the vectors computed for `missing` and returns the batch in input order."""
+        if missing:
+            computed = dict(zip(missing, vectors))
+            self.cache.put_many(computed)
+            found.update(computed)
+        return [np.asarray(found[key], dtype=np.float32) for key in keys]
+
+    def __call__(self, input):
+        keys, found, missing = self.lookup(input)
+        vectors = self.embedding_function(list(missing.values())) if missing else []
+        return self.complete(keys, found, missing, vectors)
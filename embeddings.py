@@ -0,0 +1,116 @@
+"""
+Async embedding front end used by the MCP tools.
+
+Cached texts are served from the embedding cache; the rest go upstream in one
+request, with at most `max_concurrency` upstream requests in flight across all
+tool calls. OpenAI-compatible backends use a pooled AsyncOpenAI client;
+anything else runs in a worker thread. Upstream requests pass the rate
+limiter first, and rate-limited (429), server-side (5xx) and connection
+errors are retried with backoff.
+"""
+
+import asyncio
+
+import numpy as np
+import openai
+from chromadb.utils.embedding_functions import OpenAIEmbeddingFunction
+
+from chunking import estimate_tokens
+from embedding_cache import CachedEmbeddingFunction
+from rate_limit import RateLimiter, RetryPolicy, parse_retry_after
+
+
+def status_code(error):
+    return getattr(error, "status_code", None)
+
+
+def retryable(error):
+    """True for errors worth retrying: timeouts, conflicts, 429 and 5xx responses, dropped connections."""
+    status = status_code(error)
+    if status is not None:
+        return status in (408, 409, 429) or status >= 500
+    return isinstance(error, (openai.APIConnectionError, openai.APITimeoutError))
+
+
+class AsyncEmbedder:
+    """Awaitable counterpart of a (possibly cached) embedding function."""
+
+    def __init__(self, embedding_fn, max_concurrency=4, limiter=None, retry=None):
+        if isinstance(embedding_fn, CachedEmbeddingFunction):
+            self.cached = embedding_fn
+            self.embedding_function = embedding_fn.embedding_function
+        else:
+            self.cached = None
+            self.embedding_function = embedding_fn
+
+        self.async_client = None
+        if isinstance(self.embedding_function, OpenAIEmbeddingFunction):
+            # One client per process: httpx keeps the connections alive
+            # Retries are ours, so they share the rate limiter's backoff
+            self.async_client = openai.AsyncOpenAI(
+                api_key=self.embedding_function.api_key,
+                base_url=self.embedding_function.api_base,
+                max_retries=0,
+            )
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.limiter = limiter or RateLimiter(max_concurrency=max_concurrency)
+        self.retry = retry or RetryPolicy()
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+
+    @property
+    def cache(self):
+        return self.cached.cache if self.cached else None
+
+    async def __call__(self, texts):
+        if self.cached is None:
+            return await self.embed_upstream(texts)
+
+        keys, found, missing = await asyncio.to_thread(self.cached.lookup, texts)
+        vectors = await self.embed_upstream(list(missing.values())) if missing else []
+        return await asyncio.to_thread(self.cached.complete, keys, found, missing, vectors)
+
+    def stats(self):
+        return {"requests": self.requests, "retries": self.retries, "failures": self.failures, **self.limiter.stats()}
+
+    async def embed_upstream(self, texts):
+        tokens = sum(estimate_tokens(text) for text in texts)
+        attempt = 0
+        while True:
+            async with self._semaphore, self.limiter.slot(tokens):
+                self.requests += 1
+                try:
+                    vectors = await self._request(texts)
+                except Exception as e:
+                    delay = self._backoff(e, attempt)
+                    if delay is None:
+                        self.failures += 1
+                        raise
+                else:
+                    self.limiter.success()
+                    return vectors
+            # Back off outside the semaphore, so searches are not queued behind retries
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+    def _backoff(self, error, attempt):
+        """Seconds to wait before retrying after `error`, or None when it is not retried."""
+        if not retryable(error):
+            return None
+        retry_after = parse_retry_after(getattr(getattr(error, "response", None), "headers", None))
+        if status_code(error) == 429:
+            self.limiter.throttle(retry_after)
+        return self.retry.delay(attempt, retry_after)
+
+    async def _request(self, texts):
+        if self.async_client is None:
+            return await asyncio.to_thread(self.embedding_function, texts)
+
+        ef = self.embedding_function
+        params = {"model": ef.model_name, "input": texts}
+        if ef.dimensions is not None and "text-embedding-3" in ef.model_name:
+            params["dimensions"] = ef.dimensions
+        response = await self.async_client.embeddings.create(**params)
+        return [np.array(data.embedding, dtype=np.float32) for data in response.data]
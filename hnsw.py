@@ -0,0 +1,114 @@
+"""
+Recall and latency of the HNSW vector index.
+
+ChromaDB answers vector queries from an HNSW graph, which trades recall for
+speed: `space`, `M` (max_neighbors) and `ef_construction` shape the graph
+when a collection is built, and `ef_search` sets how much of it a query
+explores. Recall@k measures how many of the exact nearest neighbours, found
+by brute force over the stored vectors, a query through the graph returns,
+next to the latency of both, so the settings can be picked for a latency
+target at the corpus's size.
+"""
+
+import time
+
+import numpy as np
+
+from compact_index import normalize, top_k
+
+# Stored vectors read per get() call
+PAGE_SIZE = 1000
+
+
+def distances(vectors, query, space):
+    """Distance of every vector to `query`, as ChromaDB computes it for `space`."""
+    if space == "cosine":
+        return 1 - normalize(vectors) @ normalize(query)
+    if space == "ip":
+        return 1 - vectors @ query
+    return ((vectors - query) ** 2).sum(axis=1)
+
+
+def stored_vectors(collection):
+    """(ids, vectors) of every chunk in the collection."""
+    ids = []
+    blocks = []
+    while True:
+        page = collection.get(include=["embeddings"], limit=PAGE_SIZE, offset=len(ids))
+        if not len(page["ids"]):
+            break
+        ids.extend(page["ids"])
+        blocks.append(np.asarray(page["embeddings"], dtype=np.float32))
+    return ids, np.concatenate(blocks) if blocks else np.empty((0, 0), dtype=np.float32)
+
+
+def collection_settings(collection):
+    """The HNSW settings a collection was built or last modified with."""
+    return dict((collection.configuration or {}).get("hnsw") or {})
+
+
+def latency_summary(samples):
+    values = np.asarray(samples) * 1000
+    return {
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "max": float(values.max()),
+    }
+
+
+def measure_recall(collection, k=10, sample_size=100, space="l2", seed=0):
+    """
+    Recall@k of the collection's vector queries against exact search. A
+    sample of the stored vectors serve as queries; each query's own chunk is
+    left out of both rankings. Returns the recall and the per-query latency
+    of the index and of brute force, in milliseconds.
+    """
+    ids, vectors = stored_vectors(collection)
+    if len(ids) < 2:
+        raise ValueError("Measuring recall needs at least 2 indexed chunks")
+    k = min(k, len(ids) - 1)
+    sample = np.random.default_rng(seed).choice(len(ids), size=min(sample_size, len(ids)), replace=False)
+
+    index_seconds = []
+    exact_seconds = []
+    hits = 0
+    for row in sample:
+        query = vectors[row]
+        started = time.perf_counter()
+        found = collection.query(query_embeddings=[query.tolist()], n_results=k + 1, include=[])["ids"][0]
+        index_seconds.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        exact = top_k(-distances(vectors, query, space), k + 1)
+        exact_seconds.append(time.perf_counter() - started)
+
+        expected = [ids[i] for i in exact if i != row][:k]
+        hits += len(set(expected).intersection(doc_id for doc_id in found if doc_id != ids[row]))
+    return {
+        "k": k,
+        "queries": len(sample),
+        "vectors": len(ids),
+        "recall": hits / (len(sample) * k),
+        "index_latency_ms": latency_summary(index_seconds),
+        "exact_latency_ms": latency_summary(exact_seconds),
+    }
+
+
+def sweep_ef_search(collection, values, k=10, sample_size=100, seed=0):
+    """
+    measure_recall once per `ef_search` value, on the same sample, with the
+    collection's ef_search set to it; the original value is restored after.
+    """
+    settings = collection_settings(collection)
+    space = settings.get("space", "l2")
+    if not values:
+        return [{"ef_search": settings.get("ef_search"), **measure_recall(collection, k, sample_size, space, seed)}]
+    rows = []
+    try:
+        for value in values:
+            collection.modify(configuration={"hnsw": {"ef_search": value}})
+            rows.append({"ef_search": value, **measure_recall(collection, k, sample_size, space, seed)})
+    finally:
+        if settings.get("ef_search") is not None:
+            collection.modify(configuration={"hnsw": {"ef_search": settings["ef_search"]}})
+    return rows
@@ -0,0 +1,153 @@
+"""
+Background index jobs.
+
+index_extensions_guide starts the index run as an asyncio task and returns
+its job id at once, so a long rebuild never holds an MCP tool call open.
+The run reports its progress on the job (phase, files and chunks done), from
+which the job derives rates and an ETA. Jobs live in memory; what survives a
+restart is the index checkpoint the run writes under storage/.
+"""
+
+import asyncio
+import time
+import uuid
+
+
+class IndexJob:
+    """Status and progress counters of one index run."""
+
+    def __init__(self, force=False, batch_size=None, corpus=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.force = force
+        self.batch_size = batch_size
+        self.corpus = corpus
+        self.status = "pending"
+        self.phase = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.generation = None
+        self.resumed = False
+        self.files_total = 0       # files to parse in this run
+        self.files_parsed = 0
+        self.files_done = 0        # parsed, embedded and written
+        self.files_unchanged = 0
+        self.files_removed = 0
+        self.chunks_copied = 0
+        self.chunks_embedded = 0
+        self.batches_deferred = 0  # failed once, retried at the end of the run
+        self.batches_failed = 0    # failed again; their files are retried next run
+        self.failed_files = []     # pages whose batches failed twice
+        self.kept_files = []       # of those, pages still served in their previous version
+        self.summary = None
+        self.error = None
+        self.task = None
+        self._indexing_started = None
+
+    @property
+    def done(self):
+        return self.status in ("completed", "failed", "cancelled")
+
+    def set_phase(self, phase):
+        self.phase = phase
+        if phase == "indexing":
+            self._indexing_started = time.monotonic()
+
+    def progress(self):
+        """JSON-friendly status with throughput since parsing started and an ETA in seconds."""
+        elapsed = time.monotonic() - self._indexing_started if self._indexing_started else 0.0
+        files_per_second = self.files_done / elapsed if elapsed and self.files_done else 0.0
+        remaining = self.files_total - self.files_done
+        eta = None
+        if self.done:
+            eta = 0.0
+        elif files_per_second:
+            eta = remaining / files_per_second
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "phase": self.phase,
+            "corpus": self.corpus,
+            "force": self.force,
+            "resumed": self.resumed,
+            "generation": self.generation,
+            "files_total": self.files_total,
+            "files_parsed": self.files_parsed,
+            "files_done": self.files_done,
+            "files_unchanged": self.files_unchanged,
+            "files_removed": self.files_removed,
+            "chunks_copied": self.chunks_copied,
+            "chunks_embedded": self.chunks_embedded,
+            "batches_deferred": self.batches_deferred,
+            "batches_failed": self.batches_failed,
+            "failed_files": self.failed_files,
+            "kept_files": self.kept_files,
+            "files_per_second": files_per_second,
+            "chunks_per_second": self.chunks_embedded / elapsed if elapsed else 0.0,
+            "eta_seconds": eta,
+            "elapsed_seconds": (self.finished or time.time()) - self.started if self.started else 0.0,
+            "summary": self.summary,
+            "error": self.error,
+        }
+
+
+class JobRegistry:
+    """Runs index jobs one at a time and remembers the last `max_jobs` of them."""
+
+    def __init__(self, max_jobs=20):
+        self.max_jobs = max_jobs
+        self._jobs = {}
+
+    def active(self):
+        """The pending or running job, if any."""
+        return next((job for job in self._jobs.values() if not job.done), None)
+
+    def get(self, job_id=None):
+        """A job by id, or the most recent one; raises ValueError for an unknown id."""
+        if job_id is None:
+            return next(reversed(self._jobs.values()), None)
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise ValueError(f"Unknown index job {job_id!r}")
+        return job
+
+    def start(self, job, run):
+        """Schedules `run(job)` (a coroutine function returning a summary) on the running loop."""
+        self._jobs[job.id] = job
+        while len(self._jobs) > self.max_jobs:
+            oldest = next(job_id for job_id, old in self._jobs.items() if old.done)
+            del self._jobs[oldest]
+        job.task = asyncio.get_running_loop().create_task(self._run(job, run))
+        return job
+
+    async def _run(self, job, run):
+        job.status = "running"
+        job.started = time.time()
+        try:
+            job.summary = await run(job)
+            job.status = "failed" if job.error else "completed"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            print(f"Index job {job.id} failed: {e}")
+        finally:
+            job.phase = job.status
+            job.finished = time.time()
+
+    def cancel(self, job_id=None):
+        """Cancels a pending or running job; returns it."""
+        job = self.get(job_id)
+        if job is None:
+            raise ValueError("No index job to cancel")
+        if not job.done and job.task is not None:
+            job.task.cancel()
+        return job
+
+    async def wait(self, job, timeout):
+        """Waits up to `timeout` seconds for a job to finish; True when it did."""
+        if job.task is None:
+            return job.done
+        done, _ = await asyncio.wait({job.task}, timeout=timeout)
+        return bool(done)
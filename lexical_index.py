@@ -0,0 +1,165 @@
+"""
+BM25 lexical index over the indexed chunks.
+
+Built alongside the vector index and persisted under storage/, so exact
+identifiers (pm_Hook_Interface, CLI flags) can be matched without an
+embedding call. Chunks are added and removed incrementally, mirroring the
+ChromaDB collection.
+"""
+
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+# Identifiers keep their inner "_", "-", "." and "::" (pm_Hook_Interface,
+# --enable-feature, Plesk::Config); words are plain alphanumeric runs
+TOKEN_RE = re.compile(r"-{0,2}[A-Za-z0-9]+(?:(?:_|::|[-.](?=[A-Za-z0-9]))[A-Za-z0-9]+)*")
+IDENTIFIER_RE = re.compile(r"^(?:-{1,2}[a-z0-9]|.*(?:_|::|->|\(\))|.*[a-z][A-Z])")
+
+
+def tokenize(text):
+    """
+    Lowercased tokens. Compound identifiers are indexed whole and by their
+    parts, so "pm_Hook_Interface" also matches a query for "hook".
+    """
+    tokens = []
+    for match in TOKEN_RE.finditer(text):
+        token = match.group().lower()
+        tokens.append(token)
+        parts = [part for part in re.split(r"[_\-.:]+", token) if part]
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+def is_identifier_query(query):
+    """True when every word of the query looks like a code identifier or CLI flag."""
+    words = query.split()
+    return bool(words) and len(words) <= 3 and all(IDENTIFIER_RE.match(word) for word in words)
+
+
+class BM25Index:
+    """Okapi BM25 over chunk documents, with their text and metadata."""
+
+    def __init__(self, path, k1=1.5, b=0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._docs = {}      # id -> {"document", "metadata", "terms": {term: tf}, "length"}
+        self._postings = {}  # term -> {id: tf}
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, ids, documents, metadatas):
+        with self._lock:
+            for doc_id, document, metadata in zip(ids, documents, metadatas):
+                self._remove(doc_id)
+                terms = Counter(tokenize(document))
+                length = sum(terms.values())
+                self._docs[doc_id] = {"document": document, "metadata": metadata, "terms": dict(terms), "length": length}
+                self._total_length += length
+                for term, tf in terms.items():
+                    self._postings.setdefault(term, {})[doc_id] = tf
+
+    def ids(self):
+        with self._lock:
+            return list(self._docs)
+
+    def remove_filenames(self, filenames):
+        """Drops every chunk of the given pages, in one pass over the index."""
+        filenames = set(filenames)
+        with self._lock:
+            for doc_id in [doc_id for doc_id, doc in self._docs.items() if doc["metadata"].get("filename") in filenames]:
+                self._remove(doc_id)
+
+    def _remove(self, doc_id):
+        doc = self._docs.pop(doc_id, None)
+        if doc is None:
+            return
+        self._total_length -= doc["length"]
+        for term in doc["terms"]:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def has_exact(self, query):
+        """True when every whole token of the query (identifiers unsplit) occurs in the index."""
+        tokens = [match.group().lower() for match in TOKEN_RE.finditer(query)]
+        with self._lock:
+            return bool(tokens) and all(token in self._postings for token in tokens)
+
+    def search(self, query, n_results):
+        """Returns up to `n_results` (id, document, metadata, score), best first."""
+        with self._lock:
+            if not self._docs:
+                return []
+            n_docs = len(self._docs)
+            avg_length = self._total_length / n_docs or 1.0
+            scores = Counter()
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    length = self._docs[doc_id]["length"]
+                    norm = tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * length / avg_length))
+                    scores[doc_id] += idf * norm
+            return [
+                (doc_id, self._docs[doc_id]["document"], self._docs[doc_id]["metadata"], score)
+                for doc_id, score in scores.most_common(n_results)
+            ]
+
+    def clear(self):
+        with self._lock:
+            self._docs.clear()
+            self._postings.clear()
+            self._total_length = 0
+
+    def save(self):
+        """Writes the index atomically; postings are rebuilt on load."""
+        with self._lock:
+            data = {
+                doc_id: {"document": doc["document"], "metadata": doc["metadata"], "terms": doc["terms"]}
+                for doc_id, doc in self._docs.items()
+            }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(data), encoding="utf-8")
+        os.replace(tmp_path, self.path)
+
+    @classmethod
+    def load(cls, path):
+        """Loads a saved index; a missing or unreadable file gives an empty one."""
+        index = cls(path)
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return index
+        for doc_id, doc in data.items():
+            length = sum(doc["terms"].values())
+            index._docs[doc_id] = {**doc, "length": length}
+            index._total_length += length
+            for term, tf in doc["terms"].items():
+                index._postings.setdefault(term, {})[doc_id] = tf
+        return index
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Fuses several ranked lists of ids: each id scores sum(1 / (k + rank)).
+    Returns ids ordered by fused score.
+    """
+    scores = Counter()
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] += 1.0 / (k + rank)
+    return [doc_id for doc_id, _ in scores.most_common()]
@@ -0,0 +1,279 @@
+"""
+In-process timing spans, counters and a one-shot request profiler.
+
+Durations are recorded into fixed-bucket histograms (one bisect and a few
+additions per observation, no samples kept), so spans can stay on the hot
+path. The registry is published as a JSON-friendly snapshot and in the
+Prometheus text format, optionally over a small HTTP endpoint.
+"""
+
+import bisect
+import cProfile
+import io
+import pstats
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds in seconds, from sub-millisecond cache hits to multi-minute index runs
+BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, float("inf"),
+)
+
+
+class Histogram:
+    """Per-bucket counts (not cumulative) plus count, sum and max."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Estimates a quantile by linear interpolation inside its bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = min(self.buckets[i], self.max)
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+        }
+
+
+class Span:
+    """Times a `with` block into a registry histogram."""
+
+    __slots__ = ("registry", "name", "started")
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, time.perf_counter() - self.started)
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class MetricsRegistry:
+    """Thread-safe registry of duration histograms (seconds) and counters."""
+
+    def __init__(self, enabled=True, prefix="plesk_docs"):
+        self.enabled = enabled
+        self.prefix = prefix
+        self.started = time.time()
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def span(self, name):
+        """Context manager recording the duration of its block under `name`."""
+        return Span(self, name) if self.enabled else _NULL_SPAN
+
+    def observe(self, name, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def increment(self, name, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def snapshot(self):
+        """Counters and histogram summaries, with latencies in milliseconds."""
+        with self._lock:
+            timings = {}
+            for name, histogram in sorted(self._histograms.items()):
+                summary = histogram.summary()
+                timings[name] = {
+                    "count": summary["count"],
+                    **{key: summary[key] * 1000 for key in ("mean", "p50", "p95", "p99", "max")},
+                    "total_ms": summary["sum"] * 1000,
+                }
+            return {
+                "enabled": self.enabled,
+                "uptime_seconds": time.time() - self.started,
+                "counters": dict(sorted(self._counters.items())),
+                "timings_ms": timings,
+            }
+
+    def _metric_name(self, name):
+        return f"{self.prefix}_{name.replace('.', '_').replace('-', '_')}"
+
+    def prometheus_text(self):
+        """The registry in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        with self._lock:
+            for name, value in sorted(self._counters.items()):
+                metric = self._metric_name(name) + "_total"
+                lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+            for name, histogram in sorted(self._histograms.items()):
+                metric = self._metric_name(name) + "_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, bucket_count in zip(histogram.buckets, histogram.counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{metric}_bucket{{le="{le}"}} {cumulative}')
+                lines += [f"{metric}_sum {histogram.sum}", f"{metric}_count {histogram.count}"]
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+
+class RequestProfiler:
+    """
+    Captures one slow request. While armed, tool calls run under cProfile (or
+    pyinstrument) one at a time; the first call slower than `threshold_ms`
+    keeps its report and disarms the profiler, so profiling costs nothing
+    the rest of the time.
+    """
+
+    def __init__(self, backend="cprofile", threshold_ms=1000.0):
+        self.backend = backend
+        self.threshold_ms = threshold_ms
+        self.armed = False
+        self.last_report = None
+        self._active = False
+        self._lock = threading.Lock()
+
+    def arm(self, threshold_ms=None):
+        if self.backend not in ("cprofile", "pyinstrument"):
+            raise ValueError(f"Unknown profiler {self.backend!r}; expected 'cprofile' or 'pyinstrument'")
+        if self.backend == "pyinstrument":
+            try:
+                import pyinstrument  # noqa: F401
+            except ImportError:
+                raise ValueError("The pyinstrument profiler requires pyinstrument: pip install pyinstrument")
+        if threshold_ms is not None:
+            self.threshold_ms = threshold_ms
+        self.armed = True
+
+    def status(self):
+        return {"backend": self.backend, "armed": self.armed, "threshold_ms": self.threshold_ms}
+
+    def profile(self, name):
+        """Context manager; a no-op unless armed and no other call is being profiled."""
+        if not self.armed:
+            return _NULL_SPAN
+        with self._lock:
+            if self._active:
+                return _NULL_SPAN
+            self._active = True
+        return _ProfileSession(self, name)
+
+    def _finish(self, name, seconds, report):
+        with self._lock:
+            self._active = False
+            if self.armed and seconds * 1000 >= self.threshold_ms:
+                self.armed = False
+                self.last_report = {
+                    "request": name,
+                    "duration_ms": seconds * 1000,
+                    "captured_at": time.time(),
+                    "backend": self.backend,
+                    "report": report(),
+                }
+
+
+class _ProfileSession:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        if self.profiler.backend == "pyinstrument":
+            from pyinstrument import Profiler
+
+            self.session = Profiler(async_mode="enabled")
+            self.session.start()
+        else:
+            self.session = cProfile.Profile()
+            self.session.enable()
+        return self
+
+    def __exit__(self, *exc):
+        if self.profiler.backend == "pyinstrument":
+            self.session.stop()
+            report = self.session.output_text
+        else:
+            self.session.disable()
+            report = self._cprofile_report
+        self.profiler._finish(self.name, time.perf_counter() - self.started, report)
+
+    def _cprofile_report(self, limit=40):
+        out = io.StringIO()
+        pstats.Stats(self.session, stream=out).sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+
+
+def start_prometheus_server(registry, port, host="127.0.0.1"):
+    """Serves registry.prometheus_text() at /metrics from a daemon thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
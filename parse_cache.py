@@ -0,0 +1,86 @@
+"""
+On-disk cache of parsed documentation pages.
+
+Parsing a Sphinx page (building the BeautifulSoup tree, dropping the noise,
+extracting the text of every section) costs far more than chunking and
+writing it. The cache keeps the parser output of every page in one
+zlib-compressed pack file, keyed by the page's path and content hash, so
+index runs that go over unchanged pages again (forced rebuilds, new chunk
+settings, a wiped index) skip the HTML parser for them. A pack written by
+another parser version is ignored.
+"""
+
+import json
+import os
+import threading
+import zlib
+
+# Pages are small and repetitive; level 6 is zlib's default trade-off
+COMPRESSION_LEVEL = 6
+
+
+class ParseCache:
+    """(title, sections) per page, loaded from and saved to one pack file."""
+
+    def __init__(self, path, parser_id):
+        self.path = path
+        self.parser_id = parser_id
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._pages = self._load()
+        self._changed = False
+
+    @staticmethod
+    def make_key(rel_path, digest):
+        return f"{rel_path}\0{digest}"
+
+    def _load(self):
+        try:
+            data = json.loads(zlib.decompress(self.path.read_bytes()))
+        except (OSError, ValueError, zlib.error):
+            return {}
+        if data.get("parser") != self.parser_id:
+            return {}
+        return data["pages"]
+
+    def get(self, key):
+        """The cached (title, sections) of a page, or None."""
+        with self._lock:
+            page = self._pages.get(key)
+            if page is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return page[0], page[1]
+
+    def put(self, key, title, sections):
+        with self._lock:
+            self._pages[key] = [title, sections]
+            self._changed = True
+
+    def save(self, keep):
+        """
+        Writes the pack atomically, keeping only the pages whose key is in
+        `keep` (the current version of every page), so deleted and
+        superseded pages drop out.
+        """
+        with self._lock:
+            stale = self._pages.keys() - set(keep)
+            if not stale and not self._changed:
+                return
+            for key in stale:
+                del self._pages[key]
+            data = json.dumps({"parser": self.parser_id, "pages": self._pages}, separators=(",", ":"))
+            self._changed = False
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        tmp_path.write_bytes(zlib.compress(data.encode("utf-8"), COMPRESSION_LEVEL))
+        os.replace(tmp_path, self.path)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pages)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "pages": len(self)}
@@ -0,0 +1,172 @@
+"""
+In-memory cache of formatted search results.
+
+Entries are keyed on the normalized query plus the search options, expire
+after a TTL, and are evicted least recently used first. Every reindex bumps
+the cache generation, which drops all entries; results computed against an
+older generation are never stored.
+
+The semantic cache sits behind it: a small in-memory vector index of recent
+query embeddings, so a paraphrase of a recent query (cosine similarity above
+a threshold) reuses that query's hits without touching the collection.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class QueryResultCache:
+    """Thread-safe LRU/TTL cache invalidated by an index generation counter."""
+
+    def __init__(self, max_entries=256, ttl_seconds=3600.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(query):
+        """Case- and whitespace-insensitive form of a query."""
+        return " ".join(query.lower().split())
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, generation):
+        """Stores a result computed during `generation`; stale results are dropped."""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        """Starts a new index generation and drops every cached result."""
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "generation": self.generation,
+            }
+
+
+class SemanticQueryCache:
+    """
+    Thread-safe LRU/TTL cache of search hits keyed on query embeddings. The
+    unit-length embeddings live in one preallocated (max_entries, dimensions)
+    matrix, so memory stays bounded and a lookup is one matrix-vector product.
+    A lookup matches only entries stored with equal `options`.
+    """
+
+    def __init__(self, max_entries=256, threshold=0.95, ttl_seconds=3600.0):
+        if not 0 < threshold <= 1:
+            raise ValueError("threshold must be greater than 0 and at most 1")
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        # slot -> (options, value, expires), least recently used first
+        self._entries = OrderedDict()
+        self._vectors = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _unit(embedding):
+        import numpy as np
+
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def get(self, options, embedding):
+        """The value stored for the most similar query above the threshold, or None."""
+        query = self._unit(embedding)
+        with self._lock:
+            best = None
+            if query is not None and self._entries and self._vectors.shape[1] == len(query):
+                similarities = self._vectors @ query
+                now = time.monotonic()
+                for slot in [slot for slot, entry in self._entries.items() if entry[2] < now]:
+                    del self._entries[slot]
+                for slot, (entry_options, _, _) in self._entries.items():
+                    if entry_options == options and similarities[slot] >= self.threshold:
+                        if best is None or similarities[slot] > similarities[best]:
+                            best = slot
+            if best is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best)
+            self.hits += 1
+            return self._entries[best][1]
+
+    def put(self, options, embedding, value, generation):
+        """Stores hits computed during `generation`; stale results are dropped."""
+        if self.max_entries <= 0:
+            return
+        vector = self._unit(embedding)
+        if vector is None:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            if self._vectors is None or self._vectors.shape[1] != len(vector):
+                # First entry, or a new embedding model: start over at its size
+                import numpy as np
+
+                self._vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+                self._entries.clear()
+            if len(self._entries) < self.max_entries:
+                used = set(self._entries)
+                slot = next(slot for slot in range(self.max_entries) if slot not in used)
+            else:
+                slot, _ = self._entries.popitem(last=False)
+            self._vectors[slot] = vector
+            self._entries[slot] = (options, value, time.monotonic() + self.ttl_seconds)
+
+    def invalidate(self):
+        """Starts a new index generation and drops every cached result."""
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "threshold": self.threshold,
+                "memory_bytes": self._vectors.nbytes if self._vectors is not None else 0,
+                "generation": self.generation,
+            }
@@ -0,0 +1,200 @@
+"""
+Client-side rate limiting and retries for the embedding API.
+
+Two token buckets keep requests per minute and tokens per minute under the
+account's limits, and a concurrency window caps the requests in flight. All
+three adapt: a 429 halves them and pauses every caller until the provider's
+Retry-After has passed, and each successful request wins back a share of the
+configured values (additive increase, multiplicative decrease), so
+throughput settles just below what the provider accepts. Without configured
+RPM/TPM limits only the concurrency window adapts. Failed requests are
+retried with exponential backoff and full jitter.
+"""
+
+import asyncio
+import contextlib
+import email.utils
+import random
+import time
+
+# Seconds of traffic a bucket may send in one burst
+BURST_SECONDS = 10
+
+# Lowest share of the configured rates a run of 429s can throttle down to,
+# and the share won back by every successful request
+MIN_SCALE = 0.05
+INCREASE = 0.05
+
+# Concurrent 429s answer the same overload: only one halving per interval
+DECREASE_INTERVAL = 1.0
+
+
+class TokenBucket:
+    """Refills at `rate` per minute; a request larger than the burst goes once the bucket is full."""
+
+    def __init__(self, rate, clock=time.monotonic):
+        self.clock = clock
+        self.rate = rate
+        self.tokens = self.capacity
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+
+    @property
+    def capacity(self):
+        return max(1.0, self.rate * BURST_SECONDS / 60)
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate / 60)
+        self._updated = now
+
+    def set_rate(self, rate):
+        self._refill()
+        self.rate = rate
+        self.tokens = min(self.tokens, self.capacity)
+
+    def wait_time(self, amount):
+        """Seconds until `amount` can be taken (0 when it can be taken now)."""
+        self._refill()
+        needed = min(amount, self.capacity)
+        return max(0.0, (needed - self.tokens) * 60 / self.rate)
+
+    async def acquire(self, amount=1):
+        # The lock keeps waiters in order, so large requests are not starved
+        async with self._lock:
+            while (delay := self.wait_time(amount)) > 0:
+                await asyncio.sleep(delay)
+            # The balance may go negative; the next caller waits for the debt
+            self.tokens -= amount
+
+
+class RateLimiter:
+    """
+    Requests-per-minute, tokens-per-minute and concurrency limits (0 means
+    unlimited), scaled down on 429 responses and back up on success.
+    """
+
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0, max_concurrency=0, clock=time.monotonic):
+        self.clock = clock
+        self.limits = {"requests": requests_per_minute, "tokens": tokens_per_minute}
+        self.buckets = {name: TokenBucket(limit, clock) for name, limit in self.limits.items() if limit > 0}
+        self.max_concurrency = max_concurrency
+        self.scale = 1.0
+        self.throttled = 0
+        self.in_flight = 0
+        self._window_free = asyncio.Condition()
+        self._paused_until = 0.0
+        self._last_decrease = None
+
+    @property
+    def window(self):
+        """Requests allowed in flight at the current scale, or None when unlimited."""
+        if not self.max_concurrency:
+            return None
+        return max(1, int(self.max_concurrency * self.scale))
+
+    @contextlib.asynccontextmanager
+    async def slot(self, tokens):
+        """Holds one request's place in the window, after pacing it under the rate limits."""
+        await self.acquire(tokens)
+        try:
+            yield
+        finally:
+            await self._release()
+
+    async def _release(self):
+        async with self._window_free:
+            self.in_flight -= 1
+            self._window_free.notify_all()
+
+    async def acquire(self, tokens):
+        while (delay := self._paused_until - self.clock()) > 0:
+            await asyncio.sleep(delay)
+        async with self._window_free:
+            await self._window_free.wait_for(lambda: self.window is None or self.in_flight < self.window)
+            self.in_flight += 1
+        try:
+            if "requests" in self.buckets:
+                await self.buckets["requests"].acquire(1)
+            if "tokens" in self.buckets:
+                await self.buckets["tokens"].acquire(tokens)
+        except BaseException:
+            await self._release()
+            raise
+
+    def _apply(self):
+        for name, bucket in self.buckets.items():
+            bucket.set_rate(self.limits[name] * self.scale)
+
+    def success(self):
+        if self.scale < 1.0:
+            self.scale = min(1.0, self.scale + INCREASE)
+            self._apply()
+
+    def throttle(self, retry_after=None):
+        """Records a 429: halves the rates and the window, and pauses all callers for `retry_after` seconds."""
+        self.throttled += 1
+        now = self.clock()
+        if self._last_decrease is None or now - self._last_decrease >= DECREASE_INTERVAL:
+            self.scale = max(MIN_SCALE, self.scale / 2)
+            self._last_decrease = now
+            self._apply()
+        if retry_after:
+            self._paused_until = max(self._paused_until, now + retry_after)
+
+    def stats(self):
+        return {
+            "requests_per_minute": self.limits["requests"] * self.scale if self.limits["requests"] else None,
+            "tokens_per_minute": self.limits["tokens"] * self.scale if self.limits["tokens"] else None,
+            "concurrency": self.window,
+            "scale": self.scale,
+            "throttled": self.throttled,
+        }
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, capped at `max_delay` seconds."""
+
+    def __init__(self, max_retries=5, base_delay=0.5, max_delay=60.0, rng=random.random):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rng = rng
+
+    def delay(self, attempt, retry_after=None):
+        """
+        Seconds to wait before retry number `attempt` + 1, or None to give up:
+        retries are exhausted, or the server asks for a longer wait than
+        `max_delay`.
+        """
+        if attempt >= self.max_retries:
+            return None
+        if retry_after is not None:
+            return retry_after if retry_after <= self.max_delay else None
+        return self.rng() * min(self.max_delay, self.base_delay * 2 ** attempt)
+
+
+def parse_retry_after(headers, now=None):
+    """
+    Seconds from the `retry-after-ms` or `retry-after` header (seconds or
+    an HTTP date), or None when absent or unreadable.
+    """
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms") is not None:
+            return max(0.0, float(headers["retry-after-ms"]) / 1000)
+    except ValueError:
+        pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - (now if now is not None else time.time()))
@@ -0,0 +1,86 @@
+"""
+Re-ranking of search candidates after retrieval.
+
+The closest chunks to a query are often near-duplicates from one page.
+Maximal marginal relevance (MMR) picks candidates one at a time, trading
+relevance to the query against similarity to the chunks already picked, so
+the results cover more of the guide. A local cross-encoder can score the
+(query, chunk) pairs instead of the cosine similarity; its scores then rank
+the candidates, or serve as the relevance MMR diversifies. Both work on the
+whole candidate set at once: MMR reads all pairwise similarities from one
+matrix product, and the cross-encoder scores all pairs in one batched call.
+"""
+
+import numpy as np
+
+from compact_index import normalize
+
+STAGES = ("mmr", "cross-encoder")
+
+
+def parse_stages(value):
+    """The stages named in a comma-separated RERANK value."""
+    stages = tuple(stage.strip() for stage in value.split(",") if stage.strip())
+    for stage in stages:
+        if stage not in STAGES:
+            raise ValueError(f"Unknown RERANK stage {stage!r}; expected 'mmr' and/or 'cross-encoder'")
+    return stages
+
+
+def mmr(relevance, embeddings, k, lambda_):
+    """
+    Indices of `k` candidates in MMR order. `relevance` scores each candidate
+    against the query and `embeddings` (one row per candidate) measure how
+    redundant they are; `lambda_` weighs relevance against diversity, and 1
+    keeps the relevance order.
+    """
+    relevance = np.asarray(relevance, dtype=np.float32)
+    vectors = normalize(embeddings)
+    similarity = vectors @ vectors.T
+    redundancy = np.zeros(len(relevance), dtype=np.float32)
+    available = np.ones(len(relevance), dtype=bool)
+    picked = []
+    for _ in range(min(k, len(relevance))):
+        scores = np.where(available, lambda_ * relevance - (1 - lambda_) * redundancy, -np.inf)
+        best = int(np.argmax(scores))
+        picked.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, similarity[best])
+    return picked
+
+
+class CrossEncoderReranker:
+    """A sentence-transformers CrossEncoder run on the CPU."""
+
+    def __init__(self, model_name, batch_size=32):
+        from sentence_transformers import CrossEncoder
+
+        self.model = CrossEncoder(model_name, device="cpu")
+        self.batch_size = batch_size
+
+    def scores(self, query, documents):
+        """Relevance of each document to the query, scaled to 0..1 over the batch."""
+        scores = np.asarray(
+            self.model.predict(
+                [(query, document) for document in documents], batch_size=self.batch_size, show_progress_bar=False
+            ),
+            dtype=np.float32,
+        )
+        span = scores.max() - scores.min()
+        return (scores - scores.min()) / span if span > 0 else np.ones_like(scores)
+
+
+def rerank(query, query_embedding, documents, embeddings, k, lambda_=0.7, cross_encoder=None):
+    """
+    Indices of the best `k` documents. The cross-encoder scores, or else the
+    cosine similarity of `embeddings` to `query_embedding`, are the
+    relevance; with `embeddings`, MMR diversifies the picks, otherwise they
+    are sorted by relevance.
+    """
+    if cross_encoder is not None:
+        relevance = cross_encoder.scores(query, documents)
+    else:
+        relevance = normalize(embeddings) @ normalize(query_embedding)
+    if embeddings is None:
+        return [int(i) for i in np.argsort(-relevance, kind="stable")[:k]]
+    return mmr(relevance, embeddings, k, lambda_)
@@ -5,28 +5,138 @@ Download and extract Plesk Extensions Guide documentation.
 This script downloads the Plesk extensions guide ZIP file and extracts it
 to the html/ folder. It also ensures the storage/ directory exists with
 proper permissions for the vector database.
+
+The download is streamed in chunks and resumed after an interruption. The
+ETag/Last-Modified of the ZIP are remembered, so with --no-extract (keep the
+ZIP and index it in place with DOCS_ZIP) an unchanged ZIP costs one HEAD
+request.
+
+--corpus name=url downloads another Plesk doc set (API reference, CLI
+reference, ...) to <name>.zip and docs/<name>/ instead, for the server's
+CORPORA setting.
 """
 
+import json
 import os
 import sys
+import urllib.error
 import urllib.request
 import zipfile
 from pathlib import Path
 
 # Constants
+DOCS_NAME = "Plesk Extensions Guide"
 DOCS_URL = "https://docs.plesk.com/en-US/obsidian/zip/extensions-guide.zip"
 SCRIPT_DIR = Path(__file__).parent
 PROJECT_ROOT = SCRIPT_DIR.parent
 HTML_DIR = PROJECT_ROOT / "html"
 STORAGE_DIR = PROJECT_ROOT / "storage"
 ZIP_FILE = PROJECT_ROOT / "extensions-guide.zip"
+PART_FILE = PROJECT_ROOT / "extensions-guide.zip.part"
+META_FILE = PROJECT_ROOT / "extensions-guide.zip.json"
+CHUNK_SIZE = 1024 * 1024
+TIMEOUT_SECONDS = 60
+
+
+def use_corpus(name, url):
+    """Points the download at another doc set: <name>.zip, extracted to docs/<name>/."""
+    global DOCS_NAME, DOCS_URL, HTML_DIR, ZIP_FILE, PART_FILE, META_FILE
+    DOCS_NAME = name
+    DOCS_URL = url
+    HTML_DIR = PROJECT_ROOT / "docs" / name
+    ZIP_FILE = PROJECT_ROOT / f"{name}.zip"
+    PART_FILE = PROJECT_ROOT / f"{name}.zip.part"
+    META_FILE = PROJECT_ROOT / f"{name}.zip.json"
+
+
+def load_meta():
+    """Returns the saved validators of the ZIP and of a partial download."""
+    try:
+        return json.loads(META_FILE.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def save_meta(meta):
+    META_FILE.write_text(json.dumps(meta, indent=1), encoding="utf-8")
+
+
+def validators(headers):
+    return {"etag": headers.get("ETag"), "last_modified": headers.get("Last-Modified")}
+
+
+def is_up_to_date(meta):
+    """
+    Asks the server, with one conditional HEAD request, whether the local ZIP
+    still matches the remote one.
+    """
+    saved = meta.get("zip") or {}
+    if not ZIP_FILE.exists() or not (saved.get("etag") or saved.get("last_modified")):
+        return False
+
+    headers = {}
+    if saved.get("etag"):
+        headers["If-None-Match"] = saved["etag"]
+    if saved.get("last_modified"):
+        headers["If-Modified-Since"] = saved["last_modified"]
+    request = urllib.request.Request(DOCS_URL, method="HEAD", headers=headers)
+    try:
+        with urllib.request.urlopen(request, timeout=TIMEOUT_SECONDS) as response:
+            remote = validators(response.headers)
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return True
+        raise
+    # Servers that ignore conditional HEADs still report their validators
+    if remote["etag"]:
+        return remote["etag"] == saved.get("etag")
+    return bool(remote["last_modified"]) and remote["last_modified"] == saved.get("last_modified")
+
+
+def fetch_zip(meta):
+    """
+    Streams the ZIP into PART_FILE in CHUNK_SIZE pieces, resuming a previous
+    partial download with a Range request when the server still has the same
+    file (If-Range), then moves it into place.
+    """
+    offset = PART_FILE.stat().st_size if PART_FILE.exists() else 0
+    partial = meta.get("partial") or {}
+    headers = {}
+    if offset and (partial.get("etag") or partial.get("last_modified")):
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = partial.get("etag") or partial["last_modified"]
+
+    request = urllib.request.Request(DOCS_URL, headers=headers)
+    with urllib.request.urlopen(request, timeout=TIMEOUT_SECONDS) as response:
+        resumed = response.status == 206
+        if not resumed:
+            # Full response: the file changed or the server ignores ranges
+            offset = 0
+            meta["partial"] = validators(response.headers)
+            save_meta(meta)
+        if resumed:
+            print(f"Resuming download at {offset} bytes...")
+        with open(PART_FILE, "ab" if resumed else "wb") as out:
+            while chunk := response.read(CHUNK_SIZE):
+                out.write(chunk)
+
+    if not zipfile.is_zipfile(PART_FILE):
+        PART_FILE.unlink()
+        raise ValueError("downloaded file is not a valid ZIP archive")
+    os.replace(PART_FILE, ZIP_FILE)
+    meta["zip"] = meta.pop("partial", None) or {}
+    save_meta(meta)
 
 
 def download_docs():
-    """Download the Plesk extensions guide ZIP file."""
-    print(f"Downloading Plesk Extensions Guide from {DOCS_URL}...")
+    """Download the Plesk extensions guide ZIP file, unless it is unchanged."""
+    print(f"Downloading {DOCS_NAME} from {DOCS_URL}...")
     try:
-        urllib.request.urlretrieve(DOCS_URL, ZIP_FILE)
+        meta = load_meta()
+        if is_up_to_date(meta):
+            print(f"✓ {ZIP_FILE} is up to date")
+            return True
+        fetch_zip(meta)
         print(f"✓ Downloaded successfully to {ZIP_FILE}")
         return True
     except Exception as e:
@@ -43,7 +153,7 @@ def extract_docs():
     print(f"Extracting to {HTML_DIR}...")
     try:
         # Create html directory if it doesn't exist
-        HTML_DIR.mkdir(exist_ok=True)
+        HTML_DIR.mkdir(parents=True, exist_ok=True)
 
         with zipfile.ZipFile(ZIP_FILE, "r") as zip_ref:
             zip_ref.extractall(HTML_DIR)
@@ -79,8 +189,22 @@ def cleanup_zip():
         print(f"⚠ Warning: Could not remove {ZIP_FILE}: {e}")
 
 
-def main():
+def main(argv=None):
     """Main execution function."""
+    args = sys.argv[1:] if argv is None else argv
+    # Keep the ZIP and index it in place (DOCS_ZIP) instead of extracting it
+    keep_zip = "--no-extract" in args
+    corpus = None
+    if "--corpus" in args:
+        position = args.index("--corpus") + 1
+        name, _, url = (args[position] if position < len(args) else "").partition("=")
+        if not name or not url:
+            print("✗ --corpus expects name=url")
+            sys.exit(1)
+            return
+        use_corpus(name, url)
+        corpus = name
+
     print("=" * 60)
     print("Plesk Extensions Guide Documentation Setup")
     print("=" * 60)
@@ -93,7 +217,7 @@ def main():
     print()
 
     # Extract documentation
-    if not extract_docs():
+    if not keep_zip and not extract_docs():
         sys.exit(1)
 
     print()
@@ -105,7 +229,15 @@ def main():
     print()
 
     # Cleanup
-    cleanup_zip()
+    if keep_zip:
+        if corpus:
+            print(f"Keeping {ZIP_FILE}; add {corpus}={ZIP_FILE} to CORPORA to index it")
+        else:
+            print(f"Keeping {ZIP_FILE}; start the server with DOCS_ZIP={ZIP_FILE} to index it")
+    else:
+        cleanup_zip()
+        if corpus:
+            print(f"Add {corpus}={HTML_DIR} to CORPORA to index it")
 
     print()
     print("=" * 60)
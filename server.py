@@ -1,137 +1,1969 @@
-from fastmcp import FastMCP
+from fastmcp import Context, FastMCP
+from mcp.types import TextContent
 from pathlib import Path
-import chromadb
-from chromadb.utils import embedding_functions
-from bs4 import BeautifulSoup
+# Only FastMCP and light modules load at startup: chromadb, the embedding
+# clients (openai, numpy) and BeautifulSoup are imported on first use, so
+# an MCP client spawning the server per session gets the tool list quickly
+from chunking import CHUNK_OVERLAP_TOKENS, CHUNK_TOKENS, chunk_sections, estimate_tokens
+from query_cache import QueryResultCache, SemanticQueryCache
+from doc_archive import list_zip_members
+from metrics import MetricsRegistry, RequestProfiler, start_prometheus_server
+from lexical_index import BM25Index, is_identifier_query, reciprocal_rank_fusion
+from index_jobs import IndexJob, JobRegistry
+from corpora import CorpusRegistry, parse_corpora
+from parse_cache import ParseCache
+from snippets import snippet
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextlib
+import functools
+import hashlib
+import json
 import os
+import re
+import shutil
+import sys
+import threading
+import time
 
 # Initialize FastMCP
-mcp = FastMCP("plesk-docs-rag", log_level="ERROR")
+@contextlib.asynccontextmanager
+async def lifespan(server):
+    """Warms the server up in the background on its own event loop, so the MCP handshake is not delayed."""
+    task = asyncio.create_task(resources.warm_up()) if WARM_UP_ON_START else None
+    try:
+        yield {}
+    finally:
+        if task is not None:
+            task.cancel()
+
+mcp = FastMCP("plesk-docs-rag", log_level="ERROR", lifespan=lifespan)
 
 # Configuration
-STORAGE_DIR = Path(__file__).parent / "storage"
+PROJECT_ROOT = Path(__file__).parent
+STORAGE_DIR = PROJECT_ROOT / "storage"
 DB_PATH = STORAGE_DIR / "vector_db"
-DOCS_DIR = Path(__file__).parent  # The current folder containing .htm files
+MANIFEST_PATH = STORAGE_DIR / "index_manifest.json"
+EMBEDDING_CACHE_PATH = STORAGE_DIR / "embedding_cache.sqlite3"
+LEXICAL_INDEX_PATH = STORAGE_DIR / "lexical_index.json"
+EMBEDDING_MODEL = "text-embedding-3-small"
+# OpenAI-compatible endpoint of the "openrouter" backend
+EMBEDDING_API_BASE = os.getenv("EMBEDDING_API_BASE", "https://openrouter.ai/api/v1")
+
+# Embedding backend: "openrouter" (API, default), "onnx" (ChromaDB's bundled
+# all-MiniLM-L6-v2, CPU only) or "sentence-transformers" (LOCAL_EMBEDDING_MODEL).
+# The local backends need no API key or network once the model is on disk.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openrouter")
+LOCAL_EMBEDDING_MODEL = os.getenv("LOCAL_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+LOCAL_EMBEDDING_MODEL_DIR = os.getenv("LOCAL_EMBEDDING_MODEL_DIR")
+# Folder of the default corpus's .htm files (default: the project folder);
+# folders of other corpora inside it are left out of its scan
+DOCS_DIR = PROJECT_ROOT / os.getenv("DOCS_DIR", "")
+# Index pages straight from the downloaded ZIP instead of DOCS_DIR
+DOCS_ZIP = os.getenv("DOCS_ZIP")
+COLLECTION_NAME = "plesk_docs"
+
+# Several doc sets in one process: the default corpus is the one above
+# (DOCS_DIR/DOCS_ZIP, the plesk_docs collection, the storage/ files), and
+# CORPORA adds others as comma-separated name=path pairs, each path a folder
+# of .htm files or a documentation ZIP (relative paths start at the project
+# folder). Every added corpus gets its own collection (plesk_docs-<name>) and
+# files under storage/corpora/<name>/; the ChromaDB client and the embedding
+# client are shared. A corpus idle for CORPUS_IDLE_SECONDS has its keyword
+# and compact indexes dropped from memory (0 keeps every corpus loaded).
+DEFAULT_CORPUS = os.getenv("DEFAULT_CORPUS", "extensions-guide")
+CORPORA = os.getenv("CORPORA", "")
+CORPUS_IDLE_SECONDS = float(os.getenv("CORPUS_IDLE_SECONDS", "900"))
+# Passed as `corpus`, searches every corpus and merges the results
+ALL_CORPORA = "all"
+
+# Compact storage. EMBEDDING_DIMENSIONS asks text-embedding-3 models for
+# shorter vectors (0 keeps the model default). COMPACT_INDEX ("int8" or
+# "binary") answers vector searches from quantized vectors held in memory,
+# re-ranking the best COMPACT_RERANK_CANDIDATES exactly against float32
+# vectors memory-mapped from storage/compact_index.
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "0"))
+COMPACT_INDEX = os.getenv("COMPACT_INDEX", "")
+COMPACT_RERANK_CANDIDATES = int(os.getenv("COMPACT_RERANK_CANDIDATES", "100"))
+COMPACT_INDEX_PATH = STORAGE_DIR / "compact_index"
+
+# HNSW graph of the vector collections (unset or 0 keeps ChromaDB's
+# defaults). Space, M and ef_construction shape the graph when a generation
+# is built: changing them rebuilds the index from the stored embeddings on
+# the next index run. ef_search and the batch/sync thresholds are applied to
+# the live collection when it is opened.
+HNSW_SPACE = os.getenv("HNSW_SPACE", "")
+HNSW_M = int(os.getenv("HNSW_M", "0"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "0"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "0"))
+HNSW_BATCH_SIZE = int(os.getenv("HNSW_BATCH_SIZE", "0"))
+HNSW_SYNC_THRESHOLD = int(os.getenv("HNSW_SYNC_THRESHOLD", "0"))
+
+# Blue/green rebuilds: an index run that changes anything builds a new
+# generation (collection plesk_docs_g<N> with its own lexical and compact
+# index) while searches keep using the live one, then switches the alias in
+# storage/index_alias.json once it validates. The newest
+# INDEX_KEEP_GENERATIONS generations are kept, so searches still running on
+# the previous one can finish; older ones are deleted.
+INDEX_ALIAS_PATH = STORAGE_DIR / "index_alias.json"
+# Held by the process running an index run; several server processes (one
+# per MCP session) may share storage/
+INDEX_LOCK_PATH = STORAGE_DIR / "index.lock"
+INDEX_KEEP_GENERATIONS = max(1, int(os.getenv("INDEX_KEEP_GENERATIONS", "2")))
+
+# Index runs are background jobs. Every INDEX_CHECKPOINT_SECONDS they record
+# the pages finished in the new generation, so a cancelled or crashed run
+# resumes from there; wait_for_index_job sends a progress notification
+# every JOB_PROGRESS_INTERVAL_SECONDS.
+INDEX_CHECKPOINT_PATH = STORAGE_DIR / "index_checkpoint.json"
+INDEX_CHECKPOINT_SECONDS = float(os.getenv("INDEX_CHECKPOINT_SECONDS", "30"))
+JOB_PROGRESS_INTERVAL_SECONDS = float(os.getenv("JOB_PROGRESS_INTERVAL_SECONDS", "1"))
+
+# Maximum number of cached embeddings (0 disables the cache)
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "100000"))
+
+# Parsed pages (title and section texts) keyed by path and content hash, so
+# reindexing unchanged pages skips the HTML parser (0 disables the cache)
+PARSE_CACHE = os.getenv("PARSE_CACHE", "1") != "0"
+PARSE_CACHE_PATH = STORAGE_DIR / "parse_cache.pack"
+
+# Recorded per file in the manifest: changing the chunk settings reindexes everything
+CHUNKER = f"sections:{CHUNK_TOKENS}:{CHUNK_OVERLAP_TOKENS}"
+
+# Upper bound on the size of one search result, in characters
+SEARCH_MAX_OUTPUT_CHARS = int(os.getenv("SEARCH_MAX_OUTPUT_CHARS", "12000"))
+
+# Characters per token when a search budget is given in tokens (the indexer's estimate)
+CHARS_PER_TOKEN = 4
+
+# Most queries accepted by one search_extensions_guide_batch call
+SEARCH_BATCH_MAX_QUERIES = int(os.getenv("SEARCH_BATCH_MAX_QUERIES", "16"))
+
+# Formatted search results kept in memory (0 disables the cache), and how long
+# they stay valid; any reindex invalidates them immediately
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "512"))
+SEARCH_CACHE_TTL_SECONDS = float(os.getenv("SEARCH_CACHE_TTL_SECONDS", "3600"))
+
+# Hits of recent queries reused for new queries whose embedding has at least
+# this cosine similarity to theirs (0 entries disables it); same TTL as above
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "256"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+
+# Hybrid retrieval: fuse BM25 and vector rankings with reciprocal rank fusion
+# (RRF_K damps the weight of top ranks). Queries made only of identifiers
+# (pm_Hook_Interface, --flags) that occur verbatim are answered lexically.
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") != "0"
+RRF_K = int(os.getenv("RRF_K", "60"))
 
-# Ensure storage exists
-STORAGE_DIR.mkdir(exist_ok=True)
+# Post-retrieval re-ranking, off by default: "mmr" diversifies a wider pool of
+# RERANK_CANDIDATES (MMR_LAMBDA weighs relevance against diversity), and
+# "cross-encoder" scores it with a local CROSS_ENCODER_MODEL; both may be
+# combined. A query whose re-ranking takes longer than RERANK_BUDGET_MS keeps
+# the retrieval order.
+RERANK = os.getenv("RERANK", "")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "250"))
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+CROSS_ENCODER_MODEL = os.getenv("CROSS_ENCODER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+
+# Timing spans and counters reported by get_server_metrics; with METRICS_PORT
+# they are also served in the Prometheus text format at 127.0.0.1:PORT/metrics
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# One-shot profiler ("cprofile" or "pyinstrument"): once armed, the next tool
+# call slower than PROFILE_THRESHOLD_MS is captured. PROFILE_ON_START arms it
+# when the server starts; get_server_metrics(arm_profiler=True) re-arms it.
+PROFILER = os.getenv("PROFILER", "cprofile")
+PROFILE_THRESHOLD_MS = float(os.getenv("PROFILE_THRESHOLD_MS", "1000"))
+PROFILE_ON_START = os.getenv("PROFILE_ON_START", "0") == "1"
+
+# Open the collection, load its HNSW index and make one embedding call when the
+# server starts, so the first search does not pay for it
+WARM_UP_ON_START = os.getenv("WARM_UP_ON_START", "1") != "0"
+
+# Indexing batches: number of documents per embedding request / upsert, and a
+# rough token ceiling per request (OpenAI-compatible APIs cap the total input)
+INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", "64"))
+INDEX_BATCH_MAX_TOKENS = int(os.getenv("INDEX_BATCH_MAX_TOKENS", "250000"))
+
+# Concurrency: upstream embedding requests in flight across all tool calls, and
+# threads for blocking ChromaDB calls (kept off the MCP event loop)
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+
+# Embedding rate limits of the account (0 = unlimited): the client paces
+# requests below them. On 429 responses it halves these rates and the
+# requests in flight (only the latter without configured limits), then
+# raises them again as requests succeed. 429, 5xx and connection errors are
+# retried up to EMBED_MAX_RETRIES times with jittered backoff, waiting at
+# most EMBED_RETRY_MAX_DELAY_SECONDS (longer Retry-After waits fail).
+EMBED_REQUESTS_PER_MINUTE = int(os.getenv("EMBED_REQUESTS_PER_MINUTE", "0"))
+EMBED_TOKENS_PER_MINUTE = int(os.getenv("EMBED_TOKENS_PER_MINUTE", "0"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "5"))
+EMBED_RETRY_MAX_DELAY_SECONDS = float(os.getenv("EMBED_RETRY_MAX_DELAY_SECONDS", "60"))
+DB_THREADS = int(os.getenv("DB_THREADS", "4"))
 
 # --- Lazy Loading Helpers ---
 
 def get_db_client():
+    import chromadb
+
+    STORAGE_DIR.mkdir(exist_ok=True)
     return chromadb.PersistentClient(path=str(DB_PATH))
 
-def get_embedding_fn():
-    api_key = os.getenv("OPENROUTER_API_KEY")
-    if not api_key:
-        raise ValueError("OPENROUTER_API_KEY not found in environment")
-    return embedding_functions.OpenAIEmbeddingFunction(
-        api_key=api_key,
-        api_base="https://openrouter.ai/api/v1",
-        model_name="text-embedding-3-small"
+_embedding_cache = None
+
+def get_embedding_cache():
+    """Returns the process-wide embedding cache, or None when it is disabled."""
+    global _embedding_cache
+    if EMBEDDING_CACHE_MAX_ENTRIES <= 0:
+        return None
+    if _embedding_cache is None:
+        from embedding_cache import EmbeddingCache
+
+        EMBEDDING_CACHE_PATH.parent.mkdir(exist_ok=True)
+        _embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES)
+    return _embedding_cache
+
+def embedding_model_id():
+    """Identifies the configured embedding model; recorded on the collection and used in cache keys."""
+    if EMBEDDING_BACKEND == "openrouter":
+        return f"{EMBEDDING_MODEL}@{EMBEDDING_DIMENSIONS}" if EMBEDDING_DIMENSIONS else EMBEDDING_MODEL
+    if EMBEDDING_BACKEND == "onnx":
+        return "onnx/all-MiniLM-L6-v2"
+    return f"{EMBEDDING_BACKEND}/{LOCAL_EMBEDDING_MODEL}"
+
+def create_backend_fn():
+    from chromadb.utils import embedding_functions
+
+    if EMBEDDING_BACKEND == "openrouter":
+        api_key = os.getenv("OPENROUTER_API_KEY")
+        if not api_key:
+            raise ValueError("OPENROUTER_API_KEY not found in environment")
+        return embedding_functions.OpenAIEmbeddingFunction(
+            api_key=api_key,
+            api_base=EMBEDDING_API_BASE,
+            model_name=EMBEDDING_MODEL,
+            dimensions=EMBEDDING_DIMENSIONS or None
+        )
+    if EMBEDDING_BACKEND == "onnx":
+        # Batched ONNX Runtime inference on all CPU cores
+        ef = embedding_functions.ONNXMiniLM_L6_V2()
+        if LOCAL_EMBEDDING_MODEL_DIR:
+            # Pre-provisioned model for air-gapped hosts (skips the download)
+            ef.DOWNLOAD_PATH = Path(LOCAL_EMBEDDING_MODEL_DIR)
+        return ef
+    if EMBEDDING_BACKEND == "sentence-transformers":
+        return embedding_functions.SentenceTransformerEmbeddingFunction(
+            model_name=LOCAL_EMBEDDING_MODEL,
+            normalize_embeddings=True
+        )
+    raise ValueError(
+        f"Unknown EMBEDDING_BACKEND {EMBEDDING_BACKEND!r}; "
+        "expected 'openrouter', 'onnx' or 'sentence-transformers'"
     )
 
-# --- Helper: HTML Cleaner ---
+def get_embedding_fn():
+    from embedding_cache import CachedEmbeddingFunction
+
+    ef = create_backend_fn()
+    cache = get_embedding_cache()
+    if cache is None:
+        return ef
+    return CachedEmbeddingFunction(ef, cache, model_name=embedding_model_id())
 
-def parse_sphinx_html(file_path):
+def collection_embedding_fn(ef):
     """
-    Extracts title and clean content from Sphinx-generated HTML.
-    Targeting <div itemprop="articleBody"> to ignore navigation sidebars.
+    The embedding function to register on the ChromaDB collection. Wrappers are
+    unwrapped so the collection config names the real embedding model; the
+    server passes precomputed embeddings, so the wrapper still does the work.
     """
+    from embedding_cache import CachedEmbeddingFunction
+
+    return ef.embedding_function if isinstance(ef, CachedEmbeddingFunction) else ef
+
+def rerank_stages():
+    """The re-ranking stages configured by RERANK."""
+    if not RERANK.strip():
+        return ()
+    from rerank import parse_stages
+
+    return parse_stages(RERANK)
+
+def hnsw_build_settings():
+    """The configured HNSW settings that only take effect when a collection is built."""
+    if HNSW_SPACE not in ("", "cosine", "l2", "ip"):
+        raise ValueError(f"Unknown HNSW_SPACE {HNSW_SPACE!r}; expected 'cosine', 'l2' or 'ip'")
+    settings = {"space": HNSW_SPACE, "max_neighbors": HNSW_M, "ef_construction": HNSW_EF_CONSTRUCTION}
+    return {key: value for key, value in settings.items() if value}
+
+def hnsw_search_settings():
+    """The configured HNSW settings that can be changed on a built collection."""
+    settings = {"ef_search": HNSW_EF_SEARCH, "batch_size": HNSW_BATCH_SIZE, "sync_threshold": HNSW_SYNC_THRESHOLD}
+    return {key: value for key, value in settings.items() if value}
+
+def hnsw_id():
+    """Recorded on each collection and checkpoint: other build settings rebuild the index."""
+    return ",".join(f"{key}={value}" for key, value in sorted(hnsw_build_settings().items()))
+
+def hnsw_current(collection):
+    """True when a collection was built with the configured HNSW build settings."""
+    return (collection.metadata or {}).get("hnsw", "") == hnsw_id()
+
+def apply_search_settings(collection):
+    """Sets the configured ef_search and batch/sync thresholds on a built collection where they differ."""
+    wanted = hnsw_search_settings()
+    if not wanted:
+        return
+    current = (collection.configuration or {}).get("hnsw") or {}
+    changed = {key: value for key, value in wanted.items() if current.get(key) != value}
+    if changed:
+        collection.modify(configuration={"hnsw": changed})
+
+# --- Corpora ---
+
+def corpus_sources():
+    """{name: folder or ZIP} of the corpora configured in CORPORA."""
+    corpora = parse_corpora(CORPORA, PROJECT_ROOT)
+    if DEFAULT_CORPUS in corpora:
+        raise ValueError(f"CORPORA must not redefine the default corpus {DEFAULT_CORPUS!r}")
+    return corpora
+
+def corpus_names():
+    return [DEFAULT_CORPUS, *corpus_sources()]
+
+def corpus_path(path, corpus):
+    """Where a corpus keeps one of the storage/ files (manifest, alias, indexes, ...)."""
+    if corpus == DEFAULT_CORPUS:
+        return path
+    return STORAGE_DIR / "corpora" / corpus / path.name
+
+def corpus_collection(corpus):
+    """Base name of a corpus's collections."""
+    return COLLECTION_NAME if corpus == DEFAULT_CORPUS else f"{COLLECTION_NAME}-{corpus}"
+
+# --- Index Generations ---
+
+def generation_name(generation, corpus=DEFAULT_CORPUS):
+    """Collection of a generation; generation 0 is the collection of unversioned indexes."""
+    name = corpus_collection(corpus)
+    return name if generation == 0 else f"{name}_g{generation}"
+
+def generation_path(path, generation):
+    """Sidecar file (lexical index, compact index) of a generation."""
+    return path if generation == 0 else path.with_name(f"{path.stem}.g{generation}{path.suffix}")
+
+def parse_generation(name, corpus=DEFAULT_CORPUS):
+    """The generation of a collection name of the corpus, or None for other collections."""
+    base = corpus_collection(corpus)
+    if name == base:
+        return 0
+    match = re.fullmatch(rf"{re.escape(base)}_g(\d+)", name)
+    return int(match[1]) if match else None
+
+def load_alias(corpus=DEFAULT_CORPUS):
+    """The serving alias: which generation searches use."""
     try:
-        html_content = file_path.read_text(encoding="utf-8", errors="ignore")
-        soup = BeautifulSoup(html_content, "html.parser")
-
-        # 1. Get Title
-        title = "Untitled"
-        if soup.title:
-            title = soup.title.string.replace(" — Developing Extensions for Plesk", "").strip()
-
-        # 2. Extract Main Content Only
-        # Sphinx docs usually put the real meat inside itemprop="articleBody"
-        main_content = soup.find("div", attrs={"itemprop": "articleBody"})
-        
-        # Fallback if specific tag isn't found
-        if not main_content:
-            main_content = soup.body
-        
-        if main_content:
-            # 3. Clean up noise (scripts, styles, nav links)
-            for tag in main_content(["script", "style", "nav", "footer", "iframe"]):
-                tag.decompose()
-
-            text = main_content.get_text(separator="\n", strip=True)
-        else:
-            text = None
-            
-        return title, text
-    except Exception as e:
-        print(f"Error parsing {file_path.name}: {e}")
-        return "Untitled", None
+        return json.loads(corpus_path(INDEX_ALIAS_PATH, corpus).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {"generation": 0}
+
+def save_alias(alias, corpus=DEFAULT_CORPUS):
+    """Switches the alias atomically: os.replace is the commit point of a rebuild."""
+    path = corpus_path(INDEX_ALIAS_PATH, corpus)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(alias), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+def alias_stamp(corpus=DEFAULT_CORPUS):
+    """Identifies the alias file's current version (None when there is none)."""
+    try:
+        stat = corpus_path(INDEX_ALIAS_PATH, corpus).stat()
+    except OSError:
+        return None
+    # os.replace gives the file a new inode, even within one mtime tick
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+@contextlib.contextmanager
+def index_file_lock(corpus=DEFAULT_CORPUS):
+    """
+    Exclusive lock on a corpus's index for one index run, shared by every
+    server process. Raises RuntimeError when another process holds it.
+    """
+    path = corpus_path(INDEX_LOCK_PATH, corpus)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a+b") as lock_file:
+        try:
+            if os.name == "nt":
+                import msvcrt
+
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            raise RuntimeError("Another server process is indexing this storage; try again when it has finished")
+        # Closing the file releases the lock
+        yield
+
+# --- Shared Resources ---
+
+class CorpusResources:
+    """
+    Collection, keyword index and compact index of one corpus, opened on
+    first use. Dropped by the corpus registry when the corpus goes idle.
+    """
+
+    def __init__(self, shared, corpus):
+        self.shared = shared
+        self.corpus = corpus
+        self._lock = threading.RLock()
+        self._collection = None
+        self._lexical_index = None
+        self._compact_index = None
+        self._generation = None
+        self._alias_stamp = None
+
+    def path(self, path):
+        """The corpus's copy of a storage/ file."""
+        return corpus_path(path, self.corpus)
+
+    @property
+    def generation(self):
+        """The live index generation, read from the alias; refresh_alias() follows later switches."""
+        with self._lock:
+            if self._generation is None:
+                self._alias_stamp = alias_stamp(self.corpus)
+                self._generation = load_alias(self.corpus)["generation"]
+            return self._generation
+
+    def refresh_alias(self):
+        """
+        Follows a switch made by another server process: when the alias file
+        changed since it was read and names another generation, the handles
+        are reopened on it. Returns True when the generation changed.
+        """
+        stamp = alias_stamp(self.corpus)
+        with self._lock:
+            if self._generation is None or stamp == self._alias_stamp:
+                return False
+            self._alias_stamp = stamp
+            generation = load_alias(self.corpus)["generation"]
+            if generation == self._generation:
+                return False
+            self._generation = generation
+            self._collection = None
+            self._lexical_index = None
+            self._compact_index = None
+            return True
+
+    @property
+    def lexical_index(self):
+        with self._lock:
+            if self._lexical_index is None:
+                self._lexical_index = BM25Index.load(generation_path(self.path(LEXICAL_INDEX_PATH), self.generation))
+            return self._lexical_index
+
+    @property
+    def compact_index(self):
+        """The quantized vector index, or None unless COMPACT_INDEX is set."""
+        if not COMPACT_INDEX:
+            return None
+        with self._lock:
+            if self._compact_index is None:
+                from compact_index import CompactIndex
+
+                self._compact_index = CompactIndex.load(
+                    generation_path(self.path(COMPACT_INDEX_PATH), self.generation), COMPACT_INDEX,
+                    dimensions=EMBEDDING_DIMENSIONS or None
+                )
+            return self._compact_index
+
+    def _open_collection(self, create, name):
+        """
+        Opens a collection and returns (collection, None), or (None, model)
+        when it was indexed with a different embedding model.
+        """
+        ef = collection_embedding_fn(self.shared.embedding_fn)
+        try:
+            if create:
+                options = {"metadata": {"embedding_model": embedding_model_id()}}
+                if hnsw := {**hnsw_build_settings(), **hnsw_search_settings()}:
+                    options["metadata"]["hnsw"] = hnsw_id()
+                    options["configuration"] = {"hnsw": hnsw}
+                collection = self.shared.client.get_or_create_collection(name=name, embedding_function=ef, **options)
+            else:
+                collection = self.shared.client.get_collection(name=name, embedding_function=ef)
+        except ValueError as e:
+            # ChromaDB itself refuses a different embedding function type
+            if "Embedding function conflict" not in str(e):
+                raise
+            return None, "a different embedding function"
+
+        # Collections created before the model was recorded carry no entry
+        recorded = (collection.metadata or {}).get("embedding_model")
+        if isinstance(recorded, str) and recorded != embedding_model_id():
+            return None, recorded
+        return collection, None
+
+    def collection(self, create=False):
+        """
+        Returns the collection of the live generation. Without `create`, a
+        missing collection raises like chromadb's get_collection and nothing
+        is cached. A collection indexed with another embedding model raises
+        ValueError.
+        """
+        with self._lock:
+            if self._collection is None:
+                name = generation_name(self.generation, self.corpus)
+                collection, other_model = self._open_collection(create, name)
+                if other_model:
+                    raise ValueError(
+                        f"The '{name}' collection was indexed with {other_model}, but the "
+                        f"server is configured for {embedding_model_id()}. Run index_extensions_guide "
+                        "with force=True to rebuild it."
+                    )
+                if collection is not None:
+                    apply_search_settings(collection)
+                self._collection = collection
+            return self._collection
+
+    def live_collection(self):
+        """The live collection, or None when nothing has been indexed yet."""
+        try:
+            return self.collection()
+        except Exception as e:
+            if "does not exist" not in str(e):
+                raise
+            return None
+
+    def create_generation(self, generation):
+        """
+        Returns an empty (collection, lexical index, compact index or None) for
+        a new generation, replacing whatever an interrupted run left behind.
+        """
+        self.drop_generation(generation)
+        collection, _ = self._open_collection(create=True, name=generation_name(generation, self.corpus))
+        lexical = BM25Index(generation_path(self.path(LEXICAL_INDEX_PATH), generation))
+        compact = None
+        if COMPACT_INDEX:
+            from compact_index import CompactIndex
+
+            compact = CompactIndex(
+                generation_path(self.path(COMPACT_INDEX_PATH), generation), COMPACT_INDEX,
+                dimensions=EMBEDDING_DIMENSIONS or None
+            )
+        return collection, lexical, compact
+
+    def open_generation(self, generation):
+        """
+        The (collection, lexical index, compact index or None) of an unfinished
+        generation, or None when its collection is gone or was built for another model.
+        """
+        try:
+            collection, _ = self._open_collection(create=False, name=generation_name(generation, self.corpus))
+        except Exception as e:
+            if "does not exist" not in str(e):
+                raise
+            return None
+        if collection is None:
+            return None
+        lexical = BM25Index.load(generation_path(self.path(LEXICAL_INDEX_PATH), generation))
+        compact = None
+        if COMPACT_INDEX:
+            from compact_index import CompactIndex
+
+            compact = CompactIndex.load(
+                generation_path(self.path(COMPACT_INDEX_PATH), generation), COMPACT_INDEX,
+                dimensions=EMBEDDING_DIMENSIONS or None
+            )
+        return collection, lexical, compact
+
+    def drop_generation(self, generation):
+        """Deletes the collection and sidecar files of a generation that is not live."""
+        try:
+            self.shared.client.delete_collection(name=generation_name(generation, self.corpus))
+        except Exception as e:
+            if "does not exist" not in str(e):
+                raise
+        generation_path(self.path(LEXICAL_INDEX_PATH), generation).unlink(missing_ok=True)
+        shutil.rmtree(generation_path(self.path(COMPACT_INDEX_PATH), generation), ignore_errors=True)
+
+    def switch(self, generation, collection, lexical, compact):
+        """Points the alias and the shared handles at a new generation."""
+        with self._lock:
+            save_alias(
+                {"generation": generation, "collection": generation_name(generation, self.corpus), "switched_at": time.time()},
+                self.corpus,
+            )
+            self._alias_stamp = alias_stamp(self.corpus)
+            self._generation = generation
+            self._collection = collection
+            self._lexical_index = lexical
+            self._compact_index = compact
+
+    def collect_generations(self):
+        """Drops generations older than the newest INDEX_KEEP_GENERATIONS; returns their numbers."""
+        live = self.generation
+        dropped = []
+        for collection in self.shared.client.list_collections():
+            generation = parse_generation(collection.name, self.corpus)
+            if generation is not None and generation <= live - INDEX_KEEP_GENERATIONS:
+                self.drop_generation(generation)
+                dropped.append(generation)
+        return sorted(dropped)
+
+    def health(self):
+        with self._lock:
+            status = {
+                "collection_open": self._collection is not None,
+                "lexical_documents": len(self._lexical_index) if self._lexical_index is not None else None,
+                "generation": self._generation,
+                "compact_index": self._compact_index.stats() if self._compact_index is not None else None,
+            }
+            if self._collection is not None:
+                try:
+                    status["documents"] = self._collection.count()
+                except Exception as e:
+                    status["last_error"] = str(e)
+        return status
+
+
+class ServerResources:
+    """
+    Process-wide ChromaDB client and embedding clients, and the registry of
+    per-corpus resources. Everything is opened once on first use and shared
+    by all tool calls, so a search only pays for the embedding call and the
+    vector lookup.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._client = None
+        self._embedding_fn = None
+        self._async_embedder = None
+        self._cross_encoder = None
+        self._corpora = None
+        self.ready = False
+        self.last_error = None
+        self.warm_up_seconds = None
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = get_db_client()
+            return self._client
+
+    @property
+    def embedding_fn(self):
+        with self._lock:
+            if self._embedding_fn is None:
+                self._embedding_fn = get_embedding_fn()
+            return self._embedding_fn
+
+    @property
+    def async_embedder(self):
+        with self._lock:
+            if self._async_embedder is None:
+                from embeddings import AsyncEmbedder
+                from rate_limit import RateLimiter, RetryPolicy
+
+                self._async_embedder = AsyncEmbedder(
+                    self.embedding_fn,
+                    max_concurrency=EMBED_CONCURRENCY,
+                    limiter=RateLimiter(EMBED_REQUESTS_PER_MINUTE, EMBED_TOKENS_PER_MINUTE, EMBED_CONCURRENCY),
+                    retry=RetryPolicy(EMBED_MAX_RETRIES, max_delay=EMBED_RETRY_MAX_DELAY_SECONDS),
+                )
+            return self._async_embedder
+
+    @property
+    def cross_encoder(self):
+        """The re-ranking cross-encoder, or None unless RERANK includes it."""
+        if "cross-encoder" not in rerank_stages():
+            return None
+        with self._lock:
+            if self._cross_encoder is None:
+                from rerank import CrossEncoderReranker
+
+                self._cross_encoder = CrossEncoderReranker(CROSS_ENCODER_MODEL)
+            return self._cross_encoder
+
+    @property
+    def corpora(self):
+        with self._lock:
+            if self._corpora is None:
+                self._corpora = CorpusRegistry(
+                    corpus_names(), functools.partial(CorpusResources, self), idle_seconds=CORPUS_IDLE_SECONDS
+                )
+            return self._corpora
+
+    def corpus(self, name=DEFAULT_CORPUS):
+        """The resources of a corpus, opened on first use; ValueError for unknown names."""
+        return self.corpora.get(name)
+
+    async def warm_up(self):
+        """
+        Opens the default corpus's collection and indexes, makes one uncached
+        embedding request through the async embedding client searches use
+        (which also opens its HTTP connection, within the rate limits) and
+        runs a single query so ChromaDB loads the HNSW index into memory.
+        Failures are recorded, not raised.
+        """
+        started = time.perf_counter()
+        try:
+            corpus = self.corpus()
+
+            def open_handles():
+                corpus.lexical_index
+                self.cross_encoder
+                return corpus.collection(), corpus.compact_index
+
+            collection, compact = await run_db(open_handles)
+            embedding = await self.async_embedder.embed_upstream(["warm-up"])
+            if compact is not None:
+                await asyncio.to_thread(compact.search, embedding, 1)
+            elif await run_db(collection.count) > 0:
+                await run_db(collection.query, query_embeddings=embedding, n_results=1)
+            self.ready = True
+            self.last_error = None
+        except Exception as e:
+            self.ready = False
+            self.last_error = str(e)
+            # stdout carries the MCP stdio transport; get_server_health reports the error
+            print(f"Warm-up failed: {e}", file=sys.stderr)
+        self.warm_up_seconds = time.perf_counter() - started
+        return self.ready
+
+    def health(self):
+        """Shared client status, with the default corpus at the top level and every corpus under "corpora"."""
+        with self._lock:
+            status = {
+                "ready": self.ready,
+                "client_open": self._client is not None,
+                "embedding_client": self._async_embedder.stats() if self._async_embedder is not None else None,
+                "warm_up_seconds": self.warm_up_seconds,
+                "last_error": self.last_error,
+            }
+            corpora = self._corpora
+        status["corpora"] = {}
+        if corpora is None:
+            return status
+        for name, state in corpora.stats().items():
+            loaded = corpora.loaded(name)
+            if loaded is not None:
+                state.update(loaded.health())
+                if name == DEFAULT_CORPUS:
+                    error = state.pop("last_error", None)
+                    status.update({key: value for key, value in state.items() if key not in ("loaded", "idle_seconds")})
+                    if error:
+                        status["last_error"] = error
+            status["corpora"][name] = state
+        return status
+
+    def reset(self):
+        """Drops every cached handle, including all corpora; the next call reopens them."""
+        with self._lock:
+            self._client = None
+            self._embedding_fn = None
+            self._async_embedder = None
+            self._cross_encoder = None
+            self._corpora = None
+            self.ready = False
+
+resources = ServerResources()
+
+query_cache = QueryResultCache(max_entries=SEARCH_CACHE_MAX_ENTRIES, ttl_seconds=SEARCH_CACHE_TTL_SECONDS)
+semantic_cache = SemanticQueryCache(
+    max_entries=SEMANTIC_CACHE_MAX_ENTRIES, threshold=SEMANTIC_CACHE_THRESHOLD, ttl_seconds=SEARCH_CACHE_TTL_SECONDS
+)
+
+metrics = MetricsRegistry(enabled=METRICS_ENABLED)
+profiler = RequestProfiler(PROFILER, threshold_ms=PROFILE_THRESHOLD_MS)
+
+def instrumented(stage):
+    """
+    Records the total duration, call and error counts of an async tool under
+    `stage`, and runs it under the request profiler when that is armed.
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            metrics.increment(f"{stage}.calls")
+            with profiler.profile(fn.__name__), metrics.span(f"{stage}.total"):
+                try:
+                    return await fn(*args, **kwargs)
+                except Exception:
+                    metrics.increment(f"{stage}.errors")
+                    raise
+        return wrapper
+    return decorate
+
+_db_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="chromadb")
+# Index runs get their own threads, so searches never queue behind upserts
+_index_db_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="chromadb-index")
+
+async def run_db(fn, *args, **kwargs):
+    """Runs a blocking ChromaDB call on the bounded database thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, functools.partial(fn, *args, **kwargs))
+
+async def run_index_db(fn, *args, **kwargs):
+    """Like run_db, on the threads reserved for index runs."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_index_db_executor, functools.partial(fn, *args, **kwargs))
+
+# --- Helper: Index Manifest ---
+
+def load_manifest(corpus=DEFAULT_CORPUS):
+    """
+    Returns the per-file records of the last indexing run, keyed by path
+    relative to the documentation folder. A missing or unreadable manifest
+    means "nothing indexed yet".
+    """
+    try:
+        return json.loads(corpus_path(MANIFEST_PATH, corpus).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(manifest, corpus=DEFAULT_CORPUS):
+    """Writes the manifest atomically so a crash never leaves it half-written."""
+    path = corpus_path(MANIFEST_PATH, corpus)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(manifest, indent=1, sort_keys=True), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+def list_doc_files(corpus=DEFAULT_CORPUS):
+    """
+    Returns {manifest key: file} for every page to index: the members of
+    the documentation ZIP (DOCS_ZIP for the default corpus) when there is
+    one, otherwise the .htm files under the documentation folder (and
+    subfolders). Files starting with "_" are skipped either way, and so are
+    the folders of other corpora inside the default corpus's folder.
+    """
+    excluded = []
+    if corpus == DEFAULT_CORPUS:
+        docs_dir, docs_zip = DOCS_DIR, DOCS_ZIP
+        excluded = [source.resolve() for source in corpus_sources().values()]
+    else:
+        source = corpus_sources()[corpus]
+        docs_dir, docs_zip = (None, source) if source.suffix.lower() == ".zip" else (source, None)
+    if docs_zip:
+        return {member.member: member for member in list_zip_members(Path(docs_zip))}
+    docs_dir = docs_dir.resolve()
+    return {
+        file_path.relative_to(docs_dir).as_posix(): file_path
+        for file_path in docs_dir.rglob("*.htm")
+        if not file_path.name.startswith("_") and not any(file_path.is_relative_to(folder) for folder in excluded)
+    }
+
+def file_digest(file_path):
+    return hashlib.sha256(file_path.read_bytes()).hexdigest()
+
+# --- Helper: Batching ---
+
+def batch_documents(docs, batch_size, max_tokens):
+    """
+    Groups documents into batches of at most `batch_size` items whose
+    estimated token total stays under `max_tokens`. A single document larger
+    than the budget still gets a batch of its own.
+    """
+    batch = []
+    batch_tokens = 0
+    for doc in docs:
+        tokens = estimate_tokens(doc["document"])
+        if batch and (len(batch) >= batch_size or batch_tokens + tokens > max_tokens):
+            yield batch
+            batch = []
+            batch_tokens = 0
+        batch.append(doc)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+# --- Helper: Change Detection ---
+
+def plan_changes(files, manifest):
+    """
+    Compares the files ({manifest key: file}) with the manifest. Returns
+    (seen, to_parse, removed, unchanged): manifest entries to keep,
+    {file_path: (rel_path, entry)} to (re)index, the manifest entries of
+    removed files, and the unchanged-file count.
+    """
+    seen = {}
+    to_parse = {}
+    unchanged = 0
+    for rel_path, file_path in files.items():
+        stat = file_path.stat()
+        previous = manifest.get(rel_path)
+
+        # mtime + size is the fast path; the content hash is the source of truth.
+        # Files indexed with other chunk settings always count as changed.
+        reusable = previous is not None and previous.get("chunker") == CHUNKER
+        if reusable and previous["mtime"] == stat.st_mtime and previous["size"] == stat.st_size:
+            seen[rel_path] = previous
+            unchanged += 1
+            continue
+        digest = file_digest(file_path)
+        entry = {"sha256": digest, "mtime": stat.st_mtime, "size": stat.st_size, "id": file_path.name, "chunker": CHUNKER}
+        if reusable and previous["sha256"] == digest:
+            seen[rel_path] = entry
+            unchanged += 1
+            continue
+
+        to_parse[file_path] = (rel_path, entry)
+
+    # Files that disappeared since the last run
+    removed = [entry for rel_path, entry in manifest.items() if rel_path not in files]
+    return seen, to_parse, removed, unchanged
+
+# --- Helper: Generation Copy ---
+
+# Chunks copied per get/upsert when carrying unchanged pages into a new generation
+COPY_PAGE_SIZE = 500
+
+def copy_chunks(source, target, ids):
+    """Copies chunks with their stored embeddings, so unchanged pages are not re-embedded."""
+    for start in range(0, len(ids), COPY_PAGE_SIZE):
+        page = source.get(ids=ids[start:start + COPY_PAGE_SIZE], include=["embeddings", "documents", "metadatas"])
+        if len(page["ids"]):
+            target.upsert(
+                ids=page["ids"], embeddings=page["embeddings"], documents=page["documents"], metadatas=page["metadatas"]
+            )
+
+def restore_page(source, target, lexical, compact, filename):
+    """
+    Copies one page's chunks from another generation, with their embeddings,
+    and adds them to the new generation's keyword and compact index.
+    """
+    page = source.get(where={"filename": filename}, include=["embeddings", "documents", "metadatas"])
+    if len(page["ids"]):
+        target.upsert(
+            ids=page["ids"], embeddings=page["embeddings"], documents=page["documents"], metadatas=page["metadatas"]
+        )
+        lexical.add(page["ids"], page["documents"], page["metadatas"])
+        if compact is not None:
+            compact.add(page["ids"], page["embeddings"], [filename] * len(page["ids"]))
+
+def remove_pages(lexical, compact, filenames):
+    """Drops pages from a generation's keyword and compact index; each index is scanned once."""
+    lexical.remove_filenames(filenames)
+    if compact is not None:
+        compact.remove_filenames(filenames)
+
+def write_chunks(collection, lexical, compact, ids, embeddings, documents, metadatas):
+    """
+    Upserts embedded chunks into the new generation and adds them to its
+    keyword and compact index; tokenizing them is CPU work, so this runs on
+    an index thread along with the upsert.
+    """
+    collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+    lexical.add(ids, documents, metadatas)
+    if compact is not None:
+        compact.add(ids, embeddings, [metadata["filename"] for metadata in metadatas])
+
+# --- Helper: Index Checkpoint ---
+
+def load_checkpoint(corpus=DEFAULT_CORPUS):
+    """The checkpoint of an unfinished index run, or None."""
+    try:
+        return json.loads(corpus_path(INDEX_CHECKPOINT_PATH, corpus).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+def save_checkpoint(checkpoint, corpus=DEFAULT_CORPUS):
+    path = corpus_path(INDEX_CHECKPOINT_PATH, corpus)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(checkpoint), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+def clear_checkpoint(corpus=DEFAULT_CORPUS):
+    corpus_path(INDEX_CHECKPOINT_PATH, corpus).unlink(missing_ok=True)
+
+def resumable(checkpoint, live_generation, force):
+    """True when a checkpoint describes the next generation, built with today's settings."""
+    return (
+        checkpoint is not None
+        and checkpoint.get("generation") == live_generation + 1
+        and checkpoint.get("chunker") == CHUNKER
+        and checkpoint.get("embedding_model") == embedding_model_id()
+        and checkpoint.get("compact_index") == COMPACT_INDEX
+        and checkpoint.get("hnsw", "") == hnsw_id()
+        # A forced run only resumes a forced run
+        and (checkpoint.get("force") or not force)
+    )
+
+# --- Helper: Alias ---
+
+def invalidate_search_caches():
+    query_cache.invalidate()
+    semantic_cache.invalidate()
+
+def follow_alias(corpus=DEFAULT_CORPUS):
+    """Picks up a generation switched to by another server process; cached results of the old one are dropped."""
+    if resources.corpus(corpus).refresh_alias():
+        invalidate_search_caches()
+
+def follow_aliases(corpus):
+    """follow_alias for the corpus a search names, or for every corpus with ALL_CORPORA."""
+    for name in corpus_names() if corpus == ALL_CORPORA else [corpus]:
+        follow_alias(name)
 
 # --- Tool 1: Indexing ---
 
-def index_extensions_guide():
+_index_lock = asyncio.Lock()
+index_jobs = JobRegistry()
+
+@instrumented("index")
+async def run_index(batch_size=INDEX_BATCH_SIZE, force=False, job=None, corpus=DEFAULT_CORPUS):
     """
-    Scans the local folder (and subfolders) for .htm files.
+    Runs one index run of a corpus to completion and returns its summary;
+    this is the body of the background job started by index_extensions_guide.
+    Corpora are indexed one at a time, as they share the embedding client.
     """
-    client = get_db_client()
-    ef = get_embedding_fn()
-    
-    collection = client.get_or_create_collection(name="plesk_docs", embedding_function=ef)
-    
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    async with _index_lock:
+        with index_file_lock(corpus):
+            # Build on the generation another process may have switched to
+            follow_alias(corpus)
+            return await build_generation(batch_size, force, job or IndexJob(force, batch_size, corpus), corpus)
+
+async def build_generation(batch_size, force, job, corpus=DEFAULT_CORPUS):
+    from sphinx_html import parse_files, parse_sphinx_sections, parser_id
+
+    # Held for the whole run, even if the registry evicts the corpus meanwhile
+    res = resources.corpus(corpus)
+    embedder = resources.async_embedder
+    cache = embedder.cache
+    cache_before = (cache.hits, cache.misses) if cache is not None else None
+
+    job.set_phase("planning")
+    live_generation = await asyncio.to_thread(lambda: res.generation)
+    generation = live_generation + 1
+    job.generation = generation
+    checkpoint = load_checkpoint(corpus)
+    shadow = None
+    if resumable(checkpoint, live_generation, force):
+        shadow = await run_index_db(res.open_generation, generation)
+    resume = shadow is not None
+    if resume:
+        # Continue the interrupted run: its generation holds the pages recorded in the checkpoint
+        live = None
+        manifest = checkpoint["seen"]
+        job.resumed = True
+    else:
+        # A forced rebuild starts from nothing, so it may also switch embedding models
+        live = None if force else await run_index_db(res.live_collection)
+        manifest = {} if live is None else load_manifest(corpus)
+    if manifest and not resume:
+        live_lexical = await asyncio.to_thread(lambda: res.lexical_index)
+        live_compact = await asyncio.to_thread(lambda: res.compact_index)
+        if await run_index_db(live.count) == 0 or len(live_lexical) == 0 or (
+            live_compact is not None and len(live_compact) == 0
+        ):
+            # The vector store, the lexical index or the compact index was
+            # wiped (or just enabled); the manifest no longer describes them
+            manifest = {}
+
     count = 0
-    
-    # CHANGED: Use rglob("*") to search recursively in all subfolders
-    # We still ignore files starting with "_"
-    files = [f for f in DOCS_DIR.rglob("*.htm") if not f.name.startswith("_")]
-
-    for file_path in files:
-        # ... rest of the loop remains exactly the same ...
-        title, content = parse_sphinx_html(file_path)
-        
-        if content and len(content) > 50:
-            try:
-                context_text = f"Title: {title}\nFile: {file_path.name}\n---\n{content}"
-                
-                collection.upsert(
-                    ids=[file_path.name],
-                    documents=[context_text],
-                    metadatas=[{"title": title, "filename": file_path.name}]
-                )
-                count += 1
-            except Exception as e:
-                print(f"Failed to index {file_path.name}: {e}")
+    chunk_count = 0
+    batches = 0
+    timings = {"parse": 0.0, "embed": 0.0, "write": 0.0}
+
+    def record(stage, started):
+        elapsed = time.perf_counter() - started
+        timings[stage] += elapsed
+        metrics.observe(f"index.{stage}", elapsed)
+
+    files = await asyncio.to_thread(list_doc_files, corpus)
+
+    # Stage 1: find new, changed and removed files
+    with metrics.span("index.plan"):
+        seen, to_parse, removed, unchanged = await asyncio.to_thread(plan_changes, files, manifest)
+    job.files_total = len(to_parse)
+    job.files_unchanged = unchanged
+    job.files_removed = len(removed)
+    if live is not None and not to_parse and not removed and manifest and hnsw_current(live):
+        # Nothing changed: keep serving the live generation
+        save_manifest(seen, corpus)
+        return (
+            f"Indexing Complete. Processed 0 documentation files in 0 batches, 0 chunks, {unchanged} unchanged, "
+            f"0 removed (parse 0.00s, embed 0.00s, write 0.00s). Serving generation {live_generation}."
+        )
+
+    # Stage 2: the new generation, starting from the unchanged pages of the
+    # live one, or from what the interrupted run had written
+    if resume:
+        collection, lexical, compact = shadow
+        stale = [entry["id"] for _, entry in to_parse.values()] + [entry["id"] for entry in removed]
+        await asyncio.to_thread(remove_pages, lexical, compact, stale)
+        for start in range(0, len(stale), COPY_PAGE_SIZE):
+            # Chunks written after the checkpoint are not recorded in it
+            await run_index_db(collection.delete, where={"filename": {"$in": stale[start:start + COPY_PAGE_SIZE]}})
+    else:
+        collection, lexical, compact = await run_index_db(res.create_generation, generation)
+    if manifest and not resume:
+        lexical = await asyncio.to_thread(BM25Index.load, generation_path(res.path(LEXICAL_INDEX_PATH), live_generation))
+        lexical.path = generation_path(res.path(LEXICAL_INDEX_PATH), generation)
+        if compact is not None:
+            compact = await asyncio.to_thread(
+                type(compact).load, generation_path(res.path(COMPACT_INDEX_PATH), live_generation), COMPACT_INDEX,
+                EMBEDDING_DIMENSIONS or None,
+            )
+            compact.path = generation_path(res.path(COMPACT_INDEX_PATH), generation)
+        await asyncio.to_thread(
+            remove_pages, lexical, compact, [entry["id"] for _, entry in to_parse.values()] + [entry["id"] for entry in removed]
+        )
+        job.set_phase("copying")
+        with metrics.span("index.copy"):
+            await run_index_db(copy_chunks, live, collection, lexical.ids())
+        job.chunks_copied = len(lexical)
+
+    last_checkpoint = time.monotonic()
+
+    async def write_checkpoint():
+        """
+        Records the finished pages of the new generation. `seen` is copied
+        first: every page in it is already in the lexical and compact index,
+        which may hold more pages; those are redone on resume.
+        """
+        nonlocal last_checkpoint
+        done = dict(seen)
+        await asyncio.to_thread(lexical.save)
+        if compact is not None:
+            await asyncio.to_thread(compact.save)
+        save_checkpoint({
+            "generation": generation,
+            "chunker": CHUNKER,
+            "embedding_model": embedding_model_id(),
+            "compact_index": COMPACT_INDEX,
+            "hnsw": hnsw_id(),
+            "force": force,
+            "seen": done,
+            "saved_at": time.time(),
+        }, corpus)
+        last_checkpoint = time.monotonic()
+        metrics.increment("index.checkpoints")
+
+    # Stage 3: parse (in parallel) and chunk, streaming upsert-ready records into the batches
+    remaining = {}  # chunks per file not yet written
+    failed = set()
+    parse_cache = None
+    if PARSE_CACHE:
+        parse_cache = await asyncio.to_thread(ParseCache, res.path(PARSE_CACHE_PATH), parser_id())
+        # The current version of every page; the rest drops out of the cache
+        current_pages = [
+            ParseCache.make_key(rel_path, entry["sha256"]) for rel_path, entry in [*seen.items(), *to_parse.values()]
+        ]
+
+    def parsed_pages():
+        """Yields (file_path, title, sections): cached pages first, then the parser's results."""
+        cached = {}
+        if parse_cache is not None:
+            for file_path, (rel_path, entry) in to_parse.items():
+                if (page := parse_cache.get(ParseCache.make_key(rel_path, entry["sha256"]))) is not None:
+                    cached[file_path] = page
+        uncached = [file_path for file_path in to_parse if file_path not in cached]
+        results = parse_files(uncached, parser=parse_sphinx_sections)
+        try:
+            for file_path, page in cached.items():
+                yield (file_path, *page)
+            for file_path, title, sections in results:
+                if parse_cache is not None:
+                    rel_path, entry = to_parse[file_path]
+                    parse_cache.put(ParseCache.make_key(rel_path, entry["sha256"]), title, sections)
+                yield file_path, title, sections
+        finally:
+            results.close()
+            if parse_cache is not None:
+                try:
+                    parse_cache.save(current_pages)
+                except OSError as e:
+                    print(f"Could not save the parse cache: {e}")
+
+    def parsed_documents():
+        results = parsed_pages()
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    file_path, title, sections = next(results)
+                except StopIteration:
+                    return
+                finally:
+                    record("parse", started)
+                job.files_parsed += 1
+                rel_path, entry = to_parse[file_path]
+
+                if sum(len(section["text"]) for section in sections) <= 50:
+                    # Remember files too short to index so they are not re-parsed
+                    seen[rel_path] = entry
+                    job.files_done += 1
+                    continue
+
+                chunks = list(chunk_sections(sections))
+                remaining[rel_path] = len(chunks)
+                for i, chunk in enumerate(chunks):
+                    section_line = f"Section: {chunk['heading']}\n" if chunk["heading"] != title else ""
+                    yield {
+                        "id": f"{file_path.name}#{i}",
+                        "document": f"Title: {title}\n{section_line}File: {file_path.name}\n---\n{chunk['text']}",
+                        "metadata": {
+                            "title": title,
+                            "filename": file_path.name,
+                            "section": chunk["heading"],
+                            "anchor": chunk["anchor"],
+                            "chunk": i,
+                        },
+                        "manifest_key": rel_path,
+                        "manifest_entry": entry,
+                    }
+        finally:
+            # Closing the generator shuts the parser pool down
+            results.close()
+
+    # Stage 4 + 5: one embedding request and one upsert per batch
+    # Batches that failed even after the embedding client's retries; they
+    # get one more try once everything else is written
+    dead_letter = []
+
+    async def write_batch(batch, final=False):
+        nonlocal count, chunk_count, batches
+        documents = [doc["document"] for doc in batch]
+        try:
+            started = time.perf_counter()
+            embeddings = await embedder(documents)
+            record("embed", started)
+
+            started = time.perf_counter()
+            await run_index_db(
+                write_chunks,
+                collection,
+                lexical,
+                compact,
+                ids=[doc["id"] for doc in batch],
+                embeddings=embeddings,
+                documents=documents,
+                metadatas=[doc["metadata"] for doc in batch]
+            )
+            record("write", started)
+            metrics.increment("index.chunks", len(batch))
+            chunk_count += len(batch)
+            job.chunks_embedded = chunk_count
+            batches += 1
+            for doc in batch:
+                # A file is done once all of its chunks are written
+                remaining[doc["manifest_key"]] -= 1
+                if remaining[doc["manifest_key"]] == 0 and doc["manifest_key"] not in failed:
+                    seen[doc["manifest_key"]] = doc["manifest_entry"]
+                    count += 1
+                    job.files_done += 1
+                    metrics.increment("index.files")
+        except Exception as e:
+            if not final:
+                metrics.increment("index.deferred_batches")
+                job.batches_deferred += 1
+                dead_letter.append(batch)
+                return
+            metrics.increment("index.failed_batches")
+            job.batches_failed += 1
+            for doc in batch:
+                remaining[doc["manifest_key"]] -= 1
+                failed.add(doc["manifest_key"])
+            filenames = dict.fromkeys(doc["metadata"]["filename"] for doc in batch)
+            print(f"Failed to index {', '.join(filenames)}: {e}")
+
+    # Parsing blocks, so batches are pulled in a worker thread. One embedding
+    # slot is left free, so searches during a rebuild do not wait for batches.
+    job.set_phase("indexing")
+    max_in_flight = max(1, EMBED_CONCURRENCY - 1)
+    documents = parsed_documents()
+    pending_batches = batch_documents(documents, batch_size, INDEX_BATCH_MAX_TOKENS)
+    in_flight = set()
+    pull = None
+    try:
+        await write_checkpoint()
+        while True:
+            # Shielded, so a cancelled run can wait for the parse thread
+            # before closing the generator it is running
+            pull = asyncio.ensure_future(asyncio.to_thread(next, pending_batches, None))
+            if (batch := await asyncio.shield(pull)) is None:
+                break
+            in_flight.add(asyncio.create_task(write_batch(batch)))
+            if len(in_flight) >= max_in_flight:
+                _, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            if time.monotonic() - last_checkpoint >= INDEX_CHECKPOINT_SECONDS:
+                await write_checkpoint()
+        if in_flight:
+            await asyncio.wait(in_flight)
+        # Retry the dead letters one at a time
+        while dead_letter:
+            await write_batch(dead_letter.pop(0), final=True)
+    except asyncio.CancelledError:
+        # Keep what was written so the next run resumes from here
+        for task in in_flight:
+            task.cancel()
+        await asyncio.gather(*in_flight, return_exceptions=True)
+        if pull is not None:
+            await asyncio.gather(pull, return_exceptions=True)
+        # Closing stops the parser pool without parsing the queued files; off
+        # the event loop, as it waits for the files being parsed right now
+        await asyncio.to_thread(lambda: (pending_batches.close(), documents.close()))
+        await asyncio.shield(write_checkpoint())
+        print(f"Indexing of generation {generation} cancelled after {count} files; the next run resumes it")
+        raise
+
+    # Files that failed twice keep the version the live generation serves;
+    # their old manifest entry makes the next run retry them
+    if failed:
+        previous = None
+        previous_manifest = {}
+        if not force:
+            previous = live if live is not None else await run_index_db(res.live_collection)
+            previous_manifest = load_manifest(corpus) if previous is not None else {}
+        filenames = {rel_path: entry["id"] for rel_path, entry in to_parse.values()}
+        await asyncio.to_thread(remove_pages, lexical, compact, [filenames[rel_path] for rel_path in failed])
+        for rel_path in sorted(failed):
+            filename = filenames[rel_path]
+            await run_index_db(collection.delete, where={"filename": {"$in": [filename]}})
+            job.failed_files.append(filename)
+            if rel_path in previous_manifest:
+                await run_index_db(restore_page, previous, collection, lexical, compact, filename)
+                seen[rel_path] = previous_manifest[rel_path]
+                job.kept_files.append(filename)
+
+    # Stage 6: validate, then switch the alias. The collection must hold
+    # exactly the chunks recorded in the lexical index.
+    job.set_phase("validating")
+    with metrics.span("index.validate"):
+        stored = await run_index_db(collection.count)
+    summary = (
+        f"Processed {count} documentation files in {batches} batches, "
+        f"{chunk_count} chunks, {unchanged} unchanged, {len(removed)} removed "
+        f"(parse {timings['parse']:.2f}s, embed {timings['embed']:.2f}s, write {timings['write']:.2f}s)."
+    )
+    if job.batches_deferred:
+        summary += (
+            f" Retried {job.batches_deferred} failed batches at the end: "
+            f"{job.batches_deferred - job.batches_failed} recovered, {job.batches_failed} failed."
+        )
+    if job.failed_files:
+        lost = [filename for filename in job.failed_files if filename not in job.kept_files]
+        summary += f" {len(job.failed_files)} files failed to index and are retried on the next run"
+        if job.kept_files:
+            summary += f"; kept the previous version of {', '.join(job.kept_files)}"
+        if lost:
+            summary += f"; not indexed: {', '.join(lost)}"
+        summary += "."
+    if stored != len(lexical):
+        metrics.increment("index.failed_generations")
+        await run_index_db(res.drop_generation, generation)
+        clear_checkpoint(corpus)
+        print(f"Generation {generation} failed validation: {stored} chunks stored, {len(lexical)} expected")
+        job.error = f"Generation {generation} failed validation ({stored} chunks stored, {len(lexical)} expected)"
+        return (
+            f"Indexing Aborted. {summary} Generation {generation} failed validation ({stored} chunks stored, "
+            f"{len(lexical)} expected); still serving generation {live_generation}."
+        )
+
+    job.set_phase("switching")
+    await asyncio.to_thread(lexical.save)
+    if compact is not None:
+        await asyncio.to_thread(compact.save)
+    # Failed files are left out of the manifest so the next run retries them
+    await run_index_db(res.switch, generation, collection, lexical, compact)
+    save_manifest(seen, corpus)
+    clear_checkpoint(corpus)
+    # New index generation: cached search results are stale
+    invalidate_search_caches()
+    dropped = await run_index_db(res.collect_generations)
+    metrics.increment("index.generations")
+
+    summary = f"Indexing Complete. {summary} Serving generation {generation}"
+    summary += f", dropped generations {', '.join(map(str, dropped))}." if dropped else "."
+    if cache is not None:
+        summary += (
+            f" Embedding cache: {cache.hits - cache_before[0]} hits, "
+            f"{cache.misses - cache_before[1]} misses."
+        )
+    if parse_cache is not None and to_parse:
+        summary += f" Parse cache: {parse_cache.hits} hits, {parse_cache.misses} misses."
+    return summary
+
+async def index_extensions_guide(batch_size: int = INDEX_BATCH_SIZE, force: bool = False, corpus: str | None = None):
+    """
+    Starts indexing a documentation corpus (the Plesk Extensions Guide unless
+    `corpus` names another one) in the background and returns the job status
+    (with its `job_id`) at once. Scans the corpus folder (and subfolders) for
+    .htm files, or reads them from its documentation ZIP. Only files added or changed since the last run are
+    re-embedded, and entries for deleted files are removed; set `force` to
+    reindex everything. Documents are embedded and written in batches of
+    `batch_size`. Changes are built into a new index generation while searches
+    keep using the live one. Follow the job with get_index_job or
+    wait_for_index_job, stop it with cancel_index_job; a cancelled or
+    interrupted run resumes where it stopped the next time indexing starts.
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1")
+    corpus = corpus or DEFAULT_CORPUS
+    # Raises ValueError for an unknown corpus
+    resources.corpus(corpus)
+    active = index_jobs.active()
+    if active is not None:
+        return {**active.progress(), "message": "An index job is already running"}
+    job = index_jobs.start(
+        IndexJob(force, batch_size, corpus), functools.partial(run_index, batch_size, force, corpus=corpus)
+    )
+    return job.progress()
+
+async def get_index_job(job_id: str | None = None):
+    """
+    Returns the status and progress of an index job (the latest one when
+    `job_id` is omitted): phase, files parsed and written, chunks embedded,
+    throughput, ETA, and the summary once it has finished.
+    """
+    job = index_jobs.get(job_id)
+    if job is None:
+        return {"status": "none", "message": "No index job has run since the server started"}
+    return job.progress()
+
+async def wait_for_index_job(job_id: str | None = None, timeout_seconds: float = 60.0, ctx: Context | None = None):
+    """
+    Waits up to `timeout_seconds` for an index job (the latest one when
+    `job_id` is omitted) to finish, sending progress notifications while it
+    runs, and returns its status.
+    """
+    if timeout_seconds < 0:
+        raise ValueError("timeout_seconds must not be negative")
+    job = index_jobs.get(job_id)
+    if job is None:
+        return {"status": "none", "message": "No index job has run since the server started"}
+    deadline = time.monotonic() + timeout_seconds
+    while not job.done:
+        if ctx is not None:
+            await ctx.report_progress(
+                job.files_done, job.files_total or None, f"{job.phase}: {job.files_done}/{job.files_total} files"
+            )
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        await index_jobs.wait(job, min(remaining, JOB_PROGRESS_INTERVAL_SECONDS))
+    return job.progress()
+
+async def cancel_index_job(job_id: str | None = None):
+    """
+    Cancels a running index job (the latest one when `job_id` is omitted).
+    The live index is untouched; the next index run resumes the cancelled one.
+    """
+    job = index_jobs.cancel(job_id)
+    if job.task is not None:
+        await index_jobs.wait(job, timeout=30)
+    return job.progress()
+
+# --- Helper: Search Output ---
+
+def strip_header(document):
+    """Drops the "Title/File/---" header the indexer prepends to every chunk."""
+    return document.split("\n---\n", 1)[-1]
+
+def merge_page_hits(hits, n_pages):
+    """
+    Groups ranked (document, metadata) chunk hits by page, keeping pages in
+    order of their best chunk and the chunks of each page in reading order.
+    Returns one (document, metadata) per page for the first `n_pages` pages.
+    """
+    pages = {}
+    for document, meta in hits:
+        pages.setdefault((meta.get("corpus"), meta.get("filename")), []).append((document, meta))
 
-    return f"Indexing Complete. Processed {count} documentation files."
+    merged = []
+    for chunks in list(pages.values())[:n_pages]:
+        chunks.sort(key=lambda hit: hit[1].get("chunk", 0))
+        body = "\n[...]\n".join(strip_header(document) for document, _ in chunks)
+        meta = {key: value for key, value in chunks[0][1].items() if key not in ("section", "anchor", "chunk")}
+        merged.append((body, meta))
+    return merged
+
+TRUNCATED = "[output truncated]"
+NO_RESULTS = "No relevant documentation found.\n"
+
+def output_budget(max_chars, max_tokens):
+    """The output size allowed by `max_chars` and, when given, `max_tokens`, in characters."""
+    if max_chars < 1:
+        raise ValueError("max_chars must be at least 1")
+    if max_tokens is None:
+        return max_chars
+    if max_tokens < 1:
+        raise ValueError("max_tokens must be at least 1")
+    return min(max_chars, max_tokens * CHARS_PER_TOKEN)
+
+def format_hits(hits, max_chars, query):
+    """
+    Yields one formatted entry per search hit, as soon as it is formatted.
+    The chunk header the indexer prepends is replaced by the entry's own.
+    Every hit gets an equal share of the budget not used by earlier ones; a
+    longer hit is cut down to its sentences best matching `query`. Joined
+    with newlines, the entries fit in `max_chars`, including the truncation
+    marker when not every hit does.
+    """
+    used = 0
+    for i, (document, meta) in enumerate(hits):
+        title = meta.get("title", "Unknown")
+        filename = meta.get("filename", "unknown.htm")
+        section = meta.get("section")
+        anchor = meta.get("anchor")
+
+        label = f"{title} — {section}" if section and section != title else title
+        location = f"{filename}#{anchor}" if anchor else filename
+        if meta.get("corpus"):
+            location = f"{meta['corpus']}: {location}"
+        heading = f"=== DOC: {label} ({location}) ===\n"
+        body = strip_header(document)
+
+        separator = 1 if i else 0
+        share = (max_chars - used - separator) // (len(hits) - i)
+        if len(heading) + len(body) + 1 > share:
+            body = snippet(body, query, share - len(heading) - 1) or body
+        entry = f"{heading}{body}\n"
+
+        if used + separator + len(entry) > max_chars:
+            room = max_chars - used - separator
+            marker = f"\n{TRUNCATED}\n"
+            # Keep a partial entry only if a useful amount of it fits
+            if room - len(marker) > 200 or (not i and room > len(marker)):
+                yield entry[:room - len(marker)].rstrip() + marker
+            elif room >= len(TRUNCATED):
+                yield TRUNCATED
+            return
+        yield entry
+        used += separator + len(entry)
+
+def fuse_hits(vector_ids, vector_hits, lexical_hits, limit):
+    """
+    Combines the vector ranking (ids with their (document, metadata) hits)
+    and BM25 hits (id, document, metadata, score) with reciprocal rank
+    fusion. Returns the best `limit` (id, (document, metadata)) candidates.
+    """
+    candidates = dict(zip(vector_ids, vector_hits))
+    for doc_id, document, meta, _ in lexical_hits:
+        candidates.setdefault(doc_id, (document, meta))
+    ranking = reciprocal_rank_fusion([vector_ids, [doc_id for doc_id, *_ in lexical_hits]], k=RRF_K)
+    return [(doc_id, candidates[doc_id]) for doc_id in ranking[:limit]]
+
+def query_compact(collection, compact, query_embeddings, n_results):
+    """
+    collection.query() answered by the compact index: ranks ids there and
+    fetches their documents and metadata from the collection in one call.
+    """
+    ranked = compact.search(query_embeddings, n_results, COMPACT_RERANK_CANDIDATES)
+    wanted = list(dict.fromkeys(doc_id for row in ranked for doc_id, _ in row))
+    found = collection.get(ids=wanted, include=["documents", "metadatas"]) if wanted else {"ids": []}
+    records = {
+        doc_id: (document, meta)
+        for doc_id, document, meta in zip(found["ids"], found.get("documents") or [], found.get("metadatas") or [])
+    }
+    results = {"ids": [], "documents": [], "metadatas": []}
+    for row in ranked:
+        # Chunks deleted since the compact index was saved are skipped
+        ids = [doc_id for doc_id, _ in row if doc_id in records]
+        results["ids"].append(ids)
+        results["documents"].append([records[doc_id][0] for doc_id in ids])
+        results["metadatas"].append([records[doc_id][1] for doc_id in ids])
+    return results
+
+async def rerank_hits(collection, query, query_embedding, candidates, n_results, stages):
+    """
+    Re-ranks the (id, (document, metadata)) candidates of one query and
+    returns its best `n_results` hits, or the first `n_results` in retrieval
+    order when re-ranking takes longer than RERANK_BUDGET_MS.
+    """
+    from rerank import rerank
+
+    async def run():
+        embeddings = None
+        ranked = candidates
+        if "mmr" in stages:
+            found = await run_db(collection.get, ids=[doc_id for doc_id, _ in candidates], include=["embeddings"])
+            stored = dict(zip(found["ids"], found["embeddings"]))
+            # Chunks deleted since the search are left out
+            ranked = [(doc_id, hit) for doc_id, hit in candidates if doc_id in stored]
+            embeddings = [stored[doc_id] for doc_id, _ in ranked]
+        cross_encoder = await asyncio.to_thread(lambda: resources.cross_encoder)
+        documents = [document for _, (document, _) in ranked]
+        order = await asyncio.to_thread(
+            rerank, query, query_embedding, documents, embeddings, n_results, MMR_LAMBDA, cross_encoder
+        )
+        return [ranked[i][1] for i in order]
+
+    with metrics.span("search.rerank"):
+        try:
+            return await asyncio.wait_for(run(), RERANK_BUDGET_MS / 1000)
+        except TimeoutError:
+            metrics.increment("search.rerank_fallbacks")
+            return [hit for _, hit in candidates[:n_results]]
+
+async def retrieve_hits(queries, fetch, candidates=None, corpus=DEFAULT_CORPUS, embed=None):
+    """
+    Returns the `fetch` best (document, metadata) hits of a corpus for each
+    query. Queries made only of identifiers found verbatim are answered by
+    the lexical index; the others are embedded in one request (by `embed`,
+    when given) and looked up in one multi-query collection.query, then
+    fused with their BM25 hits. With RERANK set, the best `candidates`
+    (default RERANK_CANDIDATES) of those are re-ranked down to `fetch`.
+    """
+    res = resources.corpus(corpus)
+    stages = rerank_stages()
+    pool = max(candidates or RERANK_CANDIDATES, fetch) if stages else fetch
+
+    lexical_hits = [[] for _ in queries]
+    if HYBRID_SEARCH:
+        with metrics.span("search.lexical"):
+            lexical = await asyncio.to_thread(lambda: res.lexical_index)
+            # BM25 scoring walks every posting of the query terms; keep it off the event loop
+            lexical_hits = await asyncio.to_thread(lambda: [lexical.search(query, pool * 2) for query in queries])
+
+    hits = [None] * len(queries)
+    pending = []
+    for i, query in enumerate(queries):
+        if lexical_hits[i] and is_identifier_query(query) and lexical.has_exact(query):
+            # Exact identifier lookup: BM25 alone ranks it well, so skip the embedding call
+            metrics.increment("search.lexical_only")
+            hits[i] = [(document, meta) for _, document, meta, _ in lexical_hits[i][:fetch]]
+        else:
+            pending.append(i)
+    if not pending:
+        return hits
+
+    with metrics.span("search.open"):
+        embedder = embed or resources.async_embedder
+        collection = await run_db(res.collection)
+        compact = await run_db(lambda: res.compact_index)
+    with metrics.span("search.embed"):
+        query_embeddings = await embedder([queries[i] for i in pending])
+    # Fusion needs a deeper vector ranking than the final result count
+    fused = any(lexical_hits[i] for i in pending)
+    n_vector = pool * 2 if fused else pool
+    with metrics.span("search.query"):
+        if compact is not None:
+            results = await run_db(query_compact, collection, compact, query_embeddings, n_vector)
+        else:
+            results = await run_db(collection.query, query_embeddings=query_embeddings, n_results=n_vector)
+
+    ranked = []
+    for row, i in enumerate(pending):
+        vector_ids, vector_hits = [], []
+        if results["documents"]:
+            vector_ids = results["ids"][row]
+            vector_hits = list(zip(results["documents"][row], results["metadatas"][row]))
+        if lexical_hits[i]:
+            ranked.append(fuse_hits(vector_ids, vector_hits, lexical_hits[i], pool))
+        else:
+            ranked.append(list(zip(vector_ids, vector_hits))[:pool])
+
+    if stages:
+        reranked = await asyncio.gather(*(
+            rerank_hits(collection, queries[i], query_embeddings[row], ranked[row], fetch, stages)
+            for row, i in enumerate(pending)
+        ))
+    else:
+        reranked = [[hit for _, hit in candidates[:fetch]] for candidates in ranked]
+    for row, i in enumerate(pending):
+        hits[i] = reranked[row]
+    return hits
+
+class SharedQueryEmbeddings:
+    """
+    Embeds queries for the corpora of one fan-out search: each query is
+    embedded once, by whichever corpus asks first, and shared with the rest.
+    """
+
+    def __init__(self, embedder):
+        self.embedder = embedder
+        self._requests = {}
+
+    async def __call__(self, queries):
+        missing = list(dict.fromkeys(query for query in queries if query not in self._requests))
+        if missing:
+            request = asyncio.ensure_future(self.embedder(missing))
+            for position, query in enumerate(missing):
+                self._requests[query] = (request, position)
+        embeddings = []
+        for query in queries:
+            request, position = self._requests[query]
+            embeddings.append((await request)[position])
+        return embeddings
+
+def merge_corpus_hits(corpus_hits, limit):
+    """
+    Merges the ranked hits of several corpora ({corpus: [(document,
+    metadata)]}) by reciprocal rank fusion, tagging each hit with its corpus.
+    """
+    candidates = {}
+    rankings = []
+    for corpus, hits in corpus_hits.items():
+        keys = [(corpus, rank) for rank in range(len(hits))]
+        candidates.update((key, (document, {**meta, "corpus": corpus})) for key, (document, meta) in zip(keys, hits))
+        rankings.append(keys)
+    return [candidates[key] for key in reciprocal_rank_fusion(rankings, k=RRF_K)[:limit]]
+
+async def search_corpora(queries, fetch, candidates, corpus, embed=None):
+    """
+    Hits for each query from one corpus, or, for ALL_CORPORA, from every
+    corpus searched in parallel and merged. Corpora not indexed yet are
+    skipped by a fan-out search. Queries are embedded by `embed` when given.
+    """
+    if corpus != ALL_CORPORA:
+        return await retrieve_hits(queries, fetch, candidates, corpus, embed)
+
+    names = corpus_names()
+    embed = embed or SharedQueryEmbeddings(resources.async_embedder)
+
+    async def corpus_hits(name):
+        try:
+            return await retrieve_hits(queries, fetch, candidates, name, embed)
+        except Exception as e:
+            if "does not exist" not in str(e):
+                raise
+            return [[] for _ in queries]
+
+    metrics.increment("search.fan_out")
+    results = await asyncio.gather(*(corpus_hits(name) for name in names))
+    return [
+        merge_corpus_hits({name: hits[i] for name, hits in zip(names, results)}, fetch)
+        for i in range(len(queries))
+    ]
 
 # --- Tool 2: Search ---
 
-def search_extensions_guide(query: str):
+@instrumented("search")
+async def search_extensions_guide(
+    query: str,
+    n_results: int = 3,
+    merge_pages: bool = False,
+    candidates: int | None = None,
+    corpus: str | None = None,
+    max_chars: int | None = None,
+    max_tokens: int | None = None,
+    ctx: Context | None = None,
+):
     """
     Searches the Plesk Extensions Guide (Concepts, How-Tos, Tutorials).
     Use this for general questions about extension structure, lifecycle, UI patterns, and best practices.
+    Returns the `n_results` best-matching sections, one content block each;
+    with `merge_pages`, matching sections are grouped into `n_results` pages
+    instead. When re-ranking is enabled, `candidates` sets how many retrieved
+    sections it chooses from. `corpus` searches another configured doc set
+    instead, or "all" of them. The output stays within `max_chars` (default
+    SEARCH_MAX_OUTPUT_CHARS) and `max_tokens`; sections longer than their
+    share are cut down to the sentences best matching the query. Each
+    section is also sent as a progress notification once it is formatted.
+    A paraphrase of a recent query reuses its hits (see SemanticQueryCache).
     """
-    client = get_db_client()
-    ef = get_embedding_fn()
-    collection = client.get_collection(name="plesk_docs", embedding_function=ef)
+    if n_results < 1:
+        raise ValueError("n_results must be at least 1")
+    if candidates is not None and candidates < 1:
+        raise ValueError("candidates must be at least 1")
+    budget = output_budget(SEARCH_MAX_OUTPUT_CHARS if max_chars is None else max_chars, max_tokens)
+
+    corpus = corpus or DEFAULT_CORPUS
+    follow_aliases(corpus)
+    cache_key = (QueryResultCache.normalize(query), n_results, merge_pages, candidates, corpus, budget)
+    generation = query_cache.generation
+    semantic_generation = semantic_cache.generation
+    cached = query_cache.get(cache_key)
+    if cached is not None:
+        metrics.increment("search.cache_hits")
+        return [TextContent(type="text", text=entry) for entry in cached]
+
+    hits = None
+    embed = None
+    options = (n_results, merge_pages, candidates, corpus)
+    if SEMANTIC_CACHE_MAX_ENTRIES > 0 and not is_identifier_query(query):
+        # Identifier lookups skip the embedding call; they stay on the lexical path
+        embed = SharedQueryEmbeddings(resources.async_embedder)
+        with metrics.span("search.semantic_cache"):
+            # retrieve_hits reuses this embedding on a miss
+            (query_embedding,) = await embed([query])
+            hits = semantic_cache.get(options, query_embedding)
+        if hits is not None:
+            metrics.increment("search.semantic_cache_hits")
+
+    if hits is None:
+        # Pages are assembled from several chunks, so fetch a wider pool when merging
+        fetch = n_results * 4 if merge_pages else n_results
+        (hits,) = await search_corpora([query], fetch, candidates, corpus, embed)
+        if merge_pages:
+            hits = merge_page_hits(hits, n_results)
+        if embed is not None:
+            semantic_cache.put(options, query_embedding, hits, semantic_generation)
 
-    results = collection.query(query_texts=[query], n_results=3)
-    
     output = []
-    if results["documents"]:
-        for i, doc in enumerate(results["documents"][0]):
-            meta = results["metadatas"][0][i]
-            title = meta.get("title", "Unknown")
-            filename = meta.get("filename", "unknown.htm")
-            
-            output.append(f"=== DOC: {title} ({filename}) ===\n{doc}\n")
-    
-    return "\n".join(output) if output else "No relevant documentation found."
+    with metrics.span("search.format"):
+        for entry in format_hits(hits, budget, query):
+            output.append(entry)
+            if ctx is not None:
+                # The client can use the first sections while the rest are formatted
+                await ctx.report_progress(len(output), len(hits), entry)
+    if not output:
+        output = [NO_RESULTS.rstrip()]
+    query_cache.put(cache_key, output, generation)
+    return [TextContent(type="text", text=entry) for entry in output]
+
+# --- Tool 3: Batch Search ---
+
+@instrumented("search_batch")
+async def search_extensions_guide_batch(
+    queries: list[str],
+    n_results: int = 3,
+    max_chars: int = SEARCH_MAX_OUTPUT_CHARS,
+    corpus: str | None = None,
+    max_tokens: int | None = None,
+):
+    """
+    Runs several related searches of the Plesk Extensions Guide (or of the
+    doc set named by `corpus`, or "all" of them) in one call, e.g. the
+    sub-questions of a task. All queries are embedded in one request
+    and looked up in one vector query. Results are grouped per query (up to
+    `n_results` sections each); a section already shown for an earlier query
+    is referenced instead of repeated, and the whole output stays within
+    `max_chars` and `max_tokens`; sections longer than their share are cut
+    down to the sentences best matching their query, and queries whose
+    heading no longer fits are left out.
+    """
+    if n_results < 1:
+        raise ValueError("n_results must be at least 1")
+    max_chars = output_budget(max_chars, max_tokens)
+    # Identical queries (up to case and spacing) are answered once
+    unique = {}
+    for query in queries:
+        if query.strip():
+            unique.setdefault(QueryResultCache.normalize(query), query)
+    unique = list(unique.values())
+    if not unique:
+        raise ValueError("queries must contain at least one non-empty query")
+    if len(unique) > SEARCH_BATCH_MAX_QUERIES:
+        raise ValueError(f"at most {SEARCH_BATCH_MAX_QUERIES} queries per batch")
+    metrics.increment("search_batch.queries", len(unique))
+    corpus = corpus or DEFAULT_CORPUS
+    follow_aliases(corpus)
+
+    all_hits = await search_corpora(unique, n_results, None, corpus)
+
+    with metrics.span("search.format"):
+        output = []
+        used = 0
+        shown = set()
+        for i, (query, hits) in enumerate(zip(unique, all_hits)):
+            header = f"##### Query {i + 1}: {query}\n"
+            # Blocks are joined by newlines, which count against the budget too
+            remaining = max_chars - used - (1 if output else 0)
+            if remaining < len(header):
+                break
+            # Budget left over by short results carries over to the next queries
+            share = max(remaining // (len(unique) - i), len(header))
+            deduped = []
+            for document, meta in hits:
+                deduped.append((document if document not in shown else "(same section as in an earlier result)", meta))
+                shown.add(document)
+            if deduped:
+                entries = list(format_hits(deduped, share - len(header), query))
+            else:
+                entries = [NO_RESULTS] if share - len(header) >= len(NO_RESULTS) else []
+            block = header + "\n".join(entries)
+            used += len(block) + (1 if output else 0)
+            output.append(block)
+    return "\n".join(output)
+
+# --- Tool 4: Health ---
+
+async def get_server_health():
+    """
+    Reports whether the server is ready to answer searches: the vector store
+    and collection are open, the warm-up succeeded, and how many documents
+    are indexed. Also reports search and embedding cache hit rates, and
+    which corpora are loaded.
+    """
+    health = await run_db(resources.health)
+    health["search_cache"] = query_cache.stats()
+    health["semantic_cache"] = semantic_cache.stats()
+    embedding_cache = get_embedding_cache()
+    if embedding_cache is not None:
+        health["embedding_cache"] = await run_db(embedding_cache.stats)
+    return health
+
+# --- Tool 5: Metrics ---
+
+async def get_server_metrics(prometheus: bool = False, arm_profiler: bool = False, profile_threshold_ms: float | None = None):
+    """
+    Reports where time goes inside the server: call and error counters, and
+    latency histograms (count, mean, p50/p95/p99, max in milliseconds) for
+    each search stage (open, lexical, embed, query, rerank, format) and indexing
+    stage (plan, parse per file, embed and write per batch).
+    With `prometheus`, returns the Prometheus text format instead.
+    `arm_profiler` profiles the next tool call slower than
+    `profile_threshold_ms`; its report is returned under "profile".
+    """
+    if arm_profiler:
+        profiler.arm(profile_threshold_ms)
+    if prometheus:
+        return metrics.prometheus_text()
+    snapshot = metrics.snapshot()
+    snapshot["profiler"] = profiler.status()
+    snapshot["profile"] = profiler.last_report
+    return snapshot
+
+# --- Tool 6: Recall ---
+
+async def measure_search_recall(
+    k: int = 10, sample_size: int = 100, ef_search: list[int] | None = None, corpus: str | None = None
+):
+    """
+    Measures the recall@k of the HNSW vector index: `sample_size` stored
+    chunk vectors serve as queries, and the index's top `k` are compared with
+    an exact brute-force search over all stored vectors. Reports the recall
+    and the p50/p95/max query latency of both, with the collection's HNSW
+    settings. With `ef_search`, measures once per value; searches use each
+    value while it is measured, and the configured one is restored after.
+    """
+    if k < 1:
+        raise ValueError("k must be at least 1")
+    if sample_size < 1:
+        raise ValueError("sample_size must be at least 1")
+    if ef_search and min(ef_search) < 1:
+        raise ValueError("ef_search values must be at least 1")
+    from hnsw import collection_settings, sweep_ef_search
+
+    corpus = corpus or DEFAULT_CORPUS
+    follow_alias(corpus)
+    res = resources.corpus(corpus)
+    collection = await run_db(res.collection)
+    results = await run_db(sweep_ef_search, collection, ef_search or [], k, sample_size)
+    return {
+        "corpus": corpus,
+        "generation": res.generation,
+        "settings": collection_settings(collection),
+        "results": results,
+    }
 
 # Register tools with MCP
 mcp.tool(index_extensions_guide)
+mcp.tool(get_index_job)
+mcp.tool(wait_for_index_job)
+mcp.tool(cancel_index_job)
 mcp.tool(search_extensions_guide)
+mcp.tool(search_extensions_guide_batch)
+mcp.tool(get_server_health)
+mcp.tool(get_server_metrics)
+mcp.tool(measure_search_recall)
 
 if __name__ == "__main__":
+    if METRICS_PORT:
+        start_prometheus_server(metrics, METRICS_PORT)
+    if PROFILE_ON_START:
+        profiler.arm()
     mcp.run()
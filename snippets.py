@@ -0,0 +1,64 @@
+"""
+Query-focused snippets of search results.
+
+A section chunk is often much longer than the part that answers the query.
+When a result does not fit its share of the output budget, it is cut down to
+the sentences that share the most terms with the query, kept in reading
+order, with "…" lines marking what was left out. Lines (code, list items,
+table rows) count as sentences of their own.
+"""
+
+import re
+
+from lexical_index import tokenize
+
+GAP = "…"
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=\S)")
+
+
+def split_sentences(text):
+    """The non-empty lines of `text`, split further after sentence-ending punctuation."""
+    sentences = []
+    for line in text.split("\n"):
+        sentences.extend(part for part in SENTENCE_END.split(line.strip()) if part)
+    return sentences
+
+
+def snippet(text, query, max_chars):
+    """
+    `text` cut down to the sentences best matching `query` that fit in
+    `max_chars`, or unchanged when it fits. Sentences score by the query
+    terms they contain, terms found in fewer sentences weighing more; ties
+    and the budget left after the matches go to the earliest sentences.
+    Returns an empty string when not even one sentence fits.
+    """
+    if len(text) <= max_chars:
+        return text
+    sentences = split_sentences(text)
+    terms = set(tokenize(query))
+    sentence_terms = [terms.intersection(tokenize(sentence)) for sentence in sentences]
+    counts = {term: sum(term in found for found in sentence_terms) for term in terms}
+    scores = [sum(1 / counts[term] for term in found) for found in sentence_terms]
+
+    picked = []
+    # A trailing gap line, then per sentence: the sentence, a newline and at most one gap line
+    used = len(GAP)
+    for i in sorted(range(len(sentences)), key=lambda i: (-scores[i], i)):
+        cost = len(sentences[i]) + 2 + len(GAP)
+        if used + cost <= max_chars:
+            picked.append(i)
+            used += cost
+    if not picked:
+        return ""
+
+    lines = []
+    previous = -1
+    for i in sorted(picked):
+        if i != previous + 1:
+            lines.append(GAP)
+        lines.append(sentences[i])
+        previous = i
+    if previous != len(sentences) - 1:
+        lines.append(GAP)
+    return "\n".join(lines)
@@ -0,0 +1,165 @@
+"""
+Sphinx HTML parsing for the indexer.
+
+Kept apart from server.py so parser worker processes only import
+BeautifulSoup, not ChromaDB or FastMCP.
+"""
+
+from bs4 import BeautifulSoup, Comment, NavigableString
+from chunking import (  # noqa: F401  (re-exported)
+    CHUNK_OVERLAP_TOKENS, CHUNK_TOKENS, chunk_sections, chunk_text, estimate_tokens,
+)
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import importlib.util
+import multiprocessing
+import os
+
+# lxml builds the same tree several times faster than the pure-Python
+# "html.parser"; use it when installed unless HTML_PARSER says otherwise
+HTML_PARSER = os.getenv("HTML_PARSER") or (
+    "lxml" if importlib.util.find_spec("lxml") else "html.parser"
+)
+
+# Bump when the parser output changes, so cached results are not reused
+PARSE_VERSION = 1
+
+# Parser processes for indexing, and the smallest number of files worth
+# starting them for (small incremental runs parse in-process)
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(os.cpu_count() or 1)))
+PARSE_POOL_MIN_FILES = int(os.getenv("PARSE_POOL_MIN_FILES", "64"))
+
+# Files queued per parser process; the rest are submitted as results come
+# back, so stopping early leaves little parsing behind
+PARSE_QUEUE_PER_WORKER = 4
+
+# --- HTML Cleaner ---
+
+def load_article(file_path):
+    """
+    Returns (title, main_content) for a Sphinx page, with scripts, styles,
+    navigation and permalink markers removed. main_content is None when the
+    page has no body.
+    """
+    html_content = file_path.read_text(encoding="utf-8", errors="ignore")
+    soup = BeautifulSoup(html_content, HTML_PARSER)
+
+    # 1. Get Title
+    title = "Untitled"
+    if soup.title:
+        title = soup.title.string.replace(" — Developing Extensions for Plesk", "").strip()
+
+    # 2. Extract Main Content Only
+    # Sphinx docs usually put the real meat inside itemprop="articleBody"
+    main_content = soup.find("div", attrs={"itemprop": "articleBody"})
+    
+    # Fallback if specific tag isn't found
+    if not main_content:
+        main_content = soup.body
+    
+    if main_content:
+        # 3. Clean up noise (scripts, styles, nav links, "¶" permalinks)
+        for tag in main_content(["script", "style", "nav", "footer", "iframe"]):
+            tag.decompose()
+        for tag in main_content.find_all("a", class_="headerlink"):
+            tag.decompose()
+
+    return title, main_content
+
+def parse_sphinx_html(file_path):
+    """
+    Extracts title and clean content from Sphinx-generated HTML.
+    Targeting <div itemprop="articleBody"> to ignore navigation sidebars.
+    """
+    try:
+        title, main_content = load_article(file_path)
+        text = main_content.get_text(separator="\n", strip=True) if main_content else None
+        return title, text
+    except Exception as e:
+        print(f"Error parsing {file_path.name}: {e}")
+        return "Untitled", None
+
+# --- Sections ---
+
+def is_section(tag):
+    """Sphinx wraps every heading level in <section> (HTML5) or <div class="section">."""
+    return tag.name == "section" or (tag.name == "div" and "section" in (tag.get("class") or []))
+
+def own_text(element):
+    """Text of an element, leaving out any nested sections."""
+    parts = []
+    for child in element.children:
+        if isinstance(child, NavigableString):
+            if not isinstance(child, Comment) and child.strip():
+                parts.append(child.strip())
+        elif is_section(child):
+            continue
+        elif child.find(is_section):
+            parts.append(own_text(child))
+        else:
+            parts.append(child.get_text(separator="\n", strip=True))
+    return "\n".join(part for part in parts if part)
+
+def parse_sphinx_sections(file_path):
+    """
+    Like parse_sphinx_html, but splits the article on its Sphinx sections.
+    Returns (title, sections), each section a dict with "heading", "anchor"
+    (the section id, usable as #fragment) and "text". Text before the first
+    section, or a page without sections, becomes a section with an empty
+    anchor.
+    """
+    try:
+        title, main_content = load_article(file_path)
+        if not main_content:
+            return title, []
+
+        sections = [{"heading": title, "anchor": "", "text": own_text(main_content)}]
+        for section in main_content.find_all(is_section):
+            heading = section.find(["h1", "h2", "h3", "h4", "h5", "h6"], recursive=False)
+            sections.append({
+                "heading": heading.get_text(" ", strip=True) if heading else title,
+                "anchor": section.get("id", ""),
+                "text": own_text(section),
+            })
+        return title, [section for section in sections if section["text"]]
+    except Exception as e:
+        print(f"Error parsing {file_path.name}: {e}")
+        return "Untitled", []
+
+# --- Parallel Parsing ---
+
+def parser_id():
+    """Identifies the output of parse_sphinx_sections, for caches of it."""
+    return f"sections-{PARSE_VERSION}:{HTML_PARSER}"
+
+def parse_files(file_paths, workers=None, parser=parse_sphinx_html):
+    """
+    Yields (file_path, *parser(file_path)) for every file, in completion order.
+    With more than one worker the files are parsed in a process pool and each
+    result is yielded as soon as it is ready, so the caller can embed and
+    write earlier files while later ones are still parsing.
+    """
+    workers = PARSE_WORKERS if workers is None else workers
+    if workers <= 1 or len(file_paths) < PARSE_POOL_MIN_FILES:
+        for file_path in file_paths:
+            yield (file_path, *parser(file_path))
+        return
+
+    # "spawn" everywhere: forking the multi-threaded server is unsafe
+    context = multiprocessing.get_context("spawn")
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+    remaining = iter(file_paths)
+    futures = {}
+    try:
+        while True:
+            while len(futures) < workers * PARSE_QUEUE_PER_WORKER and (file_path := next(remaining, None)):
+                futures[pool.submit(parser, file_path)] = file_path
+            if not futures:
+                break
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield (futures.pop(future), *future.result())
+        pool.shutdown()
+    finally:
+        # Closed early (a cancelled index run): drop the queued files
+        # instead of waiting for them to be parsed
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,106 @@
+"""Tests for the benchmarks/ suite"""
+
+import json
+import os
+from unittest.mock import patch
+
+import numpy as np
+import openai
+import pytest
+
+import server
+from benchmarks import compact, run
+from benchmarks.corpus import generate_corpus, sample_queries
+from benchmarks.fake_embedding_server import FakeEmbeddingServer, fake_embedding
+from sphinx_html import parse_sphinx_sections
+
+
+class TestCorpus:
+    """Tests for the synthetic Sphinx corpus"""
+
+    def test_pages_parse_into_sections(self, tmp_path):
+        """Test that generated pages have the articleBody/section structure"""
+        generate_corpus(tmp_path, 3)
+
+        pages = sorted(tmp_path.rglob("*.htm"))
+        title, sections = parse_sphinx_sections(pages[0])
+
+        assert len(pages) == 3
+        assert title != "Untitled"
+        assert sections and all(section["anchor"] for section in sections)
+
+    def test_corpus_is_deterministic(self, tmp_path):
+        """Test that a seed always produces the same corpus and queries"""
+        assert generate_corpus(tmp_path / "a", 5, seed=1) == generate_corpus(tmp_path / "b", 5, seed=1)
+        assert sample_queries(10, seed=1) == sample_queries(10, seed=1)
+
+
+class TestFakeEmbeddingServer:
+    """Tests for FakeEmbeddingServer"""
+
+    def test_openai_client_round_trip(self):
+        """Test that the openai client gets deterministic vectors of the requested size"""
+        with FakeEmbeddingServer() as fake:
+            client = openai.OpenAI(api_key="test", base_url=fake.base_url)
+            response = client.embeddings.create(model="text-embedding-3-small", input=["a", "b"], dimensions=8)
+
+        vectors = [data.embedding for data in response.data]
+        assert len(vectors) == 2 and len(vectors[0]) == 8
+        assert np.allclose(vectors[0], fake_embedding("a", 8), atol=1e-6)
+        assert fake.requests == 1
+        assert fake.texts == 2
+
+
+class TestReport:
+    """Tests for the report helpers and an end-to-end run"""
+
+    def test_latency_summary(self):
+        """Test that percentiles are reported in milliseconds"""
+        summary = run.latency_summary([0.001 * i for i in range(1, 101)])
+
+        assert summary["p50"] == pytest.approx(50.5)
+        assert summary["p99"] == pytest.approx(99.01)
+        assert summary["max"] == pytest.approx(100)
+
+    def test_compare(self):
+        """Test that numeric metrics are compared and config is skipped"""
+        baseline = {"config": {"pages": 10}, "search": {"latency_ms": {"p95": 10.0}}}
+        report = {"config": {"pages": 20}, "search": {"latency_ms": {"p95": 12.0}}}
+
+        assert run.compare(baseline, report) == ["search.latency_ms.p95: 10 -> 12 (+20.0%)"]
+
+    def test_end_to_end(self, tmp_path):
+        """Test a tiny benchmark run against the fake embedding server"""
+        output = tmp_path / "report.json"
+        module_state = ["EMBEDDING_API_BASE", "DOCS_DIR", "DOCS_ZIP", "STORAGE_DIR", "DB_PATH", "MANIFEST_PATH",
+                        "EMBEDDING_CACHE_PATH", "LEXICAL_INDEX_PATH", "COMPACT_INDEX_PATH", "INDEX_ALIAS_PATH",
+                        "INDEX_CHECKPOINT_PATH", "INDEX_LOCK_PATH", "PARSE_CACHE_PATH",
+                        "query_cache", "semantic_cache", "_embedding_cache"]
+        with patch.dict(os.environ), \
+             patch.multiple(server, **{name: getattr(server, name) for name in module_state}):
+            run.main(["--pages", "5", "--queries", "4", "--latency-ms", "0",
+                      "--work-dir", str(tmp_path / "work"), "--output", str(output)])
+        server.resources.reset()
+
+        report = json.loads(output.read_text(encoding="utf-8"))
+        assert report["index"]["chunks"] > 0
+        assert set(report["index"]["stages"]) == {"parse", "embed", "write"}
+        assert "5 unchanged" in report["reindex_unchanged"]["summary"]
+        assert "Parse cache: 5 hits, 0 misses." in report["reindex_forced"]["summary"]
+        assert set(report["search"]["latency_ms"]) >= {"p50", "p95", "p99"}
+
+
+class TestCompactReport:
+    """Tests for the compact storage report"""
+
+    def test_synthetic_report(self):
+        """Test that every mode is compared against the float32 baseline"""
+        report = compact.main(["--synthetic", "300", "--queries", "20", "--k", "5", "--dimensions", "256"])
+
+        rows = report["results"]
+        assert rows[0]["mode"] == "float32" and rows[0]["recall"] == 1.0
+        assert [(row["mode"], row["dimensions"]) for row in rows[1:]] == [
+            ("int8", 1536), ("binary", 1536), ("int8", 256), ("binary", 256),
+        ]
+        assert all(0.0 <= row["recall"] <= 1.0 and row["memory_ratio"] < 1.0 for row in rows[1:])
+        assert rows[1]["recall"] > 0.9
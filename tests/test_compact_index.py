@@ -0,0 +1,116 @@
+"""Tests for compact_index.py module"""
+
+import numpy as np
+import pytest
+
+from compact_index import CompactIndex, quantize, recall_at_k, truncate
+
+
+def clustered_vectors(n, dimensions=64, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((8, dimensions))
+    return (centers[rng.integers(0, 8, n)] + 0.5 * rng.standard_normal((n, dimensions))).astype(np.float32)
+
+
+class TestQuantization:
+    """Tests for the quantization helpers"""
+
+    def test_int8_round_trip(self):
+        """Test that int8 codes times their scale reproduce the vector closely"""
+        vectors = truncate(clustered_vectors(10), 64)
+        codes, scales = quantize(vectors, "int8")
+
+        assert codes.dtype == np.int8
+        assert np.abs(codes * scales[:, None] - vectors).max() < 0.01
+
+    def test_binary_packs_sign_bits(self):
+        """Test that binary codes take one bit per dimension"""
+        codes, scales = quantize(np.array([[1.0, -1.0] * 8]), "binary")
+
+        assert scales is None
+        assert codes.tolist() == [[0b10101010, 0b10101010]]
+
+    def test_unknown_mode(self):
+        """Test that an unknown mode is rejected"""
+        with pytest.raises(ValueError, match="Unknown compact mode"):
+            CompactIndex(None, mode="pq")
+
+
+class TestCompactIndex:
+    """Tests for CompactIndex class"""
+
+    @pytest.mark.parametrize("mode", ["int8", "binary"])
+    def test_search_after_save_and_load(self, tmp_path, mode):
+        """Test that a saved index is found again after loading it"""
+        vectors = clustered_vectors(200)
+        index = CompactIndex(tmp_path / "index", mode)
+        index.add([f"page{i}.htm#0" for i in range(200)], vectors, [f"page{i}.htm" for i in range(200)])
+        index.save()
+
+        loaded = CompactIndex.load(tmp_path / "index", mode)
+        (hits,) = loaded.search(vectors[7:8], 3)
+
+        assert len(loaded) == 200
+        assert hits[0][0] == "page7.htm#0"
+        assert hits[0][1] == pytest.approx(1.0, abs=1e-5)
+
+    def test_remove_filenames(self, tmp_path):
+        """Test that removed pages disappear once the index is saved"""
+        index = CompactIndex(tmp_path / "index")
+        index.add(["a.htm#0", "a.htm#1", "b.htm#0", "c.htm#0"], clustered_vectors(4), ["a.htm", "a.htm", "b.htm", "c.htm"])
+        index.save()
+        index.remove_filenames({"a.htm", "c.htm"})
+        index.save()
+
+        assert len(index) == 1
+        assert [doc_id for doc_id, _ in index.search(clustered_vectors(1, seed=1), 5)[0]] == ["b.htm#0"]
+
+    def test_save_with_saved_and_pending_rows(self, tmp_path):
+        """Test that saving again after adding to a saved index keeps every row searchable"""
+        vectors = clustered_vectors(12)
+        index = CompactIndex(tmp_path / "index")
+        index.add([f"page{i}.htm#0" for i in range(6)], vectors[:6], [f"page{i}.htm" for i in range(6)])
+        index.save()
+        index.remove_filenames({"page0.htm"})
+        index.add([f"page{i}.htm#0" for i in range(6, 12)], vectors[6:], [f"page{i}.htm" for i in range(6, 12)])
+        index.save()
+
+        hits = index.search(vectors[[3, 9]], 1)
+
+        assert len(index) == 11
+        assert [found[0][0] for found in hits] == ["page3.htm#0", "page9.htm#0"]
+        assert hits[1][0][1] == pytest.approx(1.0, abs=1e-5)
+
+    def test_mismatched_mode_loads_empty(self, tmp_path):
+        """Test that an index saved in another mode or dimension count is not used"""
+        index = CompactIndex(tmp_path / "index", "int8")
+        index.add(["a.htm#0"], clustered_vectors(1), ["a.htm"])
+        index.save()
+
+        assert len(CompactIndex.load(tmp_path / "index", "binary")) == 0
+        assert len(CompactIndex.load(tmp_path / "index", "int8", dimensions=32)) == 0
+        assert len(CompactIndex.load(tmp_path / "missing", "int8")) == 0
+
+    def test_stats(self, tmp_path):
+        """Test that int8 codes take a quarter of the float32 memory, plus one scale"""
+        index = CompactIndex(tmp_path / "index")
+        index.add([str(i) for i in range(10)], clustered_vectors(10), [""] * 10)
+        index.save()
+
+        stats = index.stats()
+
+        assert stats["float32_bytes"] == 10 * 64 * 4
+        assert stats["bytes_per_vector"] == 64 + 4
+
+
+class TestRecall:
+    """Tests for recall_at_k"""
+
+    def test_rerank_recovers_exact_results(self):
+        """Test that re-ranking enough candidates matches exact search"""
+        vectors = clustered_vectors(500)
+        queries = clustered_vectors(20, seed=1)
+
+        assert recall_at_k(vectors, queries, k=5, mode="int8", candidates=50)["recall"] == 1.0
+        assert recall_at_k(vectors, queries, k=5, mode="binary", candidates=500)["recall"] == 1.0
+        assert recall_at_k(vectors, queries, k=5, mode="binary", candidates=5)["recall"] < 1.0
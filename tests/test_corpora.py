@@ -0,0 +1,117 @@
+"""Tests for corpora.py module"""
+
+from pathlib import Path
+
+import pytest
+
+from corpora import CorpusRegistry, parse_corpora
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestParseCorpora:
+    """Tests for parse_corpora"""
+
+    def test_parses_name_path_pairs(self):
+        """Test that entries are split on commas and equals signs"""
+        corpora = parse_corpora(" api=/srv/api/html , cli=/srv/cli.zip,")
+
+        assert corpora == {"api": Path("/srv/api/html"), "cli": Path("/srv/cli.zip")}
+
+    def test_relative_paths_start_at_root(self):
+        """Test that relative paths are resolved against root and absolute ones are kept"""
+        corpora = parse_corpora("api=docs/api,cli=/srv/cli.zip", Path("/opt/guide"))
+
+        assert corpora == {"api": Path("/opt/guide/docs/api"), "cli": Path("/srv/cli.zip")}
+
+    def test_empty_value(self):
+        """Test that no CORPORA means no extra corpora"""
+        assert parse_corpora("") == {}
+
+    @pytest.mark.parametrize("value, message", [
+        ("api", "expected name=path"),
+        ("api=", "expected name=path"),
+        ("API=/srv/api", "Invalid corpus name 'API'"),
+        ("api_v2=/srv/api", "Invalid corpus name 'api_v2'"),
+        ("api=/a,api=/b", "defined twice"),
+    ])
+    def test_invalid_entries(self, value, message):
+        """Test that malformed entries and names unfit for collection names are rejected"""
+        with pytest.raises(ValueError, match=message):
+            parse_corpora(value)
+
+
+class TestCorpusRegistry:
+    """Tests for CorpusRegistry"""
+
+    def registry(self, idle_seconds=0):
+        clock = FakeClock()
+        opened = []
+
+        def open_fn(name):
+            opened.append(name)
+            return object()
+
+        registry = CorpusRegistry(["guide", "api"], open_fn, idle_seconds=idle_seconds, clock=clock)
+        return registry, clock, opened
+
+    def test_opens_on_first_use(self):
+        """Test that a corpus is opened once, when it is first requested"""
+        registry, _, opened = self.registry()
+
+        first = registry.get("api")
+
+        assert registry.get("api") is first
+        assert opened == ["api"]
+        assert registry.loaded("guide") is None
+
+    def test_unknown_corpus(self):
+        """Test that an unknown corpus is rejected with the available names"""
+        registry, _, _ = self.registry()
+
+        with pytest.raises(ValueError, match="Unknown corpus 'cli'; available: guide, api"):
+            registry.get("cli")
+
+    def test_idle_corpus_is_evicted_on_next_request(self):
+        """Test that using one corpus drops the others idle for idle_seconds"""
+        registry, clock, opened = self.registry(idle_seconds=60)
+        registry.get("api")
+        clock.now = 30
+        registry.get("guide")
+        clock.now = 61
+
+        registry.get("guide")
+
+        assert registry.loaded("api") is None
+        assert registry.loaded("guide") is not None
+        registry.get("api")
+        assert opened == ["api", "guide", "api"]
+        assert registry.evictions == 1
+
+    def test_stats(self):
+        """Test that stats report which corpora are loaded and for how long they have been idle"""
+        registry, clock, _ = self.registry(idle_seconds=60)
+        registry.get("api")
+        clock.now = 30
+
+        assert registry.stats() == {
+            "guide": {"loaded": False, "idle_seconds": None},
+            "api": {"loaded": True, "idle_seconds": 30},
+        }
+
+    def test_zero_idle_seconds_keeps_corpora(self):
+        """Test that idle_seconds 0 never evicts"""
+        registry, clock, _ = self.registry()
+        registry.get("api")
+        clock.now = 10 ** 6
+
+        registry.get("guide")
+
+        assert registry.loaded("api") is not None
+        assert registry.evictions == 0
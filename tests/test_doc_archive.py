@@ -0,0 +1,65 @@
+"""Tests for doc_archive.py module"""
+
+import pickle
+import zipfile
+
+from doc_archive import ZipMember, list_zip_members
+from sphinx_html import parse_sphinx_sections
+
+
+def make_zip(path, pages):
+    with zipfile.ZipFile(path, "w") as archive:
+        for name, html in pages.items():
+            archive.writestr(name, html)
+    return path
+
+
+class TestZipMembers:
+    """Tests for list_zip_members and ZipMember"""
+
+    PAGE = """<html><head><title>Hooks — Developing Extensions for Plesk</title></head><body>
+    <div itemprop="articleBody"><div class="section" id="hooks"><h1>Hooks</h1><p>Hooks react to events.</p></div></div>
+    </body></html>"""
+
+    def test_lists_htm_pages_only(self, tmp_path):
+        """Test that only .htm pages not starting with "_" are listed"""
+        path = make_zip(tmp_path / "guide.zip", {
+            "guide/hooks.htm": self.PAGE,
+            "guide/_search.htm": "",
+            "guide/style.css": "",
+        })
+
+        members = list_zip_members(path)
+
+        assert [member.member for member in members] == ["guide/hooks.htm"]
+        assert members[0].name == "hooks.htm"
+        assert members[0].stat().st_size == len(self.PAGE.encode("utf-8"))
+
+    def test_member_is_parsed_in_place(self, tmp_path):
+        """Test that the HTML parser reads a member without extracting it"""
+        path = make_zip(tmp_path / "guide.zip", {"hooks.htm": self.PAGE})
+        (member,) = list_zip_members(path)
+
+        title, sections = parse_sphinx_sections(member)
+
+        assert title == "Hooks"
+        assert "Hooks react to events." in sections[0]["text"]
+
+    def test_rewritten_archive_is_reopened(self, tmp_path):
+        """Test that reads see the new content after the ZIP is replaced"""
+        path = make_zip(tmp_path / "guide.zip", {"a.htm": "old"})
+        assert list_zip_members(path)[0].read_text() == "old"
+
+        make_zip(path, {"a.htm": "new content"})
+
+        assert list_zip_members(path)[0].read_text() == "new content"
+
+    def test_member_pickles_without_the_archive(self, tmp_path):
+        """Test that members can be sent to parser worker processes"""
+        path = make_zip(tmp_path / "guide.zip", {"a.htm": "page"})
+        (member,) = list_zip_members(path)
+
+        restored = pickle.loads(pickle.dumps(member))
+
+        assert restored == member
+        assert restored.read_bytes() == b"page"
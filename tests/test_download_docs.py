@@ -1,7 +1,10 @@
 """Tests for download_docs.py module"""
 
+import io
 import os
 import tempfile
+import urllib.error
+import zipfile
 from pathlib import Path
 import pytest
 from unittest.mock import MagicMock, patch, mock_open
@@ -19,21 +22,94 @@ def temp_dir():
 class TestDownloadDocs:
     """Tests for download_docs.py module"""
 
-    @patch('urllib.request.urlretrieve')
-    def test_download_docs_success(self, mock_urlretrieve, temp_dir):
-        """Test download_docs function with successful download"""
-        with patch('scripts.download_docs.ZIP_FILE', temp_dir / 'test.zip'):
+    def zip_bytes(self):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            archive.writestr('index.htm', '<html></html>')
+        return buffer.getvalue()
+
+    def response(self, body=b'', status=200, headers=None):
+        response = MagicMock()
+        response.status = status
+        response.headers = headers or {}
+        response.read.side_effect = io.BytesIO(body).read
+        response.__enter__.return_value = response
+        return response
+
+    @pytest.fixture
+    def paths(self, temp_dir):
+        with patch('scripts.download_docs.ZIP_FILE', temp_dir / 'test.zip'), \
+             patch('scripts.download_docs.PART_FILE', temp_dir / 'test.zip.part'), \
+             patch('scripts.download_docs.META_FILE', temp_dir / 'test.zip.json'):
+            yield temp_dir
+
+    def test_download_docs_success(self, paths):
+        """Test that the ZIP is streamed to disk and its validators are saved"""
+        body = self.zip_bytes()
+        with patch('urllib.request.urlopen', return_value=self.response(body, headers={'ETag': '"v1"'})) as mock_urlopen:
             result = download_docs.download_docs()
-            assert result is True
-            mock_urlretrieve.assert_called_once()
 
-    @patch('urllib.request.urlretrieve', side_effect=Exception('Download failed'))
-    def test_download_docs_failure(self, mock_urlretrieve, temp_dir):
+        assert result is True
+        mock_urlopen.assert_called_once()
+        assert (paths / 'test.zip').read_bytes() == body
+        assert not (paths / 'test.zip.part').exists()
+        assert download_docs.load_meta()['zip']['etag'] == '"v1"'
+
+    def test_download_docs_failure(self, paths):
         """Test download_docs function with download failure"""
-        with patch('scripts.download_docs.ZIP_FILE', temp_dir / 'test.zip'):
+        with patch('urllib.request.urlopen', side_effect=Exception('Download failed')):
             result = download_docs.download_docs()
             assert result is False
 
+    def test_unchanged_zip_costs_one_head_request(self, paths):
+        """Test that a 304 on the conditional HEAD skips the download"""
+        (paths / 'test.zip').write_bytes(self.zip_bytes())
+        download_docs.save_meta({'zip': {'etag': '"v1"', 'last_modified': None}})
+        not_modified = urllib.error.HTTPError(download_docs.DOCS_URL, 304, 'Not Modified', {}, None)
+
+        with patch('urllib.request.urlopen', side_effect=not_modified) as mock_urlopen:
+            result = download_docs.download_docs()
+
+        assert result is True
+        request = mock_urlopen.call_args.args[0]
+        assert request.get_method() == 'HEAD'
+        assert request.get_header('If-none-match') == '"v1"'
+
+    def test_changed_zip_is_downloaded(self, paths):
+        """Test that a different remote ETag triggers a download"""
+        (paths / 'test.zip').write_bytes(b'old')
+        download_docs.save_meta({'zip': {'etag': '"v1"', 'last_modified': None}})
+        body = self.zip_bytes()
+        responses = [self.response(headers={'ETag': '"v2"'}), self.response(body, headers={'ETag': '"v2"'})]
+
+        with patch('urllib.request.urlopen', side_effect=responses):
+            assert download_docs.download_docs() is True
+
+        assert (paths / 'test.zip').read_bytes() == body
+        assert download_docs.load_meta()['zip']['etag'] == '"v2"'
+
+    def test_partial_download_is_resumed(self, paths):
+        """Test that an interrupted download continues with a Range request"""
+        body = self.zip_bytes()
+        (paths / 'test.zip.part').write_bytes(body[:10])
+        download_docs.save_meta({'partial': {'etag': '"v1"', 'last_modified': None}})
+
+        with patch('urllib.request.urlopen', return_value=self.response(body[10:], status=206)) as mock_urlopen:
+            assert download_docs.download_docs() is True
+
+        request = mock_urlopen.call_args.args[0]
+        assert request.get_header('Range') == 'bytes=10-'
+        assert request.get_header('If-range') == '"v1"'
+        assert (paths / 'test.zip').read_bytes() == body
+
+    def test_invalid_zip_is_rejected(self, paths):
+        """Test that a non-ZIP response is discarded"""
+        with patch('urllib.request.urlopen', return_value=self.response(b'<html>error page</html>')):
+            assert download_docs.download_docs() is False
+
+        assert not (paths / 'test.zip').exists()
+        assert not (paths / 'test.zip.part').exists()
+
     @patch('zipfile.ZipFile')
     def test_extract_docs_success(self, mock_zip_file, temp_dir):
         """Test extract_docs function with successful extraction"""
@@ -118,13 +194,51 @@ class TestDownloadDocs:
     def test_main_success(self, mock_cleanup, mock_setup, mock_extract, mock_download):
         """Test main function with successful execution"""
         with patch('sys.exit') as mock_exit:
-            download_docs.main()
+            download_docs.main([])
             mock_download.assert_called_once()
             mock_extract.assert_called_once()
             mock_setup.assert_called_once()
             mock_cleanup.assert_called_once()
             mock_exit.assert_not_called()
 
+    @patch('scripts.download_docs.download_docs', return_value=True)
+    @patch('scripts.download_docs.extract_docs')
+    @patch('scripts.download_docs.setup_storage_dir', return_value=True)
+    @patch('scripts.download_docs.cleanup_zip')
+    def test_main_no_extract(self, mock_cleanup, mock_setup, mock_extract, mock_download):
+        """Test that --no-extract keeps the ZIP for in-place indexing"""
+        with patch('sys.exit') as mock_exit:
+            download_docs.main(['--no-extract'])
+            mock_extract.assert_not_called()
+            mock_cleanup.assert_not_called()
+            mock_exit.assert_not_called()
+
+    @patch('scripts.download_docs.download_docs', return_value=True)
+    @patch('scripts.download_docs.extract_docs', return_value=True)
+    @patch('scripts.download_docs.setup_storage_dir', return_value=True)
+    @patch('scripts.download_docs.cleanup_zip')
+    def test_main_corpus(self, mock_cleanup, mock_setup, mock_extract, mock_download, capsys):
+        """Test that --corpus downloads another doc set to its own ZIP and folder"""
+        module = download_docs
+        with patch.multiple(module, DOCS_NAME=module.DOCS_NAME, DOCS_URL=module.DOCS_URL, HTML_DIR=module.HTML_DIR,
+                            ZIP_FILE=module.ZIP_FILE, PART_FILE=module.PART_FILE, META_FILE=module.META_FILE), \
+             patch('sys.exit') as mock_exit:
+            download_docs.main(['--corpus', 'api=https://docs.example.com/api.zip'])
+
+            assert module.DOCS_URL == 'https://docs.example.com/api.zip'
+            assert module.ZIP_FILE == module.PROJECT_ROOT / 'api.zip'
+            assert module.HTML_DIR == module.PROJECT_ROOT / 'docs' / 'api'
+            mock_exit.assert_not_called()
+        assert f"api={module.PROJECT_ROOT / 'docs' / 'api'} to CORPORA" in capsys.readouterr().out
+
+    def test_main_corpus_without_url(self, capsys):
+        """Test that --corpus without name=url is rejected"""
+        with patch('sys.exit') as mock_exit:
+            download_docs.main(['--corpus', 'api'])
+
+        mock_exit.assert_called_once_with(1)
+        assert "--corpus expects name=url" in capsys.readouterr().out
+
     @patch('scripts.download_docs.download_docs', return_value=False)
     @patch('scripts.download_docs.extract_docs')
     @patch('scripts.download_docs.setup_storage_dir')
@@ -132,7 +246,7 @@ class TestDownloadDocs:
     def test_main_download_failure(self, mock_cleanup, mock_setup, mock_extract, mock_download):
         """Test main function with download failure"""
         with patch('sys.exit') as mock_exit:
-            download_docs.main()
+            download_docs.main([])
             mock_download.assert_called_once()
             mock_extract.assert_called_once()  # Extract docs is called but returns False
             mock_setup.assert_called_once()  # Setup storage is called but returns False
@@ -146,7 +260,7 @@ class TestDownloadDocs:
     def test_main_extract_failure(self, mock_cleanup, mock_setup, mock_extract, mock_download):
         """Test main function with extraction failure"""
         with patch('sys.exit') as mock_exit:
-            download_docs.main()
+            download_docs.main([])
             mock_download.assert_called_once()
             mock_extract.assert_called_once()
             mock_setup.assert_called_once()  # Setup storage is called but returns False
@@ -160,7 +274,7 @@ class TestDownloadDocs:
     def test_main_setup_failure(self, mock_cleanup, mock_setup, mock_extract, mock_download):
         """Test main function with storage setup failure"""
         with patch('sys.exit') as mock_exit:
-            download_docs.main()
+            download_docs.main([])
             mock_download.assert_called_once()
             mock_extract.assert_called_once()
             mock_setup.assert_called_once()
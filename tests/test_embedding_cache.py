@@ -0,0 +1,80 @@
+"""Tests for embedding_cache.py module"""
+
+import numpy as np
+import pytest
+from embedding_cache import EmbeddingCache, CachedEmbeddingFunction
+
+
+class FakeEmbeddingFunction:
+    """Deterministic embedding function that records every call"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, input):
+        self.calls.append(list(input))
+        return [np.array([float(len(text)), 1.0], dtype=np.float32) for text in input]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = EmbeddingCache(tmp_path / "cache.sqlite3", max_entries=3)
+    yield cache
+    cache.close()
+
+
+class TestEmbeddingCache:
+    """Tests for EmbeddingCache class"""
+
+    def test_roundtrip(self, cache):
+        """Test that stored vectors come back unchanged"""
+        cache.put_many({"a": [0.5, 1.5]})
+        
+        found = cache.get_many(["a", "b"])
+        
+        assert list(found) == ["a"]
+        np.testing.assert_array_equal(found["a"], np.array([0.5, 1.5], dtype=np.float32))
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    def test_lru_eviction(self, cache):
+        """Test that the least recently used entries are evicted past max_entries"""
+        cache.put_many({"a": [1.0]})
+        cache.put_many({"b": [2.0]})
+        cache.put_many({"c": [3.0]})
+        cache.get_many(["a"])  # "b" is now the oldest
+        cache.put_many({"d": [4.0]})
+        
+        assert len(cache) == 3
+        assert set(cache.get_many(["a", "b", "c", "d"])) == {"a", "c", "d"}
+
+    def test_persists_across_instances(self, tmp_path):
+        """Test that the cache survives reopening the database"""
+        first = EmbeddingCache(tmp_path / "cache.sqlite3")
+        first.put_many({"a": [1.0, 2.0]})
+        first.close()
+        
+        second = EmbeddingCache(tmp_path / "cache.sqlite3")
+        
+        assert "a" in second.get_many(["a"])
+        second.close()
+
+    def test_key_depends_on_model(self):
+        """Test that different models never share cache entries"""
+        assert EmbeddingCache.make_key("model-a", "text") != EmbeddingCache.make_key("model-b", "text")
+
+
+class TestCachedEmbeddingFunction:
+    """Tests for CachedEmbeddingFunction class"""
+
+    def test_only_misses_are_embedded(self, cache):
+        """Test that cached texts are not sent to the wrapped function"""
+        inner = FakeEmbeddingFunction()
+        ef = CachedEmbeddingFunction(inner, cache, model_name="fake")
+        
+        ef(["one", "three"])
+        result = ef(["three", "five", "five"])
+        
+        assert inner.calls == [["one", "three"], ["five"]]
+        assert [float(v[0]) for v in result] == [5.0, 4.0, 4.0]
+        assert cache.stats()["hits"] == 1
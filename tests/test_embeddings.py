@@ -0,0 +1,165 @@
+"""Tests for embeddings.py module"""
+
+import asyncio
+import threading
+import time
+import httpx
+import numpy as np
+import openai
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+from chromadb.utils.embedding_functions import OpenAIEmbeddingFunction
+from embedding_cache import EmbeddingCache, CachedEmbeddingFunction
+from embeddings import AsyncEmbedder
+from rate_limit import RetryPolicy
+
+
+class SlowEmbeddingFunction:
+    """Blocking embedding function that records peak concurrency"""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, input):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            self.calls.append(list(input))
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        return [np.array([float(len(text))], dtype=np.float32) for text in input]
+
+
+class TestAsyncEmbedder:
+    """Tests for AsyncEmbedder class"""
+
+    async def test_plain_function_runs_in_thread(self):
+        """Test that a non-OpenAI function is called once per batch"""
+        inner = SlowEmbeddingFunction(delay=0)
+        embedder = AsyncEmbedder(inner)
+        
+        result = await embedder(["ab", "abc"])
+        
+        assert inner.calls == [["ab", "abc"]]
+        assert [float(v[0]) for v in result] == [2.0, 3.0]
+        assert embedder.cache is None
+
+    async def test_upstream_concurrency_is_bounded(self):
+        """Test that no more than max_concurrency upstream calls run at once"""
+        inner = SlowEmbeddingFunction()
+        embedder = AsyncEmbedder(inner, max_concurrency=2)
+        
+        await asyncio.gather(*(embedder([f"text {i}"]) for i in range(6)))
+        
+        assert inner.peak == 2
+        assert len(inner.calls) == 6
+
+    async def test_cache_hits_skip_upstream(self, tmp_path):
+        """Test that only uncached texts are sent upstream"""
+        cache = EmbeddingCache(tmp_path / "cache.sqlite3")
+        inner = SlowEmbeddingFunction(delay=0)
+        embedder = AsyncEmbedder(CachedEmbeddingFunction(inner, cache, model_name="fake"))
+        
+        await embedder(["one"])
+        result = await embedder(["one", "three"])
+        
+        assert inner.calls == [["one"], ["three"]]
+        assert [float(v[0]) for v in result] == [3.0, 5.0]
+        assert embedder.cache is cache
+        cache.close()
+
+    async def test_openai_function_uses_async_client(self):
+        """Test that OpenAI-compatible functions go through the pooled AsyncOpenAI client"""
+        ef = OpenAIEmbeddingFunction(api_key="test-key", api_base="https://example.invalid/v1", model_name="text-embedding-3-small", dimensions=256)
+        response = SimpleNamespace(data=[SimpleNamespace(embedding=[0.1, 0.2])])
+        
+        with patch("embeddings.openai.AsyncOpenAI") as mock_async_openai:
+            mock_async_openai.return_value.embeddings.create = AsyncMock(return_value=response)
+            embedder = AsyncEmbedder(ef)
+            result = await embedder(["hello"])
+        
+        mock_async_openai.assert_called_once_with(api_key="test-key", base_url="https://example.invalid/v1", max_retries=0)
+        mock_async_openai.return_value.embeddings.create.assert_awaited_once_with(
+            model="text-embedding-3-small", input=["hello"], dimensions=256
+        )
+        np.testing.assert_allclose(result[0], [0.1, 0.2])
+
+
+def api_error(error_class, status, headers=None):
+    """An openai API error with a real HTTP response, as the client raises it"""
+    request = httpx.Request("POST", "https://example.invalid/v1/embeddings")
+    response = httpx.Response(status, headers=headers or {}, request=request)
+    return error_class(f"HTTP {status}", response=response, body=None)
+
+
+class FlakyEmbeddingFunction(SlowEmbeddingFunction):
+    """Raises the queued errors first, then embeds"""
+
+    def __init__(self, errors, delay=0):
+        super().__init__(delay)
+        self.errors = list(errors)
+
+    def __call__(self, input):
+        if self.errors:
+            with self._lock:
+                self.calls.append(list(input))
+            raise self.errors.pop(0)
+        return super().__call__(input)
+
+
+class TestRetries:
+    """Tests for rate-limit handling and retries in AsyncEmbedder"""
+
+    async def test_rate_limited_request_is_retried(self):
+        """Test that a 429 is retried after Retry-After and slows the limiter down"""
+        inner = FlakyEmbeddingFunction([api_error(openai.RateLimitError, 429, {"retry-after-ms": "10"})])
+        embedder = AsyncEmbedder(inner, max_concurrency=4)
+
+        result = await embedder(["text"])
+
+        assert len(inner.calls) == 2
+        assert float(result[0][0]) == 4.0
+        assert embedder.retries == 1
+        assert embedder.limiter.throttled == 1
+        assert embedder.limiter.window == 2
+
+    async def test_bad_request_is_not_retried(self):
+        """Test that a 400 fails at once"""
+        inner = FlakyEmbeddingFunction([api_error(openai.BadRequestError, 400)])
+        embedder = AsyncEmbedder(inner)
+
+        with pytest.raises(openai.BadRequestError):
+            await embedder(["text"])
+
+        assert len(inner.calls) == 1
+        assert embedder.stats()["failures"] == 1
+
+    async def test_retries_give_up(self):
+        """Test that a server error is raised once the retries are used up"""
+        errors = [api_error(openai.InternalServerError, 500) for _ in range(3)]
+        embedder = AsyncEmbedder(FlakyEmbeddingFunction(errors), retry=RetryPolicy(max_retries=2, rng=lambda: 0))
+
+        with pytest.raises(openai.InternalServerError):
+            await embedder(["text"])
+
+        assert embedder.retries == 2
+
+    async def test_backoff_frees_the_concurrency_slot(self):
+        """Test that a request waiting to retry does not hold up other requests"""
+        inner = FlakyEmbeddingFunction([api_error(openai.InternalServerError, 503)])
+        embedder = AsyncEmbedder(inner, max_concurrency=1, retry=RetryPolicy(base_delay=0.2, rng=lambda: 1.0))
+        finished = []
+
+        async def embed(text):
+            await embedder([text])
+            finished.append(text)
+
+        await asyncio.gather(embed("retried"), embed("second"))
+
+        assert finished == ["second", "retried"]
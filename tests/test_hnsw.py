@@ -0,0 +1,104 @@
+"""Tests for hnsw.py module"""
+
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from hnsw import distances, measure_recall, stored_vectors, sweep_ef_search
+
+VECTORS = np.random.default_rng(0).standard_normal((40, 8)).astype(np.float32)
+
+
+class ExactCollection:
+    """Answers queries by exact L2 search; `miss` drops the best neighbour from every answer"""
+
+    def __init__(self, vectors, miss=False, ef_search=100):
+        self.vectors = vectors
+        self.ids = [f"chunk{i}" for i in range(len(vectors))]
+        self.miss = miss
+        self.configuration = {"hnsw": {"space": "l2", "ef_search": ef_search}}
+        self.modified = []
+
+    def get(self, include, limit, offset):
+        return {"ids": self.ids[offset:offset + limit], "embeddings": self.vectors[offset:offset + limit]}
+
+    def query(self, query_embeddings, n_results, include):
+        order = np.argsort(((self.vectors - np.asarray(query_embeddings[0])) ** 2).sum(axis=1))
+        if self.miss:
+            order = np.concatenate([order[:1], order[2:]])
+        return {"ids": [[self.ids[i] for i in order[:n_results]]]}
+
+    def modify(self, configuration):
+        self.modified.append(configuration["hnsw"]["ef_search"])
+        self.configuration["hnsw"].update(configuration["hnsw"])
+
+
+class TestDistances:
+    """Tests for distances"""
+
+    def test_spaces(self):
+        """Test the distance functions of ChromaDB's spaces"""
+        vectors = np.array([[1.0, 0.0], [0.0, 2.0]], dtype=np.float32)
+        query = np.array([1.0, 0.0], dtype=np.float32)
+
+        assert distances(vectors, query, "l2").tolist() == [0.0, 5.0]
+        assert distances(vectors, query, "cosine").tolist() == pytest.approx([0.0, 1.0])
+        assert distances(vectors, query, "ip").tolist() == [0.0, 1.0]
+
+
+class TestStoredVectors:
+    """Tests for stored_vectors"""
+
+    def test_reads_every_page(self):
+        """Test that vectors are read page by page until the collection is exhausted"""
+        with patch("hnsw.PAGE_SIZE", 16):
+            ids, vectors = stored_vectors(ExactCollection(VECTORS))
+
+        assert ids == [f"chunk{i}" for i in range(40)]
+        assert np.array_equal(vectors, VECTORS)
+
+
+class TestMeasureRecall:
+    """Tests for measure_recall and sweep_ef_search"""
+
+    def test_exact_index_has_full_recall(self):
+        """Test that an index answering exactly scores recall 1"""
+        result = measure_recall(ExactCollection(VECTORS), k=5, sample_size=10)
+
+        assert result["recall"] == 1.0
+        assert (result["k"], result["queries"], result["vectors"]) == (5, 10, 40)
+        assert set(result["index_latency_ms"]) == {"p50", "p95", "max"}
+
+    def test_missed_neighbours_lower_recall(self):
+        """Test that the query's own chunk is not counted and a missed neighbour is"""
+        result = measure_recall(ExactCollection(VECTORS, miss=True), k=4, sample_size=10)
+
+        assert result["recall"] == pytest.approx(0.75)
+
+    def test_k_is_capped(self):
+        """Test that k is capped at the number of other chunks"""
+        assert measure_recall(ExactCollection(VECTORS[:3]), k=10)["k"] == 2
+
+    def test_too_few_chunks(self):
+        """Test that one chunk is not enough to measure recall"""
+        with pytest.raises(ValueError, match="at least 2 indexed chunks"):
+            measure_recall(ExactCollection(VECTORS[:1]))
+
+    def test_sweep_restores_ef_search(self):
+        """Test that every ef_search value is measured and the original is set back"""
+        collection = ExactCollection(VECTORS, ef_search=64)
+
+        rows = sweep_ef_search(collection, [10, 200], k=3, sample_size=5)
+
+        assert [row["ef_search"] for row in rows] == [10, 200]
+        assert collection.modified == [10, 200, 64]
+
+    def test_sweep_without_values_measures_current_setting(self):
+        """Test that without values the current ef_search is measured untouched"""
+        collection = ExactCollection(VECTORS, ef_search=64)
+
+        rows = sweep_ef_search(collection, [], k=3, sample_size=5)
+
+        assert rows[0]["ef_search"] == 64
+        assert collection.modified == []
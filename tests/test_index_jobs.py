@@ -0,0 +1,103 @@
+"""Tests for index_jobs.py module"""
+
+import asyncio
+
+import pytest
+
+from index_jobs import IndexJob, JobRegistry
+
+
+class TestIndexJob:
+    """Tests for IndexJob class"""
+
+    def test_progress_before_indexing(self):
+        """Test that a job that has not started reports no rate or ETA"""
+        progress = IndexJob(force=True).progress()
+
+        assert progress["status"] == "pending"
+        assert progress["force"] is True
+        assert progress["files_per_second"] == 0.0
+        assert progress["eta_seconds"] is None
+
+    def test_eta_from_rate(self):
+        """Test that the ETA extrapolates the file rate since indexing started"""
+        job = IndexJob()
+        job.set_phase("indexing")
+        job._indexing_started -= 10
+        job.files_total = 40
+        job.files_done = 10
+
+        progress = job.progress()
+
+        assert progress["files_per_second"] == pytest.approx(1.0, rel=0.01)
+        assert progress["eta_seconds"] == pytest.approx(30.0, rel=0.01)
+
+
+class TestJobRegistry:
+    """Tests for JobRegistry class"""
+
+    async def test_completed_job(self):
+        """Test that a job's summary is kept once it completes"""
+        registry = JobRegistry()
+
+        async def run(job):
+            return "done"
+
+        job = registry.start(IndexJob(), run)
+
+        assert registry.active() is job
+        assert await registry.wait(job, timeout=1)
+        assert job.status == "completed"
+        assert job.summary == "done"
+        assert registry.active() is None
+        assert registry.get() is job
+
+    async def test_failed_job(self, capsys):
+        """Test that an exception fails the job with its message"""
+        registry = JobRegistry()
+
+        async def run(job):
+            raise RuntimeError("boom")
+
+        job = registry.start(IndexJob(), run)
+        await registry.wait(job, timeout=1)
+
+        assert job.status == "failed"
+        assert job.error == "boom"
+        assert "boom" in capsys.readouterr().out
+
+    async def test_cancel(self):
+        """Test that cancelling stops a running job"""
+        registry = JobRegistry()
+
+        async def run(job):
+            await asyncio.sleep(60)
+
+        job = registry.start(IndexJob(), run)
+        await asyncio.sleep(0)
+        registry.cancel(job.id)
+
+        assert await registry.wait(job, timeout=1)
+        assert job.status == "cancelled"
+        assert job.phase == "cancelled"
+
+    async def test_old_jobs_are_forgotten(self):
+        """Test that only the last max_jobs jobs are kept"""
+        registry = JobRegistry(max_jobs=2)
+
+        async def run(job):
+            return "done"
+
+        jobs = []
+        for _ in range(3):
+            jobs.append(registry.start(IndexJob(), run))
+            await registry.wait(jobs[-1], timeout=1)
+
+        with pytest.raises(ValueError, match="Unknown index job"):
+            registry.get(jobs[0].id)
+        assert registry.get(jobs[2].id) is jobs[2]
+
+    def test_nothing_to_cancel(self):
+        """Test that cancelling without any job is rejected"""
+        with pytest.raises(ValueError, match="No index job"):
+            JobRegistry().cancel()
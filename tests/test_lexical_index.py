@@ -0,0 +1,108 @@
+"""Tests for lexical_index.py module"""
+
+from lexical_index import BM25Index, is_identifier_query, reciprocal_rank_fusion, tokenize
+
+
+class TestTokenize:
+    """Tests for tokenize and is_identifier_query"""
+
+    def test_identifiers_are_kept_whole_and_split(self):
+        """Test that compound identifiers yield the whole token and its parts"""
+        tokens = tokenize("Implement pm_Hook_Interface.")
+
+        assert tokens == ["implement", "pm_hook_interface", "pm", "hook", "interface"]
+
+    def test_cli_flags(self):
+        """Test that CLI flags keep their dashes"""
+        assert "--enable-feature" in tokenize("plesk bin extension --enable-feature")
+
+    def test_identifier_queries(self):
+        """Test which queries count as identifier-only"""
+        assert is_identifier_query("pm_Hook_Interface")
+        assert is_identifier_query("--install")
+        assert is_identifier_query("getModuleId")
+        assert not is_identifier_query("how do hooks work")
+        assert not is_identifier_query("")
+
+
+class TestBM25Index:
+    """Tests for BM25Index class"""
+
+    def make_index(self, tmp_path):
+        index = BM25Index(tmp_path / "lexical_index.json")
+        index.add(
+            ["a.htm#0", "b.htm#0", "b.htm#1"],
+            [
+                "Custom buttons are added with pm_Hook_CustomButtons.",
+                "Hooks react to Plesk events.",
+                "Register hooks with pm_Hook_Interface.",
+            ],
+            [{"filename": "a.htm"}, {"filename": "b.htm"}, {"filename": "b.htm"}],
+        )
+        return index
+
+    def test_search_ranks_matching_chunks(self, tmp_path):
+        """Test that the chunk containing the identifier ranks first"""
+        index = self.make_index(tmp_path)
+
+        hits = index.search("pm_Hook_Interface", 3)
+
+        assert hits[0][0] == "b.htm#1"
+        assert hits[0][2] == {"filename": "b.htm"}
+
+    def test_has_exact(self, tmp_path):
+        """Test that only identifiers occurring verbatim match exactly"""
+        index = self.make_index(tmp_path)
+
+        assert index.has_exact("pm_Hook_Interface")
+        assert not index.has_exact("pm_Hook_Missing")
+
+    def test_remove_filenames(self, tmp_path):
+        """Test that every chunk of the given pages is removed"""
+        index = self.make_index(tmp_path)
+
+        index.remove_filenames({"b.htm", "missing.htm"})
+
+        assert len(index) == 1
+        assert index.search("hooks", 3) == []
+
+        index.remove_filenames(["a.htm"])
+
+        assert len(index) == 0
+
+    def test_re_adding_a_chunk_replaces_it(self, tmp_path):
+        """Test that upserting an id does not double-count its terms"""
+        index = self.make_index(tmp_path)
+        index.add(["a.htm#0"], ["Something else entirely."], [{"filename": "a.htm"}])
+
+        assert len(index) == 3
+        assert index.search("buttons", 3) == []
+
+    def test_save_and_load(self, tmp_path):
+        """Test that a saved index ranks the same after loading"""
+        index = self.make_index(tmp_path)
+        index.save()
+
+        loaded = BM25Index.load(tmp_path / "lexical_index.json")
+
+        assert len(loaded) == 3
+        assert loaded.search("register hooks", 2) == index.search("register hooks", 2)
+
+    def test_load_missing_or_corrupt(self, tmp_path):
+        """Test that an unreadable file gives an empty index"""
+        path = tmp_path / "lexical_index.json"
+        assert len(BM25Index.load(path)) == 0
+
+        path.write_text("{not json", encoding="utf-8")
+        assert len(BM25Index.load(path)) == 0
+
+
+class TestReciprocalRankFusion:
+    """Tests for reciprocal_rank_fusion"""
+
+    def test_ids_ranked_by_both_lists_win(self):
+        """Test that an id high in both rankings beats ids found by one"""
+        fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d", "e"]])
+
+        assert fused[0] == "b"
+        assert set(fused) == {"a", "b", "c", "d", "e"}
@@ -0,0 +1,120 @@
+"""Tests for metrics.py module"""
+
+import time
+import urllib.request
+
+import pytest
+
+from metrics import Histogram, MetricsRegistry, RequestProfiler, start_prometheus_server
+
+
+class TestHistogram:
+    """Tests for Histogram class"""
+
+    def test_quantiles_are_bucket_estimates(self):
+        """Test that quantiles fall inside the right bucket"""
+        histogram = Histogram()
+        for _ in range(90):
+            histogram.observe(0.002)
+        for _ in range(10):
+            histogram.observe(0.2)
+
+        assert 0.001 < histogram.quantile(0.5) <= 0.0025
+        assert 0.1 < histogram.quantile(0.99) <= 0.2
+        assert histogram.summary()["max"] == 0.2
+        assert histogram.summary()["count"] == 100
+
+    def test_empty(self):
+        """Test that an empty histogram reports zeros"""
+        assert Histogram().summary()["p95"] == 0.0
+
+
+class TestMetricsRegistry:
+    """Tests for MetricsRegistry class"""
+
+    def test_span_and_counter(self):
+        """Test that spans and counters appear in the snapshot"""
+        registry = MetricsRegistry()
+        with registry.span("search.embed"):
+            time.sleep(0.01)
+        registry.increment("search.calls")
+        registry.increment("search.calls", 2)
+
+        snapshot = registry.snapshot()
+
+        assert snapshot["counters"] == {"search.calls": 3}
+        assert snapshot["timings_ms"]["search.embed"]["count"] == 1
+        assert snapshot["timings_ms"]["search.embed"]["max"] >= 10
+
+    def test_disabled_registry_records_nothing(self):
+        """Test that METRICS_ENABLED=0 turns spans into no-ops"""
+        registry = MetricsRegistry(enabled=False)
+        with registry.span("search.embed"):
+            pass
+        registry.increment("search.calls")
+
+        assert registry.snapshot()["counters"] == {}
+        assert registry.snapshot()["timings_ms"] == {}
+
+    def test_prometheus_text(self):
+        """Test the Prometheus exposition of counters and histograms"""
+        registry = MetricsRegistry()
+        registry.increment("search.calls")
+        registry.observe("search.total", 0.003)
+        registry.observe("search.total", 0.3)
+
+        text = registry.prometheus_text()
+
+        assert "# TYPE plesk_docs_search_calls_total counter\nplesk_docs_search_calls_total 1" in text
+        assert 'plesk_docs_search_total_seconds_bucket{le="0.005"} 1' in text
+        assert 'plesk_docs_search_total_seconds_bucket{le="+Inf"} 2' in text
+        assert "plesk_docs_search_total_seconds_count 2" in text
+
+    def test_prometheus_endpoint(self):
+        """Test that /metrics serves the text format"""
+        registry = MetricsRegistry()
+        registry.increment("index.calls")
+        httpd = start_prometheus_server(registry, 0)
+        try:
+            port = httpd.server_address[1]
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+                body = response.read().decode("utf-8")
+                content_type = response.headers["Content-Type"]
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+
+        assert "plesk_docs_index_calls_total 1" in body
+        assert content_type.startswith("text/plain")
+
+
+class TestRequestProfiler:
+    """Tests for RequestProfiler class"""
+
+    def test_unarmed_profiler_is_a_no_op(self):
+        """Test that nothing is captured unless armed"""
+        profiler = RequestProfiler(threshold_ms=0)
+        with profiler.profile("search"):
+            pass
+
+        assert profiler.last_report is None
+
+    def test_captures_first_slow_request_and_disarms(self):
+        """Test that a slow call is captured once with cProfile"""
+        profiler = RequestProfiler(threshold_ms=5)
+        profiler.arm()
+        with profiler.profile("fast"):
+            pass
+        assert profiler.armed
+
+        with profiler.profile("slow"):
+            time.sleep(0.01)
+
+        assert not profiler.armed
+        assert profiler.last_report["request"] == "slow"
+        assert "function calls" in profiler.last_report["report"]
+
+    def test_unknown_backend(self):
+        """Test that an unknown profiler is rejected when armed"""
+        with pytest.raises(ValueError, match="Unknown profiler"):
+            RequestProfiler(backend="perf").arm()
@@ -0,0 +1,53 @@
+"""Tests for parse_cache.py module"""
+
+from parse_cache import ParseCache
+
+SECTIONS = [{"heading": "Hooks", "anchor": "hooks", "text": "Register a hook."}]
+
+
+class TestParseCache:
+    """Tests for ParseCache"""
+
+    def test_round_trip(self, tmp_path):
+        """Test that saved pages are read back by a new cache"""
+        key = ParseCache.make_key("guide/hooks.htm", "abc")
+        cache = ParseCache(tmp_path / "parse_cache.pack", "sections-1:lxml")
+        cache.put(key, "Hooks", SECTIONS)
+        cache.save([key])
+
+        reopened = ParseCache(tmp_path / "parse_cache.pack", "sections-1:lxml")
+
+        assert reopened.get(key) == ("Hooks", SECTIONS)
+        assert reopened.get(ParseCache.make_key("guide/hooks.htm", "def")) is None
+        assert reopened.stats() == {"hits": 1, "misses": 1, "pages": 1}
+
+    def test_save_drops_pages_not_kept(self, tmp_path):
+        """Test that pages missing from `keep` are left out of the pack"""
+        cache = ParseCache(tmp_path / "parse_cache.pack", "sections-1:lxml")
+        cache.put("old", "Old", SECTIONS)
+        cache.put("new", "New", SECTIONS)
+
+        cache.save(["new", "unparsed"])
+
+        assert len(ParseCache(tmp_path / "parse_cache.pack", "sections-1:lxml")) == 1
+
+    def test_other_parser_version_is_ignored(self, tmp_path):
+        """Test that a pack written by another parser starts the cache empty"""
+        cache = ParseCache(tmp_path / "parse_cache.pack", "sections-1:lxml")
+        cache.put("key", "Hooks", SECTIONS)
+        cache.save(["key"])
+
+        assert len(ParseCache(tmp_path / "parse_cache.pack", "sections-2:lxml")) == 0
+
+    def test_corrupt_pack_is_ignored(self, tmp_path):
+        """Test that an unreadable pack starts the cache empty"""
+        (tmp_path / "parse_cache.pack").write_bytes(b"not zlib")
+
+        assert len(ParseCache(tmp_path / "parse_cache.pack", "sections-1:lxml")) == 0
+
+    def test_unchanged_cache_is_not_rewritten(self, tmp_path):
+        """Test that saving without changes leaves the pack alone"""
+        path = tmp_path / "parse_cache.pack"
+        ParseCache(path, "sections-1:lxml").save([])
+
+        assert not path.exists()
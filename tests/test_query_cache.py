@@ -0,0 +1,154 @@
+"""Tests for query_cache.py module"""
+
+from unittest.mock import patch
+import pytest
+
+from query_cache import QueryResultCache, SemanticQueryCache
+
+
+class TestQueryResultCache:
+    """Tests for QueryResultCache class"""
+
+    def test_hit_and_miss(self):
+        """Test that stored results are returned and counted"""
+        cache = QueryResultCache()
+        
+        assert cache.get("q") is None
+        cache.put("q", "result", cache.generation)
+        
+        assert cache.get("q") == "result"
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+        assert cache.stats()["hit_rate"] == 0.5
+
+    def test_normalize(self):
+        """Test that case and whitespace differences share a key"""
+        assert QueryResultCache.normalize("  Custom   BUTTON\n") == "custom button"
+
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted"""
+        cache = QueryResultCache(max_entries=2)
+        cache.put("a", 1, 0)
+        cache.put("b", 2, 0)
+        cache.get("a")
+        cache.put("c", 3, 0)
+        
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.get("c") == 3
+
+    def test_ttl_expiry(self):
+        """Test that entries expire after the TTL"""
+        cache = QueryResultCache(ttl_seconds=10)
+        with patch("query_cache.time.monotonic", return_value=100.0):
+            cache.put("q", "result", 0)
+        with patch("query_cache.time.monotonic", return_value=111.0):
+            assert cache.get("q") is None
+        assert cache.stats()["entries"] == 0
+
+    def test_invalidate_drops_entries_and_stale_puts(self):
+        """Test that results computed before a reindex are never stored"""
+        cache = QueryResultCache()
+        cache.put("a", 1, 0)
+        generation = cache.generation
+        
+        cache.invalidate()
+        cache.put("b", 2, generation)
+        
+        assert cache.get("a") is None
+        assert cache.get("b") is None
+        assert cache.generation == 1
+
+    def test_disabled(self):
+        """Test that max_entries=0 disables caching"""
+        cache = QueryResultCache(max_entries=0)
+        cache.put("q", "result", 0)
+        
+        assert cache.get("q") is None
+
+
+class TestSemanticQueryCache:
+    """Tests for SemanticQueryCache class"""
+
+    def test_similar_embedding_hits(self):
+        """Test that an embedding above the threshold returns the closest entry's value"""
+        cache = SemanticQueryCache(threshold=0.9)
+        cache.put("opts", [1.0, 0.0], "hooks", 0)
+        cache.put("opts", [0.0, 1.0], "buttons", 0)
+        
+        assert cache.get("opts", [2.0, 0.2]) == "hooks"
+        assert cache.get("opts", [1.0, 1.0]) is None
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+
+    def test_options_must_match(self):
+        """Test that entries stored with other options are never returned"""
+        cache = SemanticQueryCache()
+        cache.put(("a", 3), [1.0, 0.0], "hooks", 0)
+        
+        assert cache.get(("a", 5), [1.0, 0.0]) is None
+
+    def test_lru_eviction_reuses_slots(self):
+        """Test that the least recently used entry is evicted and memory stays bounded"""
+        cache = SemanticQueryCache(max_entries=2)
+        cache.put("o", [1.0, 0.0, 0.0], "a", 0)
+        cache.put("o", [0.0, 1.0, 0.0], "b", 0)
+        cache.get("o", [1.0, 0.0, 0.0])
+        cache.put("o", [0.0, 0.0, 1.0], "c", 0)
+        
+        assert cache.get("o", [0.0, 1.0, 0.0]) is None
+        assert cache.get("o", [1.0, 0.0, 0.0]) == "a"
+        assert cache.get("o", [0.0, 0.0, 1.0]) == "c"
+        assert cache.stats()["memory_bytes"] == 2 * 3 * 4
+
+    def test_ttl_expiry(self):
+        """Test that entries expire after the TTL"""
+        cache = SemanticQueryCache(ttl_seconds=10)
+        with patch("query_cache.time.monotonic", return_value=100.0):
+            cache.put("o", [1.0, 0.0], "a", 0)
+        with patch("query_cache.time.monotonic", return_value=111.0):
+            assert cache.get("o", [1.0, 0.0]) is None
+        assert cache.stats()["entries"] == 0
+
+    def test_invalidate_drops_entries_and_stale_puts(self):
+        """Test that hits computed before a reindex are never stored"""
+        cache = SemanticQueryCache()
+        cache.put("o", [1.0, 0.0], "a", 0)
+        generation = cache.generation
+        
+        cache.invalidate()
+        cache.put("o", [0.0, 1.0], "b", generation)
+        
+        assert cache.get("o", [1.0, 0.0]) is None
+        assert cache.get("o", [0.0, 1.0]) is None
+
+    def test_new_dimensions_start_over(self):
+        """Test that embeddings of another size replace the stored ones instead of failing"""
+        cache = SemanticQueryCache()
+        cache.put("o", [1.0, 0.0], "a", 0)
+        
+        assert cache.get("o", [1.0, 0.0, 0.0]) is None
+        cache.put("o", [1.0, 0.0, 0.0], "b", 0)
+        
+        assert cache.get("o", [1.0, 0.0, 0.0]) == "b"
+        assert cache.stats()["entries"] == 1
+
+    def test_zero_vector_is_ignored(self):
+        """Test that an embedding without a direction is neither stored nor matched"""
+        cache = SemanticQueryCache()
+        cache.put("o", [0.0, 0.0], "a", 0)
+        
+        assert cache.get("o", [0.0, 0.0]) is None
+        assert cache.stats()["entries"] == 0
+
+    def test_disabled(self):
+        """Test that max_entries=0 disables caching"""
+        cache = SemanticQueryCache(max_entries=0)
+        cache.put("o", [1.0, 0.0], "a", 0)
+        
+        assert cache.get("o", [1.0, 0.0]) is None
+
+    def test_invalid_threshold(self):
+        """Test that a threshold outside (0, 1] is rejected"""
+        with pytest.raises(ValueError, match="threshold"):
+            SemanticQueryCache(threshold=1.5)
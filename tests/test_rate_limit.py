@@ -0,0 +1,156 @@
+"""Tests for rate_limit.py module"""
+
+import asyncio
+import email.utils
+
+import pytest
+
+from rate_limit import RateLimiter, RetryPolicy, TokenBucket, parse_retry_after
+
+
+class FakeClock:
+    """Monotonic clock that only moves when told to"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class TestTokenBucket:
+    """Tests for TokenBucket class"""
+
+    def test_refill(self):
+        """Test that an empty bucket refills at its per-minute rate"""
+        clock = FakeClock()
+        bucket = TokenBucket(60, clock)
+        bucket.tokens = 0
+
+        assert bucket.wait_time(3) == pytest.approx(3.0)
+        clock.advance(2)
+        assert bucket.wait_time(3) == pytest.approx(1.0)
+        clock.advance(60)
+        assert bucket.tokens <= bucket.capacity
+        assert bucket.wait_time(3) == 0
+
+    async def test_large_request_runs_into_debt(self):
+        """Test that a request above the burst goes from a full bucket and later callers wait for the debt"""
+        clock = FakeClock()
+        bucket = TokenBucket(60, clock)
+
+        await bucket.acquire(15)
+
+        assert bucket.tokens == pytest.approx(-5)
+        assert bucket.wait_time(1) == pytest.approx(6.0)
+        clock.advance(6)
+        assert bucket.wait_time(1) == 0
+
+
+class TestRateLimiter:
+    """Tests for RateLimiter class"""
+
+    def test_throttle_halves_and_success_recovers(self):
+        """Test multiplicative decrease on a 429 and additive increase on success"""
+        clock = FakeClock()
+        limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=60000, max_concurrency=8, clock=clock)
+
+        limiter.throttle()
+
+        assert limiter.scale == 0.5
+        assert limiter.buckets["requests"].rate == 300
+        assert limiter.buckets["tokens"].rate == 30000
+        assert limiter.window == 4
+
+        for _ in range(5):
+            limiter.success()
+
+        assert limiter.scale == pytest.approx(0.75)
+        assert limiter.window == 6
+
+    def test_concurrent_throttles_halve_once(self):
+        """Test that 429s within DECREASE_INTERVAL count as one overload"""
+        clock = FakeClock()
+        limiter = RateLimiter(max_concurrency=8, clock=clock)
+
+        limiter.throttle()
+        clock.advance(0.5)
+        limiter.throttle()
+
+        assert limiter.scale == 0.5
+        assert limiter.throttled == 2
+
+        clock.advance(0.5)
+        limiter.throttle()
+
+        assert limiter.scale == 0.25
+
+    async def test_window_bounds_requests_in_flight(self):
+        """Test that the concurrency window adapts even without RPM/TPM limits"""
+        limiter = RateLimiter(max_concurrency=2)
+        limiter.throttle()
+        assert limiter.buckets == {}
+
+        async with limiter.slot(10):
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(limiter.acquire(10), timeout=0.05)
+
+        async with limiter.slot(10):
+            assert limiter.in_flight == 1
+        assert limiter.in_flight == 0
+
+    async def test_retry_after_pauses_callers(self):
+        """Test that a Retry-After pause holds back the next request"""
+        limiter = RateLimiter()
+        limiter.throttle(retry_after=0.1)
+
+        started = asyncio.get_running_loop().time()
+        await limiter.acquire(1)
+
+        assert asyncio.get_running_loop().time() - started >= 0.09
+
+
+class TestRetryPolicy:
+    """Tests for RetryPolicy class"""
+
+    def test_exponential_backoff_with_jitter(self):
+        """Test that the delay doubles per attempt, scaled by the jitter, up to max_delay"""
+        policy = RetryPolicy(max_retries=10, base_delay=0.5, max_delay=4.0, rng=lambda: 0.5)
+
+        assert [policy.delay(attempt) for attempt in range(5)] == [0.25, 0.5, 1.0, 2.0, 2.0]
+
+    def test_retry_after_is_honored(self):
+        """Test that Retry-After replaces the backoff, and a wait above max_delay gives up"""
+        policy = RetryPolicy(max_delay=60.0, rng=lambda: 0.5)
+
+        assert policy.delay(0, retry_after=10.0) == 10.0
+        assert policy.delay(0, retry_after=120.0) is None
+
+    def test_retries_are_exhausted(self):
+        """Test that no delay is given after max_retries attempts"""
+        assert RetryPolicy(max_retries=2).delay(2) is None
+
+
+class TestParseRetryAfter:
+    """Tests for parse_retry_after"""
+
+    def test_seconds(self):
+        assert parse_retry_after({"retry-after": "3"}) == 3.0
+
+    def test_milliseconds_take_precedence(self):
+        assert parse_retry_after({"retry-after-ms": "250", "retry-after": "1"}) == 0.25
+
+    def test_http_date(self):
+        """Test that an HTTP date is converted into seconds from now"""
+        now = 1_700_000_000.0
+        headers = {"retry-after": email.utils.formatdate(now + 30, usegmt=True)}
+
+        assert parse_retry_after(headers, now=now) == pytest.approx(30.0)
+
+    def test_missing_or_unreadable(self):
+        assert parse_retry_after(None) is None
+        assert parse_retry_after({}) is None
+        assert parse_retry_after({"retry-after": "soon"}) is None
@@ -0,0 +1,89 @@
+"""Tests for rerank.py module"""
+
+import numpy as np
+import pytest
+
+from rerank import CrossEncoderReranker, mmr, parse_stages, rerank
+
+# Two near-duplicates of the query and one chunk about something else
+QUERY = [1.0, 0.0]
+EMBEDDINGS = [[1.0, 0.0], [0.99, 0.14], [0.7, 0.71]]
+
+
+class FakeCrossEncoder:
+    """Stands in for sentence_transformers.CrossEncoder; scores by document length"""
+
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, pairs, batch_size, show_progress_bar):
+        self.calls.append(pairs)
+        return [float(len(document)) for _, document in pairs]
+
+
+def fake_reranker():
+    reranker = CrossEncoderReranker.__new__(CrossEncoderReranker)
+    reranker.model = FakeCrossEncoder()
+    reranker.batch_size = 32
+    return reranker
+
+
+class TestStages:
+    """Tests for parse_stages"""
+
+    def test_parses_comma_separated_stages(self):
+        """Test that stages are split on commas and stripped"""
+        assert parse_stages("mmr, cross-encoder") == ("mmr", "cross-encoder")
+        assert parse_stages("") == ()
+
+    def test_unknown_stage(self):
+        """Test that an unknown stage is rejected"""
+        with pytest.raises(ValueError, match="Unknown RERANK stage 'bm25'"):
+            parse_stages("mmr,bm25")
+
+
+class TestMMR:
+    """Tests for maximal marginal relevance"""
+
+    def test_prefers_diverse_candidates(self):
+        """Test that a near-duplicate of the first pick loses to a different chunk"""
+        relevance = np.array(EMBEDDINGS) @ np.array(QUERY)
+
+        assert mmr(relevance, EMBEDDINGS, 2, lambda_=0.3) == [0, 2]
+
+    def test_lambda_one_keeps_relevance_order(self):
+        """Test that lambda 1 ignores redundancy"""
+        assert mmr([0.2, 0.9, 0.5], EMBEDDINGS, 3, lambda_=1.0) == [1, 2, 0]
+
+    def test_k_larger_than_pool(self):
+        """Test that every candidate is returned once when k exceeds the pool"""
+        assert sorted(mmr([0.1, 0.2, 0.3], EMBEDDINGS, 10, lambda_=0.5)) == [0, 1, 2]
+
+
+class TestRerank:
+    """Tests for the rerank entry point"""
+
+    def test_mmr_on_cosine_relevance(self):
+        """Test that without a cross-encoder the cosine similarity is the relevance"""
+        assert rerank("q", QUERY, ["a", "b", "c"], EMBEDDINGS, 2, lambda_=0.3) == [0, 2]
+
+    def test_cross_encoder_alone_sorts_by_score(self):
+        """Test that without embeddings the cross-encoder scores decide the order"""
+        reranker = fake_reranker()
+
+        order = rerank("q", QUERY, ["aa", "aaaa", "a"], None, 2, cross_encoder=reranker)
+
+        assert order == [1, 0]
+        assert reranker.model.calls == [[("q", "aa"), ("q", "aaaa"), ("q", "a")]]
+
+    def test_cross_encoder_scores_feed_mmr(self):
+        """Test that MMR diversifies the cross-encoder ranking"""
+        order = rerank("q", QUERY, ["aaaa", "aaa", "a"], EMBEDDINGS, 2, lambda_=0.2, cross_encoder=fake_reranker())
+
+        assert order == [0, 2]
+
+    def test_cross_encoder_scores_are_scaled(self):
+        """Test that scores are scaled to 0..1 over the batch"""
+        scores = fake_reranker().scores("q", ["a", "aaa", "aaaaa"])
+
+        assert scores.tolist() == [0.0, 0.5, 1.0]
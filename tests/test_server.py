@@ -1,11 +1,21 @@
 """Tests for server.py module"""
 
+import asyncio
+import functools
 import os
+import subprocess
+import sys
 import tempfile
+import threading
+import time
+import zipfile
 from pathlib import Path
 import pytest
-from unittest.mock import MagicMock, patch, mock_open
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import AsyncMock, MagicMock, patch, mock_open
 import server
+import sphinx_html
+from embedding_cache import CachedEmbeddingFunction
 
 
 @pytest.fixture
@@ -15,6 +25,159 @@ def temp_dir():
         yield Path(tmpdir)
 
 
+class FakeCollection:
+    """In-memory stand-in for a ChromaDB collection; query ranks records by id"""
+
+    def __init__(self, name, metadata=None, configuration=None):
+        self.name = name
+        self.metadata = metadata
+        self.configuration = {"hnsw": dict((configuration or {}).get("hnsw") or {})}
+        self.records = {}
+
+    def modify(self, configuration):
+        self.configuration["hnsw"].update(configuration["hnsw"])
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        for record in zip(ids, embeddings, documents, metadatas):
+            self.records[record[0]] = record[1:]
+
+    def get(self, ids=None, where=None, include=(), limit=None, offset=0):
+        ids = [doc_id for doc_id in (ids if ids is not None else self.records) if doc_id in self.records]
+        if where is not None:
+            ids = [doc_id for doc_id in ids if self.records[doc_id][2]["filename"] == where["filename"]]
+        ids = ids[offset:offset + limit] if limit is not None else ids[offset:]
+        return {
+            "ids": ids,
+            "embeddings": [self.records[doc_id][0] for doc_id in ids],
+            "documents": [self.records[doc_id][1] for doc_id in ids],
+            "metadatas": [self.records[doc_id][2] for doc_id in ids],
+        }
+
+    def query(self, query_embeddings, n_results, include=None):
+        found = self.get(sorted(self.records)[:n_results])
+        return {key: [found[key]] * len(query_embeddings) for key in ("ids", "documents", "metadatas")}
+
+    def delete(self, where):
+        filenames = where["filename"]["$in"]
+        for doc_id in [doc_id for doc_id, record in self.records.items() if record[2]["filename"] in filenames]:
+            del self.records[doc_id]
+
+    def count(self):
+        return len(self.records)
+
+
+def fake_db_client():
+    """A mocked ChromaDB client keeping one FakeCollection (wrapped in a MagicMock) per name"""
+    db_instance = MagicMock()
+    db_instance.collections = {}
+
+    def get_or_create_collection(name, embedding_function=None, metadata=None, configuration=None):
+        if name not in db_instance.collections:
+            fake = FakeCollection(name, metadata, configuration)
+            collection = MagicMock(wraps=fake)
+            collection.name = name
+            collection.metadata = metadata
+            collection.configuration = fake.configuration
+            db_instance.collections[name] = collection
+        return db_instance.collections[name]
+
+    def get_collection(name, embedding_function=None):
+        if name not in db_instance.collections:
+            raise ValueError(f"Collection [{name}] does not exist")
+        return db_instance.collections[name]
+
+    def delete_collection(name):
+        if db_instance.collections.pop(name, None) is None:
+            raise ValueError(f"Collection [{name}] does not exist")
+
+    db_instance.get_or_create_collection.side_effect = get_or_create_collection
+    db_instance.get_collection.side_effect = get_collection
+    db_instance.delete_collection.side_effect = delete_collection
+    db_instance.list_collections.side_effect = lambda: list(db_instance.collections.values())
+    return db_instance
+
+
+def zero_embeddings(docs):
+    return [[0.0]] * len(docs)
+
+
+@pytest.fixture
+def embed():
+    """The fake embedding function behind the `db` fixture; test classes override it"""
+    return zero_embeddings
+
+
+@pytest.fixture
+def db(embed):
+    """fake_db_client() as the ChromaDB client, embedding with `embed` (its mock kept as db.mock_ef)"""
+    db_instance = fake_db_client()
+    with patch("server.get_db_client", return_value=db_instance), \
+         patch("server.get_embedding_fn", return_value=MagicMock(side_effect=embed)) as mock_embedding_fn:
+        db_instance.mock_ef = mock_embedding_fn.return_value
+        yield db_instance
+
+
+@pytest.fixture
+def hooks_collection(embed):
+    """A mocked collection whose every query returns one hooks.htm chunk, embedding with `embed` (as mock_ef)"""
+    collection = MagicMock()
+    collection.query.return_value = {
+        "ids": [["hooks.htm#0"]],
+        "documents": [["Hook docs"]],
+        "metadatas": [[{"title": "Hooks", "filename": "hooks.htm"}]],
+    }
+    db_instance = MagicMock()
+    db_instance.get_collection.return_value = collection
+    db_instance.get_or_create_collection.return_value = collection
+    with patch("server.get_db_client", return_value=db_instance), \
+         patch("server.get_embedding_fn", return_value=MagicMock(side_effect=embed)) as mock_embedding_fn:
+        collection.mock_ef = mock_embedding_fn.return_value
+        yield collection
+
+
+def write_doc(path, text):
+    """Writes a page long enough to be indexed"""
+    path.write_text(f"<html><body>{text} with enough length to meet the 50 character requirement.</body></html>", encoding="utf-8")
+
+
+def write_docs(directory, count):
+    for i in range(count):
+        write_doc(directory / f"doc{i}.htm", f"Document {i}")
+
+
+def live_collection(db):
+    """The collection of the generation the index alias points at"""
+    return db.collections[server.generation_name(server.load_alias()["generation"])]
+
+
+async def search(*args, **kwargs):
+    """search_extensions_guide with its content blocks joined as they would be read"""
+    return "\n".join(block.text for block in await server.search_extensions_guide(*args, **kwargs))
+
+
+@pytest.fixture(autouse=True)
+def isolated_storage(tmp_path):
+    """Keep index state written by the tests out of the real storage/ folder"""
+    with patch("server.STORAGE_DIR", tmp_path), \
+         patch("server.MANIFEST_PATH", tmp_path / "index_manifest.json"), \
+         patch("server.EMBEDDING_CACHE_PATH", tmp_path / "embedding_cache.sqlite3"), \
+         patch("server.LEXICAL_INDEX_PATH", tmp_path / "lexical_index.json"), \
+         patch("server.COMPACT_INDEX_PATH", tmp_path / "compact_index"), \
+         patch("server.INDEX_ALIAS_PATH", tmp_path / "index_alias.json"), \
+         patch("server.INDEX_CHECKPOINT_PATH", tmp_path / "index_checkpoint.json"), \
+         patch("server.INDEX_LOCK_PATH", tmp_path / "index.lock"), \
+         patch("server.PARSE_CACHE_PATH", tmp_path / "parse_cache.pack"), \
+         patch("server.index_jobs", server.JobRegistry()), \
+         patch("server._embedding_cache", None), \
+         patch("server.query_cache", server.QueryResultCache()), \
+         patch("server.semantic_cache", server.SemanticQueryCache()), \
+         patch("server.metrics", server.MetricsRegistry()), \
+         patch("server.profiler", server.RequestProfiler()):
+        server.resources.reset()
+        yield tmp_path
+        server.resources.reset()
+
+
 class TestHTMLParser:
     """Tests for parse_sphinx_html function"""
 
@@ -37,7 +200,7 @@ class TestHTMLParser:
         test_file = temp_dir / "test_page.htm"
         test_file.write_text(test_html, encoding="utf-8")
         
-        title, content = server.parse_sphinx_html(test_file)
+        title, content = sphinx_html.parse_sphinx_html(test_file)
         
         assert title == "Test Page"
         assert "Test Content" in content
@@ -60,7 +223,7 @@ class TestHTMLParser:
         test_file = temp_dir / "test_page.htm"
         test_file.write_text(test_html, encoding="utf-8")
         
-        title, content = server.parse_sphinx_html(test_file)
+        title, content = sphinx_html.parse_sphinx_html(test_file)
         
         assert title == "Test Page"
         assert "Test Content" in content
@@ -89,7 +252,7 @@ class TestHTMLParser:
         test_file = temp_dir / "test_page.htm"
         test_file.write_text(test_html, encoding="utf-8")
         
-        title, content = server.parse_sphinx_html(test_file)
+        title, content = sphinx_html.parse_sphinx_html(test_file)
         
         assert title == "Test Page"
         assert "Test Content" in content
@@ -103,7 +266,7 @@ class TestHTMLParser:
         test_file = temp_dir / "empty.htm"
         test_file.write_text("", encoding="utf-8")
         
-        title, content = server.parse_sphinx_html(test_file)
+        title, content = sphinx_html.parse_sphinx_html(test_file)
         
         assert title == "Untitled"
         assert content is None
@@ -112,7 +275,7 @@ class TestHTMLParser:
         """Test parsing a nonexistent file (should handle error gracefully)"""
         non_existent_file = temp_dir / "nonexistent.htm"
         
-        title, content = server.parse_sphinx_html(non_existent_file)
+        title, content = sphinx_html.parse_sphinx_html(non_existent_file)
         
         assert title == "Untitled"
         assert content is None
@@ -136,7 +299,7 @@ class TestHTMLParser:
         test_file = temp_dir / "test_page.htm"
         test_file.write_text(test_html, encoding="utf-8")
         
-        title, content = server.parse_sphinx_html(test_file)
+        title, content = sphinx_html.parse_sphinx_html(test_file)
         
         assert title == "Test Page"
         assert "Test Content" in content
@@ -166,7 +329,7 @@ class TestHTMLParser:
         test_file = temp_dir / "test_page.htm"
         test_file.write_text(test_html, encoding="utf-8")
         
-        title, content = server.parse_sphinx_html(test_file)
+        title, content = sphinx_html.parse_sphinx_html(test_file)
         
         assert title == "Test Page"
         assert "Test Content" in content
@@ -178,12 +341,1715 @@ class TestHTMLParser:
         assert "body { background: #fff; }" not in content
 
 
+class TestBatching:
+    """Tests for batch_documents function"""
+
+    def test_batch_documents_respects_batch_size(self):
+        """Test that batches never exceed the requested size"""
+        docs = [{"document": "x" * 10} for _ in range(5)]
+        
+        batches = list(server.batch_documents(docs, batch_size=2, max_tokens=10_000))
+        
+        assert [len(b) for b in batches] == [2, 2, 1]
+
+    def test_batch_documents_respects_token_budget(self):
+        """Test that a batch is closed before it exceeds the token budget"""
+        docs = [{"document": "x" * 400} for _ in range(3)]  # ~101 tokens each
+        
+        batches = list(server.batch_documents(docs, batch_size=10, max_tokens=250))
+        
+        assert [len(b) for b in batches] == [2, 1]
+
+    def test_batch_documents_oversized_document(self):
+        """Test that a document larger than the budget still gets its own batch"""
+        docs = [{"document": "x" * 4000}, {"document": "short"}]
+        
+        batches = list(server.batch_documents(docs, batch_size=10, max_tokens=100))
+        
+        assert [len(b) for b in batches] == [1, 1]
+
+
+class TestIncrementalIndexing:
+    """Tests for manifest-driven incremental indexing"""
+
+    async def test_unchanged_files_are_skipped(self, db, temp_dir):
+        """Test that a second run without changes embeds nothing and keeps the generation"""
+        write_doc(temp_dir / "doc1.htm", "First document")
+        
+        with patch("server.DOCS_DIR", temp_dir):
+            await server.run_index()
+            result = await server.run_index()
+        
+        assert "Processed 0 documentation files" in result
+        assert "1 unchanged" in result
+        assert server.load_alias()["generation"] == 1
+        live_collection(db).upsert.assert_called_once()
+
+    async def test_touched_file_with_same_content_is_skipped(self, db, temp_dir):
+        """Test that an mtime change alone does not trigger re-embedding"""
+        doc = temp_dir / "doc1.htm"
+        write_doc(doc, "First document")
+        
+        with patch("server.DOCS_DIR", temp_dir):
+            await server.run_index()
+            os.utime(doc, (1, 1))
+            result = await server.run_index()
+        
+        assert "1 unchanged" in result
+        assert server.load_alias()["generation"] == 1
+        assert server.load_manifest()["doc1.htm"]["mtime"] == 1
+
+    async def test_changed_file_is_reindexed(self, db, temp_dir):
+        """Test that a modified file is re-embedded into a new generation"""
+        doc = temp_dir / "doc1.htm"
+        write_doc(doc, "First document")
+        
+        with patch("server.DOCS_DIR", temp_dir):
+            await server.run_index()
+            write_doc(doc, "First document, revised and longer")
+            result = await server.run_index()
+        
+        assert "Processed 1 documentation files" in result
+        assert "Serving generation 2" in result
+        assert "revised" in live_collection(db).get(["doc1.htm#0"])["documents"][0]
+
+    async def test_deleted_file_is_removed(self, db, temp_dir):
+        """Test that chunks of deleted files are left out of the new generation"""
+        write_doc(temp_dir / "doc1.htm", "First document")
+        write_doc(temp_dir / "doc2.htm", "Second document")
+        
+        with patch("server.DOCS_DIR", temp_dir):
+            await server.run_index()
+            (temp_dir / "doc2.htm").unlink()
+            result = await server.run_index()
+        
+        assert "1 removed" in result
+        assert live_collection(db).get()["ids"] == ["doc1.htm#0"]
+        assert list(server.load_manifest()) == ["doc1.htm"]
+
+    async def test_unchanged_chunks_are_copied_not_embedded(self, db, temp_dir):
+        """Test that a new generation reuses the stored embeddings of unchanged pages"""
+        write_doc(temp_dir / "doc1.htm", "First document")
+        write_doc(temp_dir / "doc2.htm", "Second document")
+        
+        with patch("server.DOCS_DIR", temp_dir):
+            await server.run_index()
+            embedding_fn = server.resources.embedding_fn
+            embedding_fn.reset_mock()
+            write_doc(temp_dir / "doc2.htm", "Second document, revised")
+            result = await server.run_index()
+        
+        assert "Processed 1 documentation files" in result
+        assert sorted(live_collection(db).get()["ids"]) == ["doc1.htm#0", "doc2.htm#0"]
+        assert [len(call.args[0]) for call in embedding_fn.call_args_list] == [1]
+
+    async def test_force_reindexes_everything(self, db, temp_dir):
+        """Test that force ignores the manifest"""
+        write_doc(temp_dir / "doc1.htm", "First document")
+        
+        with patch("server.DOCS_DIR", temp_dir):
+            await server.run_index()
+            result = await server.run_index(force=True)
+        
+        assert "Processed 1 documentation files" in result
+        live_collection(db).upsert.assert_called_once()
+
+    async def test_failed_files_are_retried(self, db, temp_dir):
+        """Test that files from a failed batch stay out of the manifest"""
+        write_doc(temp_dir / "doc1.htm", "First document")
+        
+        with patch("server.DOCS_DIR", temp_dir):
+            with patch.object(FakeCollection, "upsert", side_effect=Exception("Upsert failed")):
+                await server.run_index()
+            result = await server.run_index()
+        
+        assert "Processed 1 documentation files" in result
+
+    async def test_empty_collection_invalidates_manifest(self, db, temp_dir):
+        """Test that a wiped collection triggers a full reindex"""
+        write_doc(temp_dir / "doc1.htm", "First document")
+        
+        with patch("server.DOCS_DIR", temp_dir):
+            await server.run_index()
+            live_collection(db)._mock_wraps.records.clear()
+            result = await server.run_index()
+        
+        assert "Processed 1 documentation files" in result
+
+    async def test_changed_chunk_settings_reindex(self, db, temp_dir):
+        """Test that files indexed with other chunk settings are reindexed"""
+        write_doc(temp_dir / "doc1.htm", "First document")
+        
+        with patch("server.DOCS_DIR", temp_dir):
+            await server.run_index()
+            with patch("server.CHUNKER", "sections:100:10"):
+                result = await server.run_index()
+        
+        assert "Processed 1 documentation files" in result
+        assert "Serving generation 2" in result
+
+    async def test_index_from_zip(self, db, temp_dir):
+        """Test that DOCS_ZIP pages are indexed without extracting the archive"""
+        path = temp_dir / "guide.zip"
+        with zipfile.ZipFile(path, "w") as archive:
+            archive.writestr("guide/doc1.htm", "<html><body>Zipped document with enough length to meet the 50 character requirement.</body></html>")
+        
+        with patch("server.DOCS_ZIP", str(path)):
+            result = await server.run_index()
+            second = await server.run_index()
+        
+        assert "Processed 1 documentation files" in result
+        assert live_collection(db).upsert.call_args.kwargs["metadatas"][0]["filename"] == "doc1.htm"
+        assert list(server.load_manifest()) == ["guide/doc1.htm"]
+        assert "1 unchanged" in second
+
+    def test_corrupt_manifest_is_ignored(self, isolated_storage):
+        """Test that an unreadable manifest is treated as empty"""
+        (isolated_storage / "index_manifest.json").write_text("{not json", encoding="utf-8")
+        
+        assert server.load_manifest() == {}
+
+
+class TestParseCache:
+    """Tests for reusing parsed pages across index runs"""
+
+    @pytest.fixture
+    def parse(self):
+        with patch("sphinx_html.parse_sphinx_sections", MagicMock(wraps=sphinx_html.parse_sphinx_sections)) as parse:
+            yield parse
+
+    async def test_forced_reindex_skips_parsing(self, db, temp_dir, parse):
+        """Test that a forced run reuses the parsed pages of unchanged files"""
+        write_doc(temp_dir / "doc1.htm", "First document")
+        write_doc(temp_dir / "doc2.htm", "Second document")
+
+        with patch("server.DOCS_DIR", temp_dir):
+            await server.run_index()
+            parse.reset_mock()
+            result = await server.run_index(force=True)
+
+        parse.assert_not_called()
+        assert "Processed 2 documentation files" in result
+        assert "Parse cache: 2 hits, 0 misses." in result
+
+    async def test_changed_file_is_parsed_again(self, db, temp_dir, parse, isolated_storage):
+        """Test that a changed page is parsed and its old version leaves the cache"""
+        doc = temp_dir / "doc1.htm"
+        write_doc(doc, "First document")
+        write_doc(temp_dir / "doc2.htm", "Second document")
+
+        with patch("server.DOCS_DIR", temp_dir):
+            await server.run_index()
+            write_doc(doc, "First document, revised")
+            (temp_dir / "doc2.htm").unlink()
+            parse.reset_mock()
+            result = await server.run_index()
+
+        assert [call.args[0].name for call in parse.call_args_list] == ["doc1.htm"]
+        assert "Parse cache: 0 hits, 1 misses." in result
+        cache = server.ParseCache(isolated_storage / "parse_cache.pack", sphinx_html.parser_id())
+        assert len(cache) == 1
+        assert "revised" in cache.get(server.ParseCache.make_key("doc1.htm", server.file_digest(doc)))[1][0]["text"]
+
+    async def test_disabled(self, db, temp_dir, parse, isolated_storage):
+        """Test that PARSE_CACHE=0 parses every page and writes no pack"""
+        write_doc(temp_dir / "doc1.htm", "First document")
+
+        with patch("server.DOCS_DIR", temp_dir), patch("server.PARSE_CACHE", False):
+            await server.run_index()
+            result = await server.run_index(force=True)
+
+        assert parse.call_count == 2
+        assert "Parse cache" not in result
+        assert not (isolated_storage / "parse_cache.pack").exists()
+
+
+class TestFailedBatches:
+    """Tests for batches that fail during an index run"""
+
+    def embedding_fn(self, fails):
+        def embed(docs):
+            if any(fails(doc) for doc in docs):
+                raise Exception("Upstream unavailable")
+            return zero_embeddings(docs)
+
+        return MagicMock(side_effect=embed)
+
+    async def test_failed_batch_is_retried_at_end(self, db, temp_dir):
+        """Test that a batch failing once is written by the retry at the end of the run"""
+        write_doc(temp_dir / "doc1.htm", "First document")
+        failures = []
+
+        def fails_once(doc):
+            failures.append(doc)
+            return len(failures) == 1
+
+        with patch("server.DOCS_DIR", temp_dir), patch("server.get_embedding_fn", return_value=self.embedding_fn(fails_once)):
+            result = await server.run_index()
+
+        assert "Retried 1 failed batches at the end: 1 recovered, 0 failed" in result
+        assert "Processed 1 documentation files" in result
+        assert live_collection(db).count() == 1
+
+    async def test_failed_page_keeps_previous_version(self, db, temp_dir, capsys):
+        """Test that a changed page failing twice is still served in its previous version, then retried"""
+        write_doc(temp_dir / "doc1.htm", "First document")
+        write_doc(temp_dir / "doc2.htm", "Second document")
+        with patch("server.DOCS_DIR", temp_dir), \
+             patch("server.get_embedding_fn", return_value=self.embedding_fn(lambda doc: False)):
+            await server.run_index()
+        write_doc(temp_dir / "doc1.htm", "Rewritten document")
+        write_doc(temp_dir / "doc3.htm", "Rewritten new document")
+
+        server.resources.reset()
+        job = server.IndexJob()
+        with patch("server.DOCS_DIR", temp_dir), \
+             patch("server.get_embedding_fn", return_value=self.embedding_fn(lambda doc: "Rewritten" in doc)):
+            result = await server.run_index(job=job)
+        documents = live_collection(db).get()["documents"]
+
+        assert "2 files failed to index" in result
+        assert "kept the previous version of doc1.htm" in result
+        assert "not indexed: doc3.htm" in result
+        assert job.failed_files == ["doc1.htm", "doc3.htm"]
+        assert job.kept_files == ["doc1.htm"]
+        assert "Failed to index" in capsys.readouterr().out
+        assert sum("First document" in document for document in documents) == 1
+        assert sum("Second document" in document for document in documents) == 1
+
+        server.resources.reset()
+        with patch("server.DOCS_DIR", temp_dir), \
+             patch("server.get_embedding_fn", return_value=self.embedding_fn(lambda doc: False)):
+            retried = await server.run_index()
+
+        assert "Processed 2 documentation files" in retried
+
+
+class TestIndexGenerations:
+    """Tests for blue/green index generations"""
+
+    async def test_searches_use_live_generation_during_rebuild(self, db, temp_dir):
+        """Test that a search during a rebuild is answered from the old generation"""
+        write_doc(temp_dir / "doc1.htm", "First document")
+        with patch("server.DOCS_DIR", temp_dir):
+            await server.run_index()
+        write_doc(temp_dir / "doc1.htm", "Rewritten document")
+        during = []
+        original_run_index_db = server.run_index_db
+
+        async def run_index_db(fn, *args, **kwargs):
+            if "documents" in kwargs and not during:
+                # The new generation is being written
+                during.append(await search("document"))
+            return await original_run_index_db(fn, *args, **kwargs)
+
+        with patch("server.DOCS_DIR", temp_dir), patch("server.run_index_db", run_index_db):
+            await server.run_index()
+        after = await search("document")
+
+        assert "First document" in during[0]
+        assert "Rewritten document" in after
+
+    async def test_changed_pages_are_removed_in_one_pass(self, db, temp_dir):
+        """Test that changed and deleted pages leave the copied indexes in one call, off the event loop"""
+        for i in range(3):
+            write_doc(temp_dir / f"doc{i}.htm", f"Document {i}")
+        with patch("server.DOCS_DIR", temp_dir):
+            await server.run_index()
+        write_doc(temp_dir / "doc0.htm", "Rewritten document")
+        (temp_dir / "doc1.htm").unlink()
+        calls = []
+        remove = server.BM25Index.remove_filenames
+
+        def remove_filenames(index, filenames):
+            calls.append((sorted(filenames), threading.current_thread()))
+            return remove(index, filenames)
+
+        with patch("server.DOCS_DIR", temp_dir), patch("server.BM25Index.remove_filenames", remove_filenames):
+            await server.run_index()
+
+        assert [filenames for filenames, _ in calls] == [["doc0.htm", "doc1.htm"]]
+        assert calls[0][1] is not threading.main_thread()
+        assert "doc1.htm" not in await search("document", n_results=5)
+
+    async def test_old_generations_are_collected(self, db, temp_dir):
+        """Test that only the newest INDEX_KEEP_GENERATIONS generations are kept"""
+        doc = temp_dir / "doc1.htm"
+        with patch("server.DOCS_DIR", temp_dir):
+            for version in range(3):
+                write_doc(doc, f"Document version {version}")
+                result = await server.run_index()
+
+        assert "dropped generations 1" in result
+        assert sorted(db.collections) == ["plesk_docs_g2", "plesk_docs_g3"]
+        assert not (server.LEXICAL_INDEX_PATH.with_name("lexical_index.g1.json")).exists()
+        assert (server.LEXICAL_INDEX_PATH.with_name("lexical_index.g3.json")).exists()
+
+    async def test_failed_validation_keeps_live_generation(self, db, temp_dir, capsys):
+        """Test that a generation whose chunk count is off is dropped, not switched to"""
+        write_doc(temp_dir / "doc1.htm", "First document")
+        with patch("server.DOCS_DIR", temp_dir):
+            await server.run_index()
+            write_doc(temp_dir / "doc1.htm", "Rewritten document")
+            with patch.object(FakeCollection, "count", return_value=0):
+                result = await server.run_index()
+
+        assert "Indexing Aborted" in result
+        assert "still serving generation 1" in result
+        assert server.load_alias()["generation"] == 1
+        assert sorted(db.collections) == ["plesk_docs_g1"]
+        assert "failed validation" in capsys.readouterr().out
+
+    async def test_unversioned_collection_is_generation_zero(self, db, temp_dir):
+        """Test that an index built before generations is served, then replaced"""
+        db.get_or_create_collection("plesk_docs").upsert(
+            ids=["old.htm#0"], embeddings=[[0.0]], documents=["Old document"], metadatas=[{"filename": "old.htm"}]
+        )
+
+        assert await server.run_db(server.resources.corpus().collection) is db.collections["plesk_docs"]
+
+        write_doc(temp_dir / "doc1.htm", "First document")
+        with patch("server.DOCS_DIR", temp_dir), patch("server.INDEX_KEEP_GENERATIONS", 1):
+            result = await server.run_index()
+
+        assert "dropped generations 0" in result
+        assert sorted(db.collections) == ["plesk_docs_g1"]
+
+    async def test_forced_rebuild_replaces_mismatched_model(self, db, temp_dir):
+        """Test that force builds a new generation instead of opening a mismatched one"""
+        db.get_or_create_collection("plesk_docs", metadata={"embedding_model": "onnx/all-MiniLM-L6-v2"})
+        write_doc(temp_dir / "doc1.htm", "First document")
+
+        with patch("server.DOCS_DIR", temp_dir):
+            with pytest.raises(ValueError, match="force=True"):
+                await server.run_index()
+            result = await server.run_index(force=True)
+
+        assert "Serving generation 1" in result
+        assert db.collections["plesk_docs_g1"].metadata == {"embedding_model": "text-embedding-3-small"}
+
+    async def test_switch_by_another_process_is_followed(self, db, temp_dir):
+        """Test that a search picks up a generation another server process switched to"""
+        write_doc(temp_dir / "doc1.htm", "First document")
+        with patch("server.DOCS_DIR", temp_dir):
+            await server.run_index()
+        assert "First document" in await search("document")
+
+        # Another process builds generation 2 and switches the alias
+        db.get_or_create_collection("plesk_docs_g2").upsert(
+            ids=["doc1.htm#0"], embeddings=[[0.0]], documents=["Rebuilt document"],
+            metadatas=[{"title": "Doc", "filename": "doc1.htm"}],
+        )
+        server.save_alias({"generation": 2})
+        result = await search("document")
+
+        assert "Rebuilt document" in result
+        assert server.resources.corpus().generation == 2
+
+    async def test_index_lock_is_shared_across_processes(self, db, temp_dir):
+        """Test that an index run fails while another process holds the storage lock"""
+        write_doc(temp_dir / "doc1.htm", "First document")
+        # A second open file description conflicts like another process would
+        with server.index_file_lock():
+            with patch("server.DOCS_DIR", temp_dir), pytest.raises(RuntimeError, match="Another server process"):
+                await server.run_index()
+
+        with patch("server.DOCS_DIR", temp_dir):
+            assert "Serving generation 1" in await server.run_index()
+
+    async def test_health_reports_generation(self, db, temp_dir):
+        """Test that get_server_health reports the live generation"""
+        write_doc(temp_dir / "doc1.htm", "First document")
+        with patch("server.DOCS_DIR", temp_dir):
+            await server.run_index()
+
+        assert (await server.get_server_health())["generation"] == 1
+
+
+class TestIndexJobs:
+    """Tests for background index jobs, progress and checkpoint/resume"""
+
+    @pytest.fixture
+    def db(self, db):
+        with patch("server.EMBED_CONCURRENCY", 2):
+            yield db
+
+    async def test_tool_returns_job_id_at_once(self, db, temp_dir):
+        """Test that the index tool starts a job and a second call reports the running one"""
+        write_docs(temp_dir, 1)
+        with patch("server.DOCS_DIR", temp_dir):
+            started = await server.index_extensions_guide()
+            again = await server.index_extensions_guide()
+            finished = await server.wait_for_index_job(started["job_id"], timeout_seconds=10)
+
+        assert started["status"] in ("pending", "running")
+        assert again["job_id"] == started["job_id"]
+        assert "already running" in again["message"]
+        assert finished["status"] == "completed"
+        assert finished["files_done"] == 1
+        assert "Serving generation 1" in finished["summary"]
+        assert (await server.get_index_job())["job_id"] == started["job_id"]
+
+    async def test_unknown_job(self):
+        """Test that an unknown job id is rejected and no job is reported before the first run"""
+        assert (await server.get_index_job())["status"] == "none"
+        with pytest.raises(ValueError, match="Unknown index job"):
+            await server.get_index_job("missing")
+
+    async def test_wait_sends_progress_notifications(self, db, temp_dir):
+        """Test that wait_for_index_job reports progress through the MCP context"""
+        write_docs(temp_dir, 2)
+        ctx = MagicMock(report_progress=AsyncMock())
+        with patch("server.DOCS_DIR", temp_dir):
+            job = await server.index_extensions_guide()
+            result = await server.wait_for_index_job(job["job_id"], timeout_seconds=10, ctx=ctx)
+
+        assert result["status"] == "completed"
+        ctx.report_progress.assert_awaited()
+
+    async def test_cancelled_job_resumes(self, db, temp_dir):
+        """Test that a cancelled run keeps the live index and the next run skips its finished files"""
+        write_docs(temp_dir, 3)
+        original_run_index_db = server.run_index_db
+
+        async def run_index_db(fn, *args, **kwargs):
+            result = await original_run_index_db(fn, *args, **kwargs)
+            if "documents" in kwargs:
+                # Cancel once the first batch is written
+                server.index_jobs.cancel()
+            return result
+
+        with patch("server.DOCS_DIR", temp_dir):
+            with patch("server.run_index_db", run_index_db):
+                job = await server.index_extensions_guide(batch_size=1)
+                cancelled = await server.wait_for_index_job(job["job_id"], timeout_seconds=10)
+            checkpoint = server.load_checkpoint()
+            result = await server.run_index(batch_size=1)
+
+        assert cancelled["status"] == "cancelled"
+        assert server.load_alias()["generation"] == 1
+        assert len(checkpoint["seen"]) == 1
+        assert "Processed 2 documentation files" in result
+        assert db.collections["plesk_docs_g1"].count() == 3
+        assert server.load_checkpoint() is None
+
+    async def test_cancel_with_parser_pool_returns_promptly(self, db, temp_dir):
+        """Test that cancelling stops the parser pool instead of waiting for every queued file"""
+        import sphinx_html
+
+        write_docs(temp_dir, 200)
+        parse = sphinx_html.parse_sphinx_sections
+
+        def slow_parse(path):
+            time.sleep(0.02)
+            return parse(path)
+
+        with patch("server.DOCS_DIR", temp_dir), \
+             patch("sphinx_html.ProcessPoolExecutor", lambda max_workers, mp_context: ThreadPoolExecutor(max_workers)), \
+             patch("sphinx_html.PARSE_WORKERS", 2), \
+             patch("sphinx_html.PARSE_POOL_MIN_FILES", 1), \
+             patch("sphinx_html.parse_sphinx_sections", slow_parse):
+            job = server.index_jobs.start(server.IndexJob(), functools.partial(server.run_index, 1, False))
+            while job.files_done < 1:
+                await asyncio.sleep(0.01)
+            started = time.perf_counter()
+            cancelled = await server.cancel_index_job(job.id)
+            elapsed = time.perf_counter() - started
+
+        assert cancelled["status"] == "cancelled"
+        assert elapsed < 1.0
+        assert job.files_parsed < 50
+
+    async def test_interrupted_run_resumes_from_checkpoint(self, db, temp_dir):
+        """Test that a run that died before switching resumes without re-indexing its files"""
+        write_docs(temp_dir, 2)
+        with patch("server.DOCS_DIR", temp_dir), patch("server.INDEX_CHECKPOINT_SECONDS", 0):
+            with patch.object(server.CorpusResources, "switch", side_effect=RuntimeError("killed")):
+                with pytest.raises(RuntimeError):
+                    await server.run_index(batch_size=1)
+            job = server.IndexJob()
+            result = await server.run_index(batch_size=1, job=job)
+
+        assert job.resumed
+        assert "Processed 0 documentation files" in result
+        assert "Serving generation 1" in result
+        assert db.collections["plesk_docs_g1"].count() == 2
+
+    async def test_forced_run_does_not_resume_incremental_checkpoint(self, db, temp_dir):
+        """Test that force ignores the checkpoint of an incremental run"""
+        write_docs(temp_dir, 1)
+        server.save_checkpoint({
+            "generation": 1, "chunker": server.CHUNKER, "embedding_model": server.embedding_model_id(),
+            "compact_index": server.COMPACT_INDEX, "force": False, "seen": {},
+        })
+        job = server.IndexJob(force=True)
+        with patch("server.DOCS_DIR", temp_dir):
+            await server.run_index(force=True, job=job)
+
+        assert not job.resumed
+
+
+class TestCorpora:
+    """Tests for serving several doc sets from one process"""
+
+    @pytest.fixture
+    def db(self, db, temp_dir):
+        guide, api = temp_dir / "guide", temp_dir / "api"
+        guide.mkdir()
+        api.mkdir()
+        write_doc(guide / "hooks.htm", "Guide page about hooks")
+        write_doc(api / "domains.htm", "API reference page about domains")
+        with patch("server.DOCS_DIR", guide), \
+             patch("server.CORPORA", f"api={api},cli={temp_dir / 'cli.zip'}"):
+            yield db
+
+    async def test_corpus_has_own_collection_and_files(self, db, isolated_storage):
+        """Test that a corpus is indexed into its own collection and storage folder"""
+        await server.run_index()
+        await server.run_index(corpus="api")
+
+        assert db.collections["plesk_docs_g1"].count() == 1
+        assert db.collections["plesk_docs-api_g1"].count() == 1
+        assert "domains.htm" in server.load_manifest("api")
+        assert "hooks.htm" in server.load_manifest()
+        assert (isolated_storage / "corpora" / "api" / "lexical_index.g1.json").exists()
+
+    def test_default_corpus_skips_other_corpus_folders(self, db, temp_dir):
+        """Test that a corpus folder inside DOCS_DIR is not indexed into the default corpus too"""
+        with patch("server.DOCS_DIR", temp_dir):
+            assert list(server.list_doc_files()) == ["guide/hooks.htm"]
+        assert list(server.list_doc_files("api")) == ["domains.htm"]
+
+    async def test_search_by_corpus(self, db):
+        """Test that corpus selects the doc set a search runs against"""
+        await server.run_index()
+        await server.run_index(corpus="api")
+
+        guide = await search("page")
+        api = await search("page", corpus="api")
+
+        assert "hooks.htm" in guide and "domains.htm" not in guide
+        assert "domains.htm" in api and "hooks.htm" not in api
+
+    async def test_fan_out_merges_corpora(self, db):
+        """Test that corpus="all" searches every indexed corpus with one embedding call"""
+        await server.run_index()
+        await server.run_index(corpus="api")
+        db.mock_ef.reset_mock()
+
+        with patch("server.HYBRID_SEARCH", False):
+            result = await search("page about", n_results=2, corpus="all")
+
+        # cli is configured but not indexed yet, so it is skipped
+        assert "(extensions-guide: hooks.htm)" in result
+        assert "(api: domains.htm)" in result
+        db.mock_ef.assert_called_once_with(["page about"])
+
+    async def test_batch_fan_out(self, db):
+        """Test that batch searches fan out too"""
+        await server.run_index()
+        await server.run_index(corpus="api")
+
+        result = await server.search_extensions_guide_batch(["hooks", "domains"], corpus="all")
+
+        assert "api: domains.htm" in result and "extensions-guide: hooks.htm" in result
+
+    async def test_generations_of_other_corpora_are_kept(self, db):
+        """Test that collecting old generations only touches the corpus being indexed"""
+        await server.run_index(corpus="api")
+        for _ in range(3):
+            await server.run_index(force=True)
+
+        assert "plesk_docs-api_g1" in db.collections
+        assert sorted(name for name in db.collections if name.startswith("plesk_docs_g")) == ["plesk_docs_g2", "plesk_docs_g3"]
+
+    async def test_zip_corpus(self, db, temp_dir):
+        """Test that a corpus path ending in .zip is read from the archive"""
+        with zipfile.ZipFile(temp_dir / "cli.zip", "w") as archive:
+            archive.writestr("plesk-cli.htm", "<html><body>The plesk bin utilities manage the server from the shell.</body></html>")
+
+        result = await server.run_index(corpus="cli")
+
+        assert "Processed 1 documentation files" in result
+        assert db.collections["plesk_docs-cli_g1"].count() == 1
+
+    async def test_index_job_records_corpus(self, db):
+        """Test that index jobs run against the requested corpus"""
+        started = await server.index_extensions_guide(corpus="api")
+        job = await server.wait_for_index_job(started["job_id"], timeout_seconds=10)
+
+        assert job["corpus"] == "api"
+        assert job["status"] == "completed"
+        assert "plesk_docs-api_g1" in db.collections
+
+    async def test_unknown_corpus(self, db):
+        """Test that an unknown corpus is rejected with the available names"""
+        with pytest.raises(ValueError, match="Unknown corpus 'docs'; available: extensions-guide, api, cli"):
+            await search("page", corpus="docs")
+        with pytest.raises(ValueError, match="Unknown corpus"):
+            await server.index_extensions_guide(corpus="docs")
+
+    async def test_idle_corpus_is_evicted(self, db):
+        """Test that a corpus unused for CORPUS_IDLE_SECONDS is dropped and reopened on demand"""
+        await server.run_index()
+        await server.run_index(corpus="api")
+        with patch("server.CORPUS_IDLE_SECONDS", 0.05):
+            server.resources.reset()
+            await search("page", corpus="api")
+            time.sleep(0.1)
+            await search("page")
+            health = await server.get_server_health()
+            assert health["corpora"]["api"]["loaded"] is False
+            result = await search("something else", corpus="api")
+
+        assert "domains.htm" in result
+        assert server.resources.corpora.evictions == 1
+
+
+class TestChunkedIndexing:
+    """Tests for section-level chunks in index_extensions_guide"""
+
+    PAGE = """
+    <html><head><title>Hooks — Developing Extensions for Plesk</title></head><body>
+    <div itemprop="articleBody">
+        <div class="section" id="hooks"><h1>Hooks</h1><p>Hooks let extensions react to Plesk events.</p>
+            <div class="section" id="registering"><h2>Registering</h2><p>Put the hook class into plib/hooks.</p></div>
+        </div>
+    </div></body></html>
+    """
+
+    @pytest.fixture
+    def mock_collection(self):
+        collection = MagicMock()
+        db_instance = MagicMock()
+        db_instance.get_or_create_collection.return_value = collection
+        with patch("server.get_db_client", return_value=db_instance), \
+             patch("server.get_embedding_fn", return_value=MagicMock(side_effect=zero_embeddings)):
+            yield collection
+
+    async def test_sections_are_indexed_as_chunks(self, mock_collection, temp_dir):
+        """Test that each section becomes its own document with section metadata"""
+        (temp_dir / "hooks.htm").write_text(self.PAGE, encoding="utf-8")
+        
+        with patch("server.DOCS_DIR", temp_dir):
+            result = await server.run_index()
+        
+        assert "Processed 1 documentation files in 1 batches, 2 chunks" in result
+        upsert = mock_collection.upsert.call_args.kwargs
+        assert upsert["ids"] == ["hooks.htm#0", "hooks.htm#1"]
+        assert upsert["metadatas"][1] == {
+            "title": "Hooks", "filename": "hooks.htm", "section": "Registering", "anchor": "registering", "chunk": 1,
+        }
+        assert upsert["documents"][1].startswith("Title: Hooks\nSection: Registering\nFile: hooks.htm\n---\n")
+
+    async def test_partially_written_file_is_retried(self, mock_collection, temp_dir, capsys):
+        """Test that a file whose chunks failed in one batch is not recorded as indexed"""
+        (temp_dir / "hooks.htm").write_text(self.PAGE, encoding="utf-8")
+        upserts = []
+
+        def upsert(**kwargs):
+            # Only the first batch is written; the second fails again when retried at the end
+            upserts.append(kwargs)
+            if len(upserts) > 1:
+                raise Exception("Upsert failed")
+
+        mock_collection.upsert.side_effect = upsert
+        
+        with patch("server.DOCS_DIR", temp_dir):
+            result = await server.run_index(batch_size=1)
+        
+        assert "Processed 0 documentation files in 1 batches, 1 chunks" in result
+        assert "not indexed: hooks.htm" in result
+        assert server.load_manifest() == {}
+        assert "Failed to index hooks.htm: Upsert failed" in capsys.readouterr().out
+
+
+class TestSearchOutput:
+    """Tests for chunk-level search results"""
+
+    @pytest.fixture
+    def mock_collection(self):
+        collection = MagicMock()
+        db_instance = MagicMock()
+        db_instance.get_collection.return_value = collection
+        with patch("server.get_db_client", return_value=db_instance), \
+             patch("server.get_embedding_fn"):
+            yield collection
+
+    def hit(self, filename, chunk, text, section="Section"):
+        document = f"Title: Page\nSection: {section}\nFile: {filename}\n---\n{text}"
+        meta = {"title": "Page", "filename": filename, "section": section, "anchor": section.lower(), "chunk": chunk}
+        return document, meta
+
+    def set_hits(self, mock_collection, hits):
+        mock_collection.query.return_value = {
+            "ids": [[f"chunk{i}" for i in range(len(hits))]],
+            "documents": [[document for document, _ in hits]],
+            "metadatas": [[meta for _, meta in hits]],
+        }
+
+    async def test_chunk_label_includes_section_anchor(self, mock_collection):
+        """Test that chunk hits name their section and link to its anchor"""
+        self.set_hits(mock_collection, [self.hit("a.htm", 0, "alpha", section="Intro")])
+        
+        result = await search("query")
+        
+        assert "=== DOC: Page — Intro (a.htm#intro) ===" in result
+
+    async def test_merge_pages(self, mock_collection):
+        """Test that chunks are grouped per page in reading order"""
+        self.set_hits(mock_collection, [
+            self.hit("a.htm", 2, "alpha two"),
+            self.hit("b.htm", 0, "beta zero"),
+            self.hit("a.htm", 0, "alpha zero"),
+            self.hit("c.htm", 0, "gamma zero"),
+        ])
+        
+        result = await search("query", n_results=2, merge_pages=True)
+        
+        mock_collection.query.assert_called_once()
+        assert mock_collection.query.call_args.kwargs["n_results"] == 8
+        assert result.index("alpha zero") < result.index("alpha two") < result.index("beta zero")
+        assert "gamma" not in result
+        assert result.count("Title: Page") == 0
+        assert "=== DOC: Page (a.htm) ===" in result
+
+    async def test_output_is_capped(self, mock_collection):
+        """Test that the output never exceeds SEARCH_MAX_OUTPUT_CHARS"""
+        self.set_hits(mock_collection, [self.hit(f"{i}.htm", 0, "z" * 500) for i in range(3)])
+        
+        with patch("server.SEARCH_MAX_OUTPUT_CHARS", 800):
+            result = await search("query")
+        
+        assert len(result) <= 800
+        assert result.rstrip().endswith("[output truncated]")
+        assert "0.htm" in result
+
+    async def test_invalid_n_results(self):
+        """Test that n_results below 1 is rejected"""
+        with pytest.raises(ValueError, match="n_results must be at least 1"):
+            await search("query", n_results=0)
+
+    async def test_one_content_block_per_hit_without_chunk_header(self, mock_collection):
+        """Test that every hit is its own content block, headed once"""
+        self.set_hits(mock_collection, [self.hit("a.htm", 0, "alpha"), self.hit("b.htm", 0, "beta")])
+
+        blocks = await server.search_extensions_guide("query")
+
+        assert [block.type for block in blocks] == ["text", "text"]
+        assert blocks[0].text == "=== DOC: Page — Section (a.htm#section) ===\nalpha\n"
+        assert "Title:" not in blocks[1].text and "File:" not in blocks[1].text
+
+    async def test_token_budget_keeps_matching_sentences(self, mock_collection):
+        """Test that hits longer than their share of max_tokens are cut down to the sentences matching the query"""
+        filler = "\n".join(f"Unrelated sentence number {i} about something else." for i in range(20))
+        self.set_hits(mock_collection, [
+            self.hit("a.htm", 0, f"{filler}\nRegister the hook in meta.xml.\n{filler}"),
+            self.hit("b.htm", 0, f"{filler}\nHooks run after install.\n{filler}"),
+        ])
+
+        result = await search("register hook install", max_tokens=100)
+
+        assert len(result) <= 400
+        assert "Register the hook in meta.xml." in result
+        assert "Hooks run after install." in result
+        assert "…" in result and "[output truncated]" not in result
+
+    async def test_budget_is_part_of_the_cache_key(self, mock_collection):
+        """Test that a search with another budget is not answered from the cache"""
+        self.set_hits(mock_collection, [self.hit("a.htm", 0, "alpha " * 200)])
+
+        full = await search("query")
+        short = await search("query", max_chars=300)
+
+        assert len(short) <= 300 < len(full)
+
+    async def test_invalid_budget(self):
+        """Test that budgets below 1 are rejected"""
+        with pytest.raises(ValueError, match="max_chars must be at least 1"):
+            await search("query", max_chars=0)
+        with pytest.raises(ValueError, match="max_tokens must be at least 1"):
+            await search("query", max_tokens=0)
+
+    async def test_hits_are_streamed_as_progress(self, mock_collection):
+        """Test that each formatted hit is sent as a progress notification"""
+        self.set_hits(mock_collection, [self.hit("a.htm", 0, "alpha"), self.hit("b.htm", 0, "beta")])
+        ctx = MagicMock()
+        ctx.report_progress = AsyncMock()
+
+        blocks = await server.search_extensions_guide("query", ctx=ctx)
+
+        assert [call.args for call in ctx.report_progress.call_args_list] == [
+            (1, 2, blocks[0].text), (2, 2, blocks[1].text),
+        ]
+
+
+class TestHybridSearch:
+    """Tests for BM25 + vector retrieval"""
+
+    async def index_hooks_page(self, temp_dir):
+        # The fake vector query ranks events.htm first
+        (temp_dir / "events.htm").write_text(
+            "<html><head><title>Events</title></head><body>"
+            "<p>Plesk emits events whenever a domain or a subscription changes.</p></body></html>",
+            encoding="utf-8",
+        )
+        (temp_dir / "hooks.htm").write_text(
+            "<html><head><title>Hooks</title></head><body>"
+            "<p>Implement pm_Hook_Interface to react to Plesk events in your extension.</p></body></html>",
+            encoding="utf-8",
+        )
+        with patch("server.DOCS_DIR", temp_dir):
+            await server.run_index()
+
+    async def test_index_builds_and_persists_lexical_index(self, db, temp_dir, isolated_storage):
+        """Test that indexed chunks are written to the lexical index of the generation on disk"""
+        await self.index_hooks_page(temp_dir)
+
+        loaded = server.BM25Index.load(isolated_storage / "lexical_index.g1.json")
+        assert len(loaded) == 2
+        assert loaded.has_exact("pm_Hook_Interface")
+
+    async def test_identifier_query_skips_embedding(self, db, temp_dir):
+        """Test that an identifier found verbatim is answered from the lexical index"""
+        await self.index_hooks_page(temp_dir)
+        db.mock_ef.reset_mock()
+
+        result = await search("pm_Hook_Interface")
+
+        assert "=== DOC: Hooks (hooks.htm) ===" in result
+        db.mock_ef.assert_not_called()
+        live_collection(db).query.assert_not_called()
+
+    async def test_scoring_and_indexing_run_off_the_event_loop(self, db, temp_dir):
+        """Test that BM25 scoring and adding chunks to the keyword index run on worker threads"""
+        threads = []
+        search_fn, add_fn = server.BM25Index.search, server.BM25Index.add
+
+        def record(fn):
+            def wrapper(*args, **kwargs):
+                threads.append(threading.current_thread())
+                return fn(*args, **kwargs)
+            return wrapper
+
+        with patch("server.BM25Index.search", record(search_fn)), patch("server.BM25Index.add", record(add_fn)):
+            await self.index_hooks_page(temp_dir)
+            await search("pm_Hook_Interface")
+
+        assert len(threads) >= 2
+        assert threading.main_thread() not in threads
+
+    async def test_prose_query_fuses_rankings(self, db, temp_dir):
+        """Test that prose queries combine vector and BM25 hits"""
+        await self.index_hooks_page(temp_dir)
+
+        result = await search("implement the hook interface", n_results=2)
+
+        query = live_collection(db).query
+        query.assert_called_once()
+        assert query.call_args.kwargs["n_results"] == 4
+        assert "events.htm" in result
+        assert "hooks.htm" in result
+
+    async def test_hybrid_search_disabled(self, db, temp_dir):
+        """Test that HYBRID_SEARCH=0 falls back to vector search only"""
+        await self.index_hooks_page(temp_dir)
+
+        with patch("server.HYBRID_SEARCH", False):
+            result = await search("pm_Hook_Interface", n_results=1)
+
+        live_collection(db).query.assert_called_once()
+        assert "hooks.htm" not in result
+
+    async def test_removed_file_leaves_lexical_index(self, db, temp_dir):
+        """Test that deleted pages are dropped from the lexical index"""
+        await self.index_hooks_page(temp_dir)
+        (temp_dir / "hooks.htm").unlink()
+
+        with patch("server.DOCS_DIR", temp_dir):
+            await server.run_index()
+
+        assert not server.resources.corpus().lexical_index.search("pm_Hook_Interface", 3)
+        assert len(server.resources.corpus().lexical_index) == 1
+
+    async def test_missing_lexical_index_triggers_full_reindex(self, db, temp_dir, isolated_storage):
+        """Test that an index built before the lexical index existed is rebuilt"""
+        await self.index_hooks_page(temp_dir)
+        (isolated_storage / "lexical_index.g1.json").unlink()
+        server.resources.reset()
+
+        with patch("server.DOCS_DIR", temp_dir):
+            result = await server.run_index()
+
+        assert "Processed 2 documentation files" in result
+        assert len(server.resources.corpus().lexical_index) == 2
+
+
+class TestRerank:
+    """Tests for MMR and cross-encoder re-ranking of search candidates"""
+
+    @pytest.fixture
+    def embed(self):
+        return lambda docs: [[1.0, 0.0]] * len(docs)
+
+    @pytest.fixture
+    def db(self, db):
+        with patch("server.HYBRID_SEARCH", False), patch("server.MMR_LAMBDA", 0.3):
+            # a1 and a2 are near-duplicates; the fake query ranks them first
+            db.get_or_create_collection(server.generation_name(0)).upsert(
+                ids=["a1", "a2", "b1"],
+                embeddings=[[1.0, 0.0], [0.99, 0.14], [0.7, 0.71]],
+                documents=["Alpha setup", "Alpha setup again", "Beta hooks"],
+                metadatas=[{"title": "A", "filename": "a.htm"}, {"title": "A", "filename": "a2.htm"}, {"title": "B", "filename": "b.htm"}],
+            )
+            yield db
+
+    def query(self, db):
+        return db.collections[server.generation_name(0)].query
+
+    async def test_mmr_skips_near_duplicates(self, db):
+        """Test that MMR replaces a near-duplicate with a different section"""
+        plain = await search("alpha", n_results=2)
+        with patch("server.RERANK", "mmr"):
+            diverse = await search("alpha", n_results=2, candidates=3)
+
+        assert "a2.htm" in plain and "b.htm" not in plain
+        assert "a.htm" in diverse and "b.htm" in diverse and "a2.htm" not in diverse
+
+    async def test_candidate_pool_is_retrieved(self, db):
+        """Test that re-ranking retrieves the candidate pool instead of n_results"""
+        with patch("server.RERANK", "mmr"), patch("server.RERANK_CANDIDATES", 5):
+            await search("alpha", n_results=1)
+            await search("beta", n_results=1, candidates=3)
+
+        assert [call.kwargs["n_results"] for call in self.query(db).call_args_list] == [5, 3]
+
+    async def test_without_rerank_pool_is_n_results(self, db):
+        """Test that the candidate pool is ignored when re-ranking is off"""
+        await search("alpha", n_results=1, candidates=10)
+
+        assert self.query(db).call_args.kwargs["n_results"] == 1
+
+    async def test_budget_exceeded_keeps_retrieval_order(self, db):
+        """Test that a re-ranking slower than the budget falls back to the retrieval order"""
+        def slow_rerank(*args):
+            time.sleep(0.2)
+            return [2, 0]
+
+        with patch("server.RERANK", "mmr"), patch("server.RERANK_BUDGET_MS", 20), \
+             patch("rerank.rerank", slow_rerank):
+            result = await search("alpha", n_results=2, candidates=3)
+
+        assert "a.htm" in result and "a2.htm" in result and "b.htm" not in result
+        assert (await server.get_server_metrics())["counters"]["search.rerank_fallbacks"] == 1
+
+    async def test_batch_search_is_reranked(self, db):
+        """Test that every query of a batch is re-ranked"""
+        with patch("server.RERANK", "mmr"), patch("server.RERANK_CANDIDATES", 3):
+            result = await server.search_extensions_guide_batch(["alpha", "setup"], n_results=2)
+
+        assert "a2.htm" not in result
+        assert result.count("b.htm") == 2
+
+    async def test_invalid_candidates(self, db):
+        """Test that a candidate pool below 1 is rejected"""
+        with pytest.raises(ValueError, match="candidates must be at least 1"):
+            await search("alpha", candidates=0)
+
+    async def test_unknown_stage(self, db):
+        """Test that an unknown RERANK stage is reported"""
+        with patch("server.RERANK", "bm25"), pytest.raises(ValueError, match="Unknown RERANK stage"):
+            await search("alpha")
+
+
+class TestCompactIndex:
+    """Tests for the quantized compact storage mode"""
+
+    @pytest.fixture
+    def embed(self):
+        def embed(docs):
+            # Pages mentioning "hooks" point one way, everything else another
+            return [[1.0, 0.1, 0.0, 0.0] if "hook" in doc.lower() else [0.0, 0.1, 1.0, 0.0] for doc in docs]
+        return embed
+
+    @pytest.fixture
+    def db(self, db):
+        with patch("server.COMPACT_INDEX", "int8"), patch("server.HYBRID_SEARCH", False):
+            yield db
+
+    def write_pages(self, temp_dir):
+        (temp_dir / "hooks.htm").write_text(
+            "<html><head><title>Hooks</title></head><body><p>Hooks let an extension react to Plesk events "
+            "as they happen.</p></body></html>", encoding="utf-8")
+        (temp_dir / "backup.htm").write_text(
+            "<html><head><title>Backup</title></head><body><p>Extensions can take part in backup and "
+            "restore of subscriptions.</p></body></html>", encoding="utf-8")
+
+    async def test_index_and_search(self, db, temp_dir, isolated_storage):
+        """Test that searches are ranked by the compact index, not collection.query"""
+        self.write_pages(temp_dir)
+        with patch("server.DOCS_DIR", temp_dir):
+            await server.run_index()
+
+        result = await search("hooks", n_results=1)
+
+        collection = db.collections["plesk_docs_g1"]
+        assert (isolated_storage / "compact_index.g1" / "codes.npy").exists()
+        assert "(hooks.htm)" in result and "backup.htm" not in result
+        collection.query.assert_not_called()
+        assert collection.get.call_args.kwargs["ids"] == ["hooks.htm#0"]
+
+    async def test_health_reports_memory(self, db, temp_dir):
+        """Test that get_server_health reports the compact index size"""
+        self.write_pages(temp_dir)
+        with patch("server.DOCS_DIR", temp_dir):
+            await server.run_index()
+
+        health = await server.get_server_health()
+
+        assert health["compact_index"]["vectors"] == 2
+        assert health["compact_index"]["resident_bytes"] < health["compact_index"]["float32_bytes"]
+
+    async def test_enabling_compact_mode_reindexes(self, db, temp_dir):
+        """Test that an index built without the compact index is rebuilt once it is enabled"""
+        self.write_pages(temp_dir)
+        with patch("server.DOCS_DIR", temp_dir), patch("server.COMPACT_INDEX", ""):
+            await server.run_index()
+        server.resources.reset()
+
+        with patch("server.DOCS_DIR", temp_dir):
+            result = await server.run_index()
+
+        assert "Processed 2 documentation files" in result
+        assert len(server.resources.corpus().compact_index) == 2
+
+    async def test_unchanged_pages_carry_over(self, db, temp_dir):
+        """Test that a new generation keeps the compact rows of unchanged pages"""
+        self.write_pages(temp_dir)
+        with patch("server.DOCS_DIR", temp_dir):
+            await server.run_index()
+            (temp_dir / "backup.htm").unlink()
+            await server.run_index()
+
+        result = await search("hooks", n_results=2)
+
+        assert len(server.resources.corpus().compact_index) == 1
+        assert "(hooks.htm)" in result and "backup.htm" not in result
+
+    def test_reduced_dimensions_change_the_model_id(self):
+        """Test that EMBEDDING_DIMENSIONS is sent upstream and recorded with the model"""
+        with patch("server.EMBEDDING_DIMENSIONS", 512), patch("server.EMBEDDING_BACKEND", "openrouter"), \
+             patch.dict(os.environ, {"OPENROUTER_API_KEY": "test"}):
+            assert server.embedding_model_id() == "text-embedding-3-small@512"
+            assert server.create_backend_fn().dimensions == 512
+
+
+class TestHNSWSettings:
+    """Tests for the HNSW settings of the collections and measure_search_recall"""
+
+    @pytest.fixture
+    def embed(self):
+        return lambda docs: [[float(len(doc) % 7), 1.0, float(len(doc) % 3)] for doc in docs]
+
+    def write_pages(self, temp_dir, count=3):
+        for i in range(count):
+            (temp_dir / f"page{i}.htm").write_text(
+                f"<html><body>Page {i} {'text ' * i}with enough length to meet the 50 character requirement.</body></html>",
+                encoding="utf-8",
+            )
+
+    async def test_settings_are_applied_and_recorded(self, db, temp_dir):
+        """Test that a new generation is built with the configured HNSW settings"""
+        self.write_pages(temp_dir)
+
+        with patch("server.DOCS_DIR", temp_dir), patch("server.HNSW_SPACE", "cosine"), \
+             patch("server.HNSW_M", 32), patch("server.HNSW_EF_SEARCH", 50):
+            await server.run_index()
+
+        collection = db.collections["plesk_docs_g1"]
+        assert collection.configuration["hnsw"] == {"space": "cosine", "max_neighbors": 32, "ef_search": 50}
+        assert collection.metadata["hnsw"] == "max_neighbors=32,space=cosine"
+
+    async def test_changed_build_settings_rebuild_without_embedding(self, db, temp_dir):
+        """Test that new build settings give a new generation of the stored embeddings"""
+        self.write_pages(temp_dir)
+        with patch("server.DOCS_DIR", temp_dir):
+            await server.run_index()
+            embedding_fn = server.resources.embedding_fn
+            embedding_fn.reset_mock()
+            with patch("server.HNSW_EF_CONSTRUCTION", 200):
+                result = await server.run_index()
+                unchanged = await server.run_index()
+
+        assert "Serving generation 2" in result
+        embedding_fn.assert_not_called()
+        assert db.collections["plesk_docs_g2"].configuration["hnsw"] == {"ef_construction": 200}
+        assert db.collections["plesk_docs_g2"].count() == 3
+        assert "Processed 0 documentation files" in unchanged and "Serving generation 2" in unchanged
+
+    async def test_search_settings_are_applied_to_the_live_collection(self, db, temp_dir):
+        """Test that ef_search is changed on an existing collection when it is opened"""
+        self.write_pages(temp_dir)
+        with patch("server.DOCS_DIR", temp_dir):
+            await server.run_index()
+        server.resources.reset()
+
+        with patch("server.HNSW_EF_SEARCH", 80):
+            server.resources.corpus().collection()
+
+        collection = db.collections["plesk_docs_g1"]
+        collection.modify.assert_called_once_with(configuration={"hnsw": {"ef_search": 80}})
+        assert collection.configuration["hnsw"]["ef_search"] == 80
+
+    def test_unknown_space(self):
+        """Test that an unknown HNSW_SPACE is rejected"""
+        with patch("server.HNSW_SPACE", "dot"), pytest.raises(ValueError, match="Unknown HNSW_SPACE 'dot'"):
+            server.hnsw_build_settings()
+
+    def test_checkpoint_with_other_settings_is_not_resumed(self):
+        """Test that a run does not resume a generation built with other HNSW settings"""
+        with patch("server.HNSW_M", 32):
+            checkpoint = {"generation": 2, "chunker": server.CHUNKER, "embedding_model": server.embedding_model_id(),
+                          "compact_index": server.COMPACT_INDEX, "hnsw": server.hnsw_id()}
+        assert not server.resumable(checkpoint, 1, False)
+        assert server.resumable({**checkpoint, "hnsw": ""}, 1, False)
+
+    async def test_measure_search_recall(self, db, temp_dir):
+        """Test that the recall tool reports one row per ef_search value and restores the setting"""
+        self.write_pages(temp_dir, count=5)
+        with patch("server.DOCS_DIR", temp_dir), patch("server.HNSW_EF_SEARCH", 40):
+            await server.run_index()
+
+            report = await server.measure_search_recall(k=2, sample_size=3, ef_search=[10, 100])
+
+        assert report["generation"] == 1
+        assert report["settings"] == {"ef_search": 40}
+        assert [row["ef_search"] for row in report["results"]] == [10, 100]
+        assert all(row["k"] == 2 and row["queries"] == 3 and row["vectors"] == 5 for row in report["results"])
+        assert all(0.0 <= row["recall"] <= 1.0 for row in report["results"])
+        assert db.collections["plesk_docs_g1"].configuration["hnsw"]["ef_search"] == 40
+
+    async def test_measure_search_recall_validates(self):
+        """Test that invalid recall parameters are rejected"""
+        with pytest.raises(ValueError, match="k must be at least 1"):
+            await server.measure_search_recall(k=0)
+        with pytest.raises(ValueError, match="sample_size must be at least 1"):
+            await server.measure_search_recall(sample_size=0)
+        with pytest.raises(ValueError, match="ef_search values must be at least 1"):
+            await server.measure_search_recall(ef_search=[0])
+
+
+class TestBatchSearch:
+    """Tests for search_extensions_guide_batch"""
+
+    @pytest.fixture
+    def mock_collection(self):
+        collection = MagicMock()
+        db_instance = MagicMock()
+        db_instance.get_collection.return_value = collection
+        with patch("server.get_db_client", return_value=db_instance), \
+             patch("server.get_embedding_fn", return_value=MagicMock(side_effect=lambda docs: [[float(len(doc))] for doc in docs])) as mock_embedding_fn:
+            collection.mock_ef = mock_embedding_fn.return_value
+            yield collection
+
+    def hit(self, filename, text):
+        return f"Title: Page\nFile: {filename}\n---\n{text}", {"title": "Page", "filename": filename}
+
+    def set_rows(self, mock_collection, rows):
+        mock_collection.query.return_value = {
+            "ids": [[meta["filename"] for _, meta in row] for row in rows],
+            "documents": [[document for document, _ in row] for row in rows],
+            "metadatas": [[meta for _, meta in row] for row in rows],
+        }
+
+    async def test_one_embedding_request_and_one_query(self, mock_collection):
+        """Test that all queries share one embedding call and one collection.query"""
+        self.set_rows(mock_collection, [[self.hit("a.htm", "alpha")], [self.hit("b.htm", "beta")]])
+        
+        result = await server.search_extensions_guide_batch(["first question", "second question"])
+        
+        mock_collection.mock_ef.assert_called_once_with(["first question", "second question"])
+        mock_collection.query.assert_called_once()
+        assert len(mock_collection.query.call_args.kwargs["query_embeddings"]) == 2
+        assert result.index("##### Query 1: first question") < result.index("alpha")
+        assert result.index("alpha") < result.index("##### Query 2: second question") < result.index("beta")
+
+    async def test_shared_sections_are_not_repeated(self, mock_collection):
+        """Test that a section returned for two queries is printed once"""
+        shared = self.hit("a.htm", "shared text")
+        self.set_rows(mock_collection, [[shared], [shared, self.hit("b.htm", "beta")]])
+        
+        result = await server.search_extensions_guide_batch(["first", "second"])
+        
+        assert result.count("shared text") == 1
+        assert "(same section as in an earlier result)" in result
+        assert "beta" in result
+
+    async def test_duplicate_queries_are_merged(self, mock_collection):
+        """Test that queries differing only in case and spacing run once"""
+        self.set_rows(mock_collection, [[self.hit("a.htm", "alpha")]])
+        
+        result = await server.search_extensions_guide_batch(["Hooks  list", "hooks list", ""])
+        
+        mock_collection.mock_ef.assert_called_once_with(["Hooks  list"])
+        assert result.count("##### Query") == 1
+
+    async def test_total_output_budget(self, mock_collection):
+        """Test that max_chars bounds the whole batch output"""
+        self.set_rows(mock_collection, [[self.hit(f"{i}{j}.htm", "z" * 400) for j in range(3)] for i in range(3)])
+        
+        result = await server.search_extensions_guide_batch(["q1", "q2", "q3"], max_chars=1500)
+        
+        assert len(result) <= 1500
+        assert result.count("##### Query") == 3
+
+    @pytest.mark.parametrize("max_chars", [50, 100, 281, 1500])
+    async def test_budget_is_a_hard_cap(self, mock_collection, max_chars):
+        """Test that separators, headings and truncation markers all fit in max_chars"""
+        self.set_rows(mock_collection, [[self.hit(f"{i}{j}.htm", "z" * 400) for j in range(2)] for i in range(6)])
+
+        result = await server.search_extensions_guide_batch([f"query {i}" for i in range(6)], max_chars=max_chars)
+
+        assert len(result) <= max_chars
+        assert result.startswith("##### Query 1: query 0")
+
+    async def test_token_budget(self, mock_collection):
+        """Test that max_tokens bounds the batch output and long sections are cut down to matching sentences"""
+        text = "\n".join(f"Sentence {i} of the section." for i in range(40)) + "\nThe hooks answer."
+        self.set_rows(mock_collection, [[self.hit("a.htm", text)], [self.hit("b.htm", text.replace("hooks", "forms"))]])
+
+        result = await server.search_extensions_guide_batch(["hooks", "forms"], max_tokens=100)
+
+        assert len(result) <= 400
+        assert "The hooks answer." in result and "The forms answer." in result
+
+    async def test_invalid_batches(self):
+        """Test that empty and oversized batches are rejected"""
+        with pytest.raises(ValueError, match="at least one non-empty query"):
+            await server.search_extensions_guide_batch(["  "])
+        with patch("server.SEARCH_BATCH_MAX_QUERIES", 2), \
+             pytest.raises(ValueError, match="at most 2 queries"):
+            await server.search_extensions_guide_batch(["a", "b", "c"])
+
+
+class TestServerMetrics:
+    """Tests for stage timings and the get_server_metrics tool"""
+
+    async def test_search_stages_are_timed(self, hooks_collection):
+        """Test that every search stage records a span"""
+        await search("hooks")
+        await search("hooks")
+        
+        metrics = await server.get_server_metrics()
+        
+        assert metrics["counters"]["search.calls"] == 2
+        assert metrics["counters"]["search.cache_hits"] == 1
+        assert metrics["timings_ms"]["search.total"]["count"] == 2
+        for stage in ("open", "lexical", "embed", "query", "format"):
+            assert metrics["timings_ms"][f"search.{stage}"]["count"] == 1
+
+    async def test_index_stages_are_timed(self, hooks_collection, temp_dir):
+        """Test that indexing records per-file and per-batch spans"""
+        for name in ("doc1.htm", "doc2.htm"):
+            (temp_dir / name).write_text("<html><body>Document with enough length to meet the 50 character requirement.</body></html>", encoding="utf-8")
+        
+        with patch("server.DOCS_DIR", temp_dir):
+            await server.run_index(batch_size=1)
+        metrics = await server.get_server_metrics()
+        
+        assert metrics["counters"]["index.files"] == 2
+        assert metrics["timings_ms"]["index.parse"]["count"] >= 2
+        assert metrics["timings_ms"]["index.embed"]["count"] == 2
+        assert metrics["timings_ms"]["index.write"]["count"] == 2
+
+    async def test_errors_are_counted(self):
+        """Test that a failing tool call increments its error counter"""
+        with pytest.raises(ValueError):
+            await search("query", n_results=0)
+        
+        metrics = await server.get_server_metrics()
+        
+        assert metrics["counters"]["search.errors"] == 1
+
+    async def test_prometheus_format(self, hooks_collection):
+        """Test that prometheus=True returns the text exposition format"""
+        await search("hooks")
+        
+        text = await server.get_server_metrics(prometheus=True)
+        
+        assert "plesk_docs_search_calls_total 1" in text
+        assert "plesk_docs_search_embed_seconds_count 1" in text
+
+    async def test_profiler_captures_a_slow_search(self, hooks_collection):
+        """Test that an armed profiler keeps the report of the next slow call"""
+        status = await server.get_server_metrics(arm_profiler=True, profile_threshold_ms=0)
+        assert status["profiler"]["armed"]
+        
+        await search("hooks")
+        metrics = await server.get_server_metrics()
+        
+        assert not metrics["profiler"]["armed"]
+        assert metrics["profile"]["request"] == "search_extensions_guide"
+        assert "function calls" in metrics["profile"]["report"]
+
+
+class TestStartup:
+    """Tests for the cost of importing server.py"""
+
+    # Import time allowed for server.py on top of FastMCP itself
+    IMPORT_BUDGET_MS = 250
+    HEAVY_MODULES = ("chromadb", "bs4", "openai", "numpy")
+
+    def import_server(self):
+        """Imports server in a fresh interpreter; returns (own import ms, loaded heavy modules)."""
+        code = (
+            "import sys, server; "
+            f"print(','.join(m for m in {self.HEAVY_MODULES!r} if m in sys.modules))"
+        )
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            capture_output=True, text=True, check=True, cwd=Path(server.__file__).parent,
+        )
+        cumulative = {}
+        for line in result.stderr.splitlines():
+            fields = line.removeprefix("import time:").split("|")
+            if len(fields) == 3 and fields[1].strip().isdigit():
+                cumulative.setdefault(fields[2].strip(), int(fields[1]))
+        own_us = cumulative["server"] - cumulative.get("fastmcp", 0)
+        return own_us / 1000, result.stdout.strip()
+
+    def test_heavy_dependencies_load_on_first_use(self):
+        """Test that importing server loads neither chromadb, bs4, openai nor numpy"""
+        _, loaded = self.import_server()
+        
+        assert loaded == ""
+
+    @pytest.mark.benchmark
+    def test_import_time_budget(self):
+        """Test that server.py adds little import time beyond FastMCP"""
+        # Wall-clock timing flakes on loaded runners, so this only runs with
+        # -m benchmark; the heavy-module check above is the hard gate
+        # The first run may compile bytecode; the best of two is the steady state
+        best = min(self.import_server()[0] for _ in range(2))
+        
+        assert best < self.IMPORT_BUDGET_MS
+
+    def test_import_does_not_create_storage(self, tmp_path):
+        """Test that importing server leaves storage/ uncreated"""
+        # STORAGE_DIR sits next to server.py, so import a copy from tmp_path
+        for module in Path(server.__file__).parent.glob("*.py"):
+            (tmp_path / module.name).write_bytes(module.read_bytes())
+        subprocess.run(
+            [sys.executable, "-c", "import server"],
+            capture_output=True, text=True, check=True, cwd=tmp_path,
+        )
+        
+        assert not (tmp_path / "storage").exists()
+
+    def test_storage_is_created_on_first_write(self, tmp_path):
+        """Test that storage/ is created on first write"""
+        storage = tmp_path / "storage"
+        with patch("server.STORAGE_DIR", storage), \
+             patch("server.MANIFEST_PATH", storage / "index_manifest.json"):
+            server.save_manifest({})
+        
+        assert storage.exists()
+
+
+class TestAsyncTools:
+    """Tests for the async tool implementations"""
+
+    async def test_concurrent_searches_do_not_queue(self):
+        """Test that a slow embedding call does not block other searches"""
+        def slow_embedding(texts):
+            time.sleep(0.2)
+            return [[0.0]] * len(texts)
+        
+        db_instance = MagicMock()
+        db_instance.get_collection.return_value.query.return_value = {"ids": [[]], "documents": [[]], "metadatas": [[]]}
+        with patch("server.get_db_client", return_value=db_instance), \
+             patch("server.get_embedding_fn", return_value=MagicMock(side_effect=slow_embedding)):
+            started = time.perf_counter()
+            results = await asyncio.gather(*(search(f"query {i}") for i in range(4)))
+            elapsed = time.perf_counter() - started
+        
+        assert len(results) == 4
+        assert elapsed < 0.6
+
+    async def test_run_db_uses_database_threads(self):
+        """Test that ChromaDB calls run on the bounded database thread pool"""
+        name = await server.run_db(lambda: threading.current_thread().name)
+        
+        assert name.startswith("chromadb")
+
+
+class TestSearchCache:
+    """Tests for the search result cache"""
+
+    async def test_repeated_query_is_cached(self, hooks_collection):
+        """Test that a repeated query skips both embedding and vector search"""
+        first = await search("Extension  Lifecycle hooks")
+        second = await search("extension lifecycle HOOKS")
+        
+        assert first == second
+        hooks_collection.query.assert_called_once()
+        hooks_collection.mock_ef.assert_called_once()
+        assert server.query_cache.stats()["hits"] == 1
+
+    async def test_options_are_part_of_the_key(self, hooks_collection):
+        """Test that different n_results values are cached separately"""
+        await search("hooks")
+        await search("hooks", n_results=5)
+        
+        assert hooks_collection.query.call_count == 2
+
+    async def test_reindex_invalidates_cache(self, hooks_collection, temp_dir):
+        """Test that an index run that changes files starts a new cache generation"""
+        (temp_dir / "doc1.htm").write_text("<html><body>Document with enough length to meet the 50 character requirement.</body></html>", encoding="utf-8")
+        hooks_collection.count.return_value = 1
+        await search("hooks")
+        
+        with patch("server.DOCS_DIR", temp_dir):
+            await server.run_index()
+        await search("hooks")
+        
+        assert hooks_collection.query.call_count == 2
+        assert server.query_cache.stats()["generation"] == 1
+
+    async def test_health_reports_cache_stats(self, hooks_collection):
+        """Test that cache statistics are published through get_server_health"""
+        await search("hooks")
+        
+        health = await server.get_server_health()
+        
+        assert health["search_cache"]["misses"] == 1
+        assert "embedding_cache" in health
+
+
+class TestSemanticCache:
+    """Tests for the semantic query cache in front of search_extensions_guide"""
+
+    EMBEDDINGS = {
+        "how do I add a lifecycle hook": [1.0, 0.0],
+        "adding lifecycle hooks": [0.99, 0.14],
+        "custom buttons": [0.0, 1.0],
+    }
+
+    @pytest.fixture
+    def embed(self):
+        return lambda docs: [self.EMBEDDINGS.get(doc, [0.6, 0.8]) for doc in docs]
+
+    async def test_paraphrase_reuses_hits(self, hooks_collection):
+        """Test that a query close to a recent one skips the vector search and embeds once"""
+        first = await search("how do I add a lifecycle hook")
+        second = await search("adding lifecycle hooks")
+        
+        assert "Hook docs" in first and "Hook docs" in second
+        hooks_collection.query.assert_called_once()
+        assert hooks_collection.mock_ef.call_count == 2
+        assert server.semantic_cache.stats()["hits"] == 1
+        assert server.metrics.snapshot()["counters"]["search.semantic_cache_hits"] == 1
+
+    async def test_distant_query_misses(self, hooks_collection):
+        """Test that a query below the similarity threshold runs its own search"""
+        await search("how do I add a lifecycle hook")
+        await search("custom buttons")
+        
+        assert hooks_collection.query.call_count == 2
+
+    async def test_options_must_match(self, hooks_collection):
+        """Test that hits are only reused for the same search options"""
+        await search("how do I add a lifecycle hook")
+        await search("adding lifecycle hooks", n_results=5)
+        
+        assert hooks_collection.query.call_count == 2
+
+    async def test_identifier_query_bypasses_cache(self, hooks_collection):
+        """Test that identifier queries are not embedded for the semantic cache"""
+        with patch("server.HYBRID_SEARCH", False):
+            await search("pm_Hook_Interface")
+        
+        assert server.semantic_cache.stats()["misses"] == 0
+
+    async def test_reindex_invalidates_cache(self, hooks_collection, temp_dir):
+        """Test that an index run drops the cached query embeddings"""
+        (temp_dir / "doc1.htm").write_text("<html><body>Document with enough length to meet the 50 character requirement.</body></html>", encoding="utf-8")
+        hooks_collection.count.return_value = 1
+        await search("how do I add a lifecycle hook")
+        
+        with patch("server.DOCS_DIR", temp_dir):
+            await server.run_index()
+        await search("adding lifecycle hooks")
+        
+        assert hooks_collection.query.call_count == 2
+        assert server.semantic_cache.stats()["generation"] == 1
+
+    async def test_disabled(self, hooks_collection):
+        """Test that SEMANTIC_CACHE_MAX_ENTRIES=0 turns the cache off"""
+        with patch("server.SEMANTIC_CACHE_MAX_ENTRIES", 0):
+            await search("how do I add a lifecycle hook")
+            await search("adding lifecycle hooks")
+        
+        assert hooks_collection.query.call_count == 2
+        assert server.semantic_cache.stats()["misses"] == 0
+
+    async def test_health_reports_cache_stats(self, hooks_collection):
+        """Test that semantic cache statistics are published through get_server_health"""
+        await search("custom buttons")
+        
+        health = await server.get_server_health()
+        
+        assert health["semantic_cache"]["entries"] == 1
+        assert health["semantic_cache"]["misses"] == 1
+
+
+class TestServerResources:
+    """Tests for the process-wide ServerResources holder"""
+
+    @pytest.fixture
+    def mock_db_instance(self):
+        db_instance = MagicMock()
+        with patch("server.get_db_client", return_value=db_instance) as mock_db_client, \
+             patch("server.get_embedding_fn") as mock_embedding_fn:
+            db_instance.mock_db_client = mock_db_client
+            db_instance.mock_embedding_fn = mock_embedding_fn
+            yield db_instance
+
+    async def test_resources_are_reused_across_searches(self, mock_db_instance):
+        """Test that the client, embedding function and collection are opened once"""
+        mock_db_instance.get_collection.return_value.query.return_value = {"ids": [[]], "documents": [[]], "metadatas": [[]]}
+        
+        await search("first query")
+        await search("second query")
+        
+        mock_db_instance.mock_db_client.assert_called_once()
+        mock_db_instance.mock_embedding_fn.assert_called_once()
+        mock_db_instance.get_collection.assert_called_once()
+
+    def test_missing_collection_is_not_cached(self, mock_db_instance):
+        """Test that a failed lookup is retried on the next call"""
+        mock_db_instance.get_collection.side_effect = [ValueError("Collection does not exist"), MagicMock()]
+        
+        with pytest.raises(ValueError):
+            server.resources.corpus().collection()
+        
+        assert server.resources.corpus().collection() is not None
+        assert mock_db_instance.get_collection.call_count == 2
+
+    async def test_warm_up_success(self, mock_db_instance):
+        """Test that warm-up embeds once, queries the index and marks the server ready"""
+        mock_collection = mock_db_instance.get_collection.return_value
+        mock_collection.count.return_value = 10
+        
+        assert await server.resources.warm_up() is True
+        
+        mock_db_instance.mock_embedding_fn.return_value.assert_called_once_with(["warm-up"])
+        mock_collection.query.assert_called_once()
+        health = await server.get_server_health()
+        assert health["ready"] is True
+        assert health["documents"] == 10
+        assert health["warm_up_seconds"] is not None
+        assert health["embedding_client"]["requests"] == 1
+
+    async def test_lifespan_starts_warm_up(self):
+        """Test that the server lifespan warms up on the server's event loop when WARM_UP_ON_START is set"""
+        with patch.object(server.resources, "warm_up", AsyncMock(return_value=True)) as warm_up:
+            async with server.lifespan(server.mcp):
+                await asyncio.sleep(0)
+            with patch("server.WARM_UP_ON_START", False):
+                async with server.lifespan(server.mcp):
+                    await asyncio.sleep(0)
+
+        warm_up.assert_awaited_once()
+
+    async def test_warm_up_failure(self, mock_db_instance, capsys):
+        """Test that warm-up failures are reported through the health signal"""
+        mock_db_instance.get_collection.side_effect = ValueError("Collection does not exist")
+        
+        assert await server.resources.warm_up() is False
+        
+        health = await server.get_server_health()
+        assert health["ready"] is False
+        assert "Collection does not exist" in health["last_error"]
+        captured = capsys.readouterr()
+        assert "Warm-up failed" in captured.err
+        assert captured.out == ""
+
+    def test_reset(self, mock_db_instance):
+        """Test that reset drops the cached handles"""
+        server.resources.corpus().collection()
+        server.resources.reset()
+        server.resources.corpus().collection()
+        
+        assert mock_db_instance.get_collection.call_count == 2
+
+
+class TestEmbeddingBackends:
+    """Tests for the configurable embedding backend"""
+
+    @patch.dict(os.environ, {}, clear=True)
+    def test_onnx_backend_needs_no_api_key(self):
+        """Test that the local ONNX backend works without OPENROUTER_API_KEY"""
+        with patch("server.EMBEDDING_BACKEND", "onnx"), \
+             patch("server.LOCAL_EMBEDDING_MODEL_DIR", "/opt/models/minilm"):
+            ef = server.get_embedding_fn()
+        
+        inner = server.collection_embedding_fn(ef)
+        assert inner.name() == "onnx_mini_lm_l6_v2"
+        assert str(inner.DOWNLOAD_PATH) == "/opt/models/minilm"
+        assert ef.model_name == "onnx/all-MiniLM-L6-v2"
+
+    def test_sentence_transformers_backend(self):
+        """Test that the sentence-transformers backend uses LOCAL_EMBEDDING_MODEL"""
+        with patch("server.EMBEDDING_BACKEND", "sentence-transformers"), \
+             patch("server.LOCAL_EMBEDDING_MODEL", "my-model"), \
+             patch("chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction") as mock_st:
+            ef = server.get_embedding_fn()
+        
+        mock_st.assert_called_once_with(model_name="my-model", normalize_embeddings=True)
+        assert ef.model_name == "sentence-transformers/my-model"
+
+    def test_unknown_backend(self):
+        """Test that an unknown backend is rejected"""
+        with patch("server.EMBEDDING_BACKEND", "nope"):
+            with pytest.raises(ValueError, match="Unknown EMBEDDING_BACKEND"):
+                server.get_embedding_fn()
+
+    @pytest.fixture
+    def mock_db_instance(self):
+        db_instance = MagicMock()
+        with patch("server.get_db_client", return_value=db_instance), \
+             patch("server.get_embedding_fn"):
+            yield db_instance
+
+    def test_new_collection_records_model(self, mock_db_instance):
+        """Test that the embedding model is recorded when the collection is created"""
+        server.resources.corpus().collection(create=True)
+        
+        kwargs = mock_db_instance.get_or_create_collection.call_args.kwargs
+        assert kwargs["metadata"] == {"embedding_model": "text-embedding-3-small"}
+
+    def test_model_mismatch_is_refused(self, mock_db_instance):
+        """Test that a collection indexed with another model is not searched"""
+        mock_db_instance.get_collection.return_value.metadata = {"embedding_model": "onnx/all-MiniLM-L6-v2"}
+        
+        with pytest.raises(ValueError, match="indexed with onnx/all-MiniLM-L6-v2.*force=True"):
+            server.resources.corpus().collection()
+
+    def test_chromadb_conflict_is_refused(self, mock_db_instance):
+        """Test that ChromaDB's own embedding function conflict gets the same message"""
+        mock_db_instance.get_collection.side_effect = ValueError("Embedding function conflict: new: onnx vs persisted: openai")
+        
+        with pytest.raises(ValueError, match="indexed with a different embedding function"):
+            server.resources.corpus().collection()
+
+
 class TestServer:
     """Tests for server.py module"""
 
     @patch("server.get_db_client")
     @patch("server.get_embedding_fn")
-    def test_index_extensions_guide(self, mock_embedding_fn, mock_db_client, temp_dir):
+    async def test_index_extensions_guide(self, mock_embedding_fn, mock_db_client, temp_dir):
         """Test the index_extensions_guide tool"""
         # Create test files
         (temp_dir / "doc1.htm").write_text("""<html><body>Test content 1 with enough length to meet the 50 character requirement for indexing.</body></html>""", encoding="utf-8")
@@ -200,14 +2066,14 @@ class TestServer:
         
         # Run the indexing
         with patch("server.DOCS_DIR", temp_dir):
-            result = server.index_extensions_guide()
+            result = await server.run_index()
         
         assert "Processed 1 documentation files" in result
         mock_collection.upsert.assert_called_once()
 
     @patch("server.get_db_client")
     @patch("server.get_embedding_fn")
-    def test_index_extensions_guide_short_content(self, mock_embedding_fn, mock_db_client, temp_dir):
+    async def test_index_extensions_guide_short_content(self, mock_embedding_fn, mock_db_client, temp_dir):
         """Test that documents with content < 50 chars are not indexed"""
         # Create test files with short content
         (temp_dir / "short_doc.htm").write_text("<html><body>Short content</body></html>", encoding="utf-8")
@@ -223,14 +2089,14 @@ class TestServer:
         
         # Run the indexing
         with patch("server.DOCS_DIR", temp_dir):
-            result = server.index_extensions_guide()
+            result = await server.run_index()
         
         assert "Processed 0 documentation files" in result
         mock_collection.upsert.assert_not_called()
 
     @patch("server.get_db_client")
     @patch("server.get_embedding_fn")
-    def test_index_extensions_guide_with_exception(self, mock_embedding_fn, mock_db_client, temp_dir, capsys):
+    async def test_index_extensions_guide_with_exception(self, mock_embedding_fn, mock_db_client, temp_dir, capsys):
         """Test that index_extensions_guide handles exceptions when upserting documents"""
         # Create test file with content that will be processed
         test_content = "Test content with enough length to be processed by the indexer."
@@ -247,10 +2113,11 @@ class TestServer:
         
         # Run the indexing
         with patch("server.DOCS_DIR", temp_dir):
-            result = server.index_extensions_guide()
+            result = await server.run_index()
         
         assert "Processed 0 documentation files" in result
-        mock_collection.upsert.assert_called_once()
+        # Once in the run, once more when the failed batch is retried at the end
+        assert mock_collection.upsert.call_count == 2
         
         # Verify error message is printed
         captured = capsys.readouterr()
@@ -258,10 +2125,43 @@ class TestServer:
 
     @patch("server.get_db_client")
     @patch("server.get_embedding_fn")
-    def test_search_extensions_guide(self, mock_embedding_fn, mock_db_client):
+    async def test_index_extensions_guide_batches(self, mock_embedding_fn, mock_db_client, temp_dir):
+        """Test that documents are embedded and upserted once per batch"""
+        for i in range(3):
+            (temp_dir / f"doc{i}.htm").write_text(f"<html><body>Document {i} with enough length to meet the 50 character requirement.</body></html>", encoding="utf-8")
+        
+        mock_ef = MagicMock(side_effect=lambda docs: [[0.1, 0.2]] * len(docs))
+        mock_embedding_fn.return_value = mock_ef
+        
+        mock_collection = MagicMock()
+        mock_db_instance = MagicMock()
+        mock_db_instance.get_or_create_collection.return_value = mock_collection
+        mock_db_client.return_value = mock_db_instance
+        
+        with patch("server.DOCS_DIR", temp_dir):
+            result = await server.run_index(batch_size=2)
+        
+        assert "Processed 3 documentation files in 2 batches" in result
+        assert "parse" in result and "embed" in result and "write" in result
+        assert mock_ef.call_count == 2
+        assert mock_collection.upsert.call_count == 2
+        # Batches are written concurrently, so their order is not fixed
+        upserts = sorted((call.kwargs for call in mock_collection.upsert.call_args_list), key=lambda kwargs: len(kwargs["ids"]))
+        assert [len(kwargs["ids"]) for kwargs in upserts] == [1, 2]
+        assert upserts[1]["embeddings"] == [[0.1, 0.2]] * 2
+
+    async def test_index_extensions_guide_invalid_batch_size(self):
+        """Test that a batch size below 1 is rejected"""
+        with pytest.raises(ValueError, match="batch_size must be at least 1"):
+            await server.run_index(batch_size=0)
+
+    @patch("server.get_db_client")
+    @patch("server.get_embedding_fn")
+    async def test_search_extensions_guide(self, mock_embedding_fn, mock_db_client):
         """Test the search_extensions_guide tool"""
         # Setup mock results
         mock_results = {
+            "ids": [["test.doc#0"]],
             "documents": [["Test document content"]],
             "metadatas": [[{"title": "Test Document", "filename": "test.doc"}]]
         }
@@ -273,22 +2173,25 @@ class TestServer:
         mock_db_instance = MagicMock()
         mock_db_instance.get_collection.return_value = mock_collection
         mock_db_client.return_value = mock_db_instance
+        mock_embedding_fn.return_value.return_value = [[0.6, 0.8]]
         
-        result = server.search_extensions_guide("test query")
+        result = await search("test query")
         
         assert "Test Document" in result
         assert "Test document content" in result
+        mock_embedding_fn.return_value.assert_called_once_with(["test query"])
         mock_collection.query.assert_called_once_with(
-            query_texts=["test query"],
+            query_embeddings=[[0.6, 0.8]],
             n_results=3
         )
 
     @patch("server.get_db_client")
     @patch("server.get_embedding_fn")
-    def test_search_extensions_guide_no_results(self, mock_embedding_fn, mock_db_client):
+    async def test_search_extensions_guide_no_results(self, mock_embedding_fn, mock_db_client):
         """Test search_extensions_guide with no results"""
         # Setup mock results with no documents
         mock_results = {
+            "ids": [[]],
             "documents": [[]],
             "metadatas": [[]]
         }
@@ -301,7 +2204,7 @@ class TestServer:
         mock_db_instance.get_collection.return_value = mock_collection
         mock_db_client.return_value = mock_db_instance
         
-        result = server.search_extensions_guide("nonexistent query")
+        result = await search("nonexistent query")
         
         assert "No relevant documentation found" in result
 
@@ -313,6 +2216,23 @@ class TestServer:
         assert hasattr(ef, "__call__")
         assert ef is not None
 
+    @patch.dict(os.environ, {"OPENROUTER_API_KEY": "test-key"}, clear=True)
+    def test_get_embedding_fn_is_cached(self):
+        """Test that get_embedding_fn wraps the API client with the shared embedding cache"""
+        ef = server.get_embedding_fn()
+        
+        assert isinstance(ef, CachedEmbeddingFunction)
+        assert ef.cache is server.get_embedding_cache()
+        assert server.collection_embedding_fn(ef).name() == "openai"
+
+    @patch.dict(os.environ, {"OPENROUTER_API_KEY": "test-key"}, clear=True)
+    def test_get_embedding_fn_cache_disabled(self):
+        """Test that EMBEDDING_CACHE_MAX_ENTRIES=0 returns the bare API client"""
+        with patch("server.EMBEDDING_CACHE_MAX_ENTRIES", 0):
+            ef = server.get_embedding_fn()
+        
+        assert not isinstance(ef, CachedEmbeddingFunction)
+
     @patch.dict(os.environ, {}, clear=True)
     def test_get_embedding_fn_without_env_var(self):
         """Test get_embedding_fn without API key"""
@@ -321,7 +2241,7 @@ class TestServer:
 
     def test_get_db_client(self):
         """Test get_db_client function directly"""
-        with patch("server.chromadb.PersistentClient") as mock_persistent_client:
+        with patch("chromadb.PersistentClient") as mock_persistent_client:
             mock_instance = MagicMock()
             mock_persistent_client.return_value = mock_instance
             
@@ -0,0 +1,56 @@
+"""Tests for snippets.py module"""
+
+import pytest
+
+from snippets import GAP, snippet, split_sentences
+
+TEXT = "\n".join([
+    "Extensions add features to Plesk.",
+    "They are packaged as ZIP files. Each package has a meta.xml file.",
+    "Hooks let an extension react to Plesk events.",
+    "class Modules_Example_EventListener implements EventListener",
+    "The installer copies the files. Then it runs the post-install script.",
+])
+
+
+class TestSplitSentences:
+    """Tests for split_sentences"""
+
+    def test_lines_and_sentences(self):
+        """Test that lines are split further after sentence-ending punctuation"""
+        assert split_sentences("One. Two?\n\n  code_line()  \nThree") == ["One.", "Two?", "code_line()", "Three"]
+
+
+class TestSnippet:
+    """Tests for snippet"""
+
+    def test_text_that_fits_is_unchanged(self):
+        """Test that a short enough text is returned as is"""
+        assert snippet(TEXT, "hooks", len(TEXT)) == TEXT
+
+    def test_keeps_matching_sentences_in_reading_order(self):
+        """Test that the best matches are kept in order, with gaps marked"""
+        result = snippet(TEXT, "package meta.xml hooks", 90)
+
+        assert result == "\n".join([
+            GAP,
+            "Each package has a meta.xml file.",
+            "Hooks let an extension react to Plesk events.",
+            GAP,
+        ])
+
+    def test_rare_terms_weigh_more(self):
+        """Test that a term found in one sentence outranks one found in many"""
+        result = snippet(TEXT, "plesk installer", 40)
+
+        assert "The installer copies the files." in result
+        assert "Plesk" not in result
+
+    @pytest.mark.parametrize("max_chars", [30, 60, 100, 150, 200])
+    def test_budget_is_a_hard_cap(self, max_chars):
+        """Test that sentences and gap markers fit in max_chars"""
+        assert len(snippet(TEXT, "extension files", max_chars)) <= max_chars
+
+    def test_nothing_fits(self):
+        """Test that an empty string is returned when no sentence fits"""
+        assert snippet(TEXT, "hooks", 10) == ""
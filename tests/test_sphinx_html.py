@@ -0,0 +1,207 @@
+"""Tests for sphinx_html.py module"""
+
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+import time
+import pytest
+import sphinx_html
+
+
+def write_pages(directory, count):
+    paths = []
+    for i in range(count):
+        path = directory / f"page{i}.htm"
+        path.write_text(
+            f"<html><head><title>Page {i} — Developing Extensions for Plesk</title></head>"
+            f"<body><div itemprop=\"articleBody\"><p>Body of page {i}</p></div></body></html>",
+            encoding="utf-8",
+        )
+        paths.append(path)
+    return paths
+
+
+class TestParseFiles:
+    """Tests for parse_files function"""
+
+    def test_serial_parsing(self, tmp_path):
+        """Test that a single worker parses in-process, in input order"""
+        paths = write_pages(tmp_path, 3)
+        
+        with patch("sphinx_html.ProcessPoolExecutor") as mock_pool:
+            results = list(sphinx_html.parse_files(paths, workers=1))
+        
+        mock_pool.assert_not_called()
+        assert [r[0] for r in results] == paths
+        assert results[1][1] == "Page 1"
+        assert "Body of page 1" in results[1][2]
+
+    def test_small_batches_stay_in_process(self, tmp_path):
+        """Test that runs below PARSE_POOL_MIN_FILES do not start a pool"""
+        paths = write_pages(tmp_path, 2)
+        
+        with patch("sphinx_html.ProcessPoolExecutor") as mock_pool, \
+             patch("sphinx_html.PARSE_POOL_MIN_FILES", 10):
+            results = list(sphinx_html.parse_files(paths, workers=4))
+        
+        mock_pool.assert_not_called()
+        assert len(results) == 2
+
+    def test_process_pool_parsing(self, tmp_path):
+        """Test that a process pool returns every file exactly once"""
+        paths = write_pages(tmp_path, 6)
+        
+        with patch("sphinx_html.PARSE_POOL_MIN_FILES", 1):
+            results = list(sphinx_html.parse_files(paths, workers=2))
+        
+        assert sorted(r[0] for r in results) == sorted(paths)
+        by_path = {r[0]: r for r in results}
+        assert by_path[paths[4]][1] == "Page 4"
+        assert "Body of page 4" in by_path[paths[4]][2]
+
+
+    def test_closing_early_drops_queued_files(self, tmp_path):
+        """Test that a closed generator returns at once instead of parsing every queued file"""
+        paths = [tmp_path / f"page{i}.htm" for i in range(400)]
+        parsed = []
+
+        def slow_parser(path):
+            time.sleep(0.02)
+            parsed.append(path)
+            return "Title", []
+
+        # Threads stand in for processes, so the parser need not be picklable
+        with patch("sphinx_html.ProcessPoolExecutor", lambda max_workers, mp_context: ThreadPoolExecutor(max_workers)), \
+             patch("sphinx_html.PARSE_POOL_MIN_FILES", 1):
+            results = sphinx_html.parse_files(paths, workers=2, parser=slow_parser)
+            next(results)
+            started = time.perf_counter()
+            results.close()
+            elapsed = time.perf_counter() - started
+
+        assert elapsed < 1.0
+        time.sleep(0.1)
+        assert len(parsed) <= 2 * sphinx_html.PARSE_QUEUE_PER_WORKER + 2
+
+
+class TestParserBackend:
+    """Tests for the configurable BeautifulSoup parser backend"""
+
+    def test_lxml_backend(self, tmp_path):
+        """Test that the lxml backend extracts the same content"""
+        pytest.importorskip("lxml")
+        (path,) = write_pages(tmp_path, 1)
+        
+        with patch("sphinx_html.HTML_PARSER", "lxml"):
+            title, content = sphinx_html.parse_sphinx_html(path)
+        
+        assert title == "Page 0"
+        assert content == "Body of page 0"
+
+    def test_html_parser_backend(self, tmp_path):
+        """Test that the pure-Python backend is always available"""
+        (path,) = write_pages(tmp_path, 1)
+        
+        with patch("sphinx_html.HTML_PARSER", "html.parser"):
+            title, content = sphinx_html.parse_sphinx_html(path)
+        
+        assert title == "Page 0"
+        assert content == "Body of page 0"
+
+
+SECTIONED_PAGE = """
+<html>
+    <head><title>Hooks — Developing Extensions for Plesk</title></head>
+    <body>
+        <div itemprop="articleBody">
+            <div class="section" id="hooks">
+                <h1>Hooks<a class="headerlink" href="#hooks">¶</a></h1>
+                <p>Hooks let extensions react to Plesk events.</p>
+                <div class="section" id="registering-hooks">
+                    <h2>Registering Hooks<a class="headerlink" href="#registering-hooks">¶</a></h2>
+                    <p>Put the hook class into plib/hooks.</p>
+                </div>
+                <section id="hook-list">
+                    <h2>Hook List</h2>
+                    <p>pm_Hook_Interface is the base class.</p>
+                </section>
+            </div>
+        </div>
+    </body>
+</html>
+"""
+
+
+class TestParseSections:
+    """Tests for parse_sphinx_sections function"""
+
+    def test_sections_are_split(self, tmp_path):
+        """Test that nested Sphinx sections become separate sections with anchors"""
+        path = tmp_path / "hooks.htm"
+        path.write_text(SECTIONED_PAGE, encoding="utf-8")
+        
+        title, sections = sphinx_html.parse_sphinx_sections(path)
+        
+        assert title == "Hooks"
+        assert [(s["heading"], s["anchor"]) for s in sections] == [
+            ("Hooks", "hooks"),
+            ("Registering Hooks", "registering-hooks"),
+            ("Hook List", "hook-list"),
+        ]
+        assert "react to Plesk events" in sections[0]["text"]
+        assert "plib/hooks" not in sections[0]["text"]
+        assert "plib/hooks" in sections[1]["text"]
+        assert "¶" not in "".join(s["text"] for s in sections)
+
+    def test_page_without_sections(self, tmp_path):
+        """Test that a page without sections becomes a single section"""
+        (path,) = write_pages(tmp_path, 1)
+        
+        title, sections = sphinx_html.parse_sphinx_sections(path)
+        
+        assert sections == [{"heading": "Page 0", "anchor": "", "text": "Body of page 0"}]
+
+    def test_unreadable_file(self, tmp_path):
+        """Test that parse errors yield no sections"""
+        title, sections = sphinx_html.parse_sphinx_sections(tmp_path / "missing.htm")
+        
+        assert title == "Untitled"
+        assert sections == []
+
+
+class TestChunking:
+    """Tests for chunk_text and chunk_sections functions"""
+
+    def test_short_text_is_one_chunk(self):
+        """Test that text under the budget is returned unchanged"""
+        assert sphinx_html.chunk_text("one\ntwo", chunk_tokens=100, overlap_tokens=10) == ["one\ntwo"]
+
+    def test_chunks_respect_budget_and_overlap(self):
+        """Test that long text is split with overlapping lines"""
+        lines = [f"line {i:02d} " + "x" * 30 for i in range(20)]  # ~11 tokens each
+        
+        chunks = sphinx_html.chunk_text("\n".join(lines), chunk_tokens=50, overlap_tokens=12)
+        
+        assert len(chunks) > 1
+        for chunk in chunks:
+            assert sphinx_html.estimate_tokens(chunk) <= 60
+        # The last line of each chunk starts the next one
+        for previous, following in zip(chunks, chunks[1:]):
+            assert following.split("\n")[0] == previous.split("\n")[-1]
+        assert "line 19" in chunks[-1]
+
+    def test_long_line_is_split(self):
+        """Test that a single line longer than a chunk is split by characters"""
+        chunks = sphinx_html.chunk_text("y" * 1000, chunk_tokens=100, overlap_tokens=0)
+        
+        assert [len(chunk) for chunk in chunks] == [400, 400, 200]
+
+    def test_chunk_sections_keeps_section_identity(self):
+        """Test that every chunk carries its section heading and anchor"""
+        sections = [{"heading": "A", "anchor": "a", "text": "alpha"}, {"heading": "B", "anchor": "b", "text": "beta"}]
+        
+        chunks = list(sphinx_html.chunk_sections(sections))
+        
+        assert chunks == [
+            {"heading": "A", "anchor": "a", "text": "alpha"},
+            {"heading": "B", "anchor": "b", "text": "beta"},
+        ]